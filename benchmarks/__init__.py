@@ -0,0 +1 @@
+"""Бенчмарки Task Manager. Запуск из корня репозитория: python -m benchmarks.<имя>."""
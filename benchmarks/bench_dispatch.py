@@ -0,0 +1,80 @@
+"""
+Пропускная способность ReminderDispatcher против локального фейкового бота.
+
+FakeBot имитирует сетевую задержку Telegram и его лимиты (глобальный и на чат):
+при превышении отвечает RetryAfter, как настоящий Bot API.
+
+    python -m benchmarks.bench_dispatch --reminders 600 --chats 400
+"""
+import asyncio
+import os
+import random
+import time
+from collections import defaultdict, deque, namedtuple
+from datetime import datetime, timedelta, timezone
+
+from telegram.error import RetryAfter
+
+# Токен нужен только для импорта модуля reminders, сеть не используется
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "000000:bench")
+
+from reminders import ReminderDispatcher
+from benchmarks.common import base_parser, summarize
+
+Reminder = namedtuple("Reminder", "id user_id title deadline")
+
+
+class FakeBot:
+    """Имитация telegram.Bot.send_message с задержкой и лимитами."""
+
+    def __init__(self, latency=(0.03, 0.08), global_rate=30, per_chat_interval=1.0, rng=None):
+        self.latency = latency
+        self.global_rate = global_rate
+        self.per_chat_interval = per_chat_interval
+        self.rng = rng or random.Random(42)
+        self.recent = deque()
+        self.last_by_chat = {}
+        self.delivered = defaultdict(int)
+        self.latencies = []
+        self.retry_after = 0
+
+    async def send_message(self, chat_id, text):
+        started = time.perf_counter()
+        now = time.monotonic()
+        while self.recent and now - self.recent[0] > 1.0:
+            self.recent.popleft()
+        last = self.last_by_chat.get(chat_id)
+        if len(self.recent) >= self.global_rate or (last is not None and now - last < self.per_chat_interval):
+            self.retry_after += 1
+            raise RetryAfter(1)
+        self.recent.append(now)
+        self.last_by_chat[chat_id] = now
+        await asyncio.sleep(self.rng.uniform(*self.latency))
+        self.delivered[chat_id] += 1
+        self.latencies.append(time.perf_counter() - started)
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    deadline = datetime.now(timezone.utc) + timedelta(minutes=30)
+    reminders = [Reminder(i, rng.randint(1, args.chats), f"Задача {i}", deadline) for i in range(args.reminders)]
+
+    bot = FakeBot(global_rate=args.global_rate, rng=rng)
+    dispatcher = ReminderDispatcher(bot, concurrency=args.concurrency, global_rate=args.global_rate)
+    started = time.perf_counter()
+    sent = await dispatcher.dispatch(reminders)
+    elapsed = time.perf_counter() - started
+
+    duplicates = sum(bot.delivered.values()) - len(set(sent))
+    print(f"Отправлено {len(sent)}/{len(reminders)} за {elapsed:.2f}s, "
+          f"{len(sent) / elapsed:.1f} msg/s, RetryAfter: {bot.retry_after}, дубликатов: {duplicates}")
+    summarize("send_message latency", bot.latencies, elapsed)
+
+
+if __name__ == "__main__":
+    parser = base_parser(__doc__)
+    parser.add_argument("--reminders", type=int, default=600)
+    parser.add_argument("--chats", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--global-rate", type=float, default=30)
+    asyncio.run(run(parser.parse_args()))
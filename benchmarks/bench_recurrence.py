@@ -0,0 +1,72 @@
+"""
+Повторяющиеся задачи: правило с развёртыванием вхождений при чтении против
+копий задачи на каждый день (как пользователи делали до recurrence).
+
+У каждого из --users пользователей --rules ежедневных задач на --days дней
+вперёд. Замеряются число строк в tasks и выдача задач одного дня
+(crud.get_tasks_page с date), как у GET /tasks?date=...
+
+    python -m benchmarks.bench_recurrence --users 100 --rules 10 --days 365 --queries 500
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, insert, select
+
+from crud import get_tasks_page
+from models import Task
+from benchmarks.common import base_parser, make_session_factory, summarize
+
+
+async def seed(factory, users: int, rules: int, days: int, start: datetime, copies: bool, chunk: int = 10000):
+    rows = []
+    for user_id in range(1, users + 1):
+        for rule in range(rules):
+            deadline = start + timedelta(hours=rule % 12 + 8)
+            base = {"title": f"Задача {rule}", "priority": "Medium", "reminder": False, "completed": False,
+                    "user_id": user_id}
+            if copies:
+                rows.extend({**base, "deadline": deadline + timedelta(days=day)} for day in range(days))
+            else:
+                rows.append({**base, "deadline": deadline, "recurrence": "daily", "recurrence_interval": 1,
+                             "recurrence_until": deadline + timedelta(days=days - 1)})
+    async with factory() as db:
+        for offset in range(0, len(rows), chunk):
+            await db.execute(insert(Task), rows[offset:offset + chunk])
+            await db.commit()
+        return await db.scalar(select(func.count()).select_from(Task))
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    queries = [(rng.randint(1, args.users), (start + timedelta(days=rng.randrange(args.days))).date())
+               for _ in range(args.queries)]
+    for name, copies in (("копии по дням", True), ("правила", False)):
+        engine, factory = await make_session_factory(args.url)
+        rows = await seed(factory, args.users, args.rules, args.days, start, copies)
+        samples = []
+        found = 0
+        started = time.perf_counter()
+        async with factory() as db:
+            for user_id, day in queries:
+                t = time.perf_counter()
+                tasks, _ = await get_tasks_page(db, user_id=user_id, date=day, columns=(Task.id, Task.deadline))
+                samples.append(time.perf_counter() - t)
+                found += len(tasks)
+        summarize(f"день, {name}", samples, time.perf_counter() - started)
+        print(f"{'':<32} строк в tasks: {rows}, найдено: {found}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = base_parser(__doc__)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rules", type=int, default=10)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--queries", type=int, default=500)
+    logging.disable(logging.INFO)
+    asyncio.run(run(parser.parse_args()))
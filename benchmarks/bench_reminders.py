@@ -0,0 +1,73 @@
+"""
+Стоимость одного тика проверки напоминаний.
+
+Сравнивает прежнюю схему (список пользователей с напоминаниями и все задачи
+каждого из них с фильтрацией в Python) с одним запросом get_due_reminders по индексу
+idx_remind_at, и замеряет атомарный захват claim_due_reminders.
+
+    python -m benchmarks.bench_reminders --tasks 1000000 --users 100000
+"""
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from crud import get_due_reminders, claim_due_reminders
+from models import Task
+from benchmarks.common import base_parser, make_session_factory, seed_tasks, summarize
+
+WINDOW = timedelta(hours=1)
+
+
+async def legacy_tick(db):
+    """Прежний алгоритм проверки напоминаний без отправки сообщений."""
+    now = datetime.now(timezone.utc)
+    due = []
+    users = (await db.scalars(select(Task.user_id).distinct().where(Task.reminder == True))).all()
+    for user_id in users:
+        for task in (await db.scalars(select(Task).where(Task.user_id == user_id))).all():
+            if task.reminder and task.deadline and not task.completed:
+                deadline = task.deadline.replace(tzinfo=timezone.utc) if task.deadline.tzinfo is None else task.deadline
+                if 0 < (deadline - now).total_seconds() <= WINDOW.total_seconds():
+                    due.append(task.id)
+    return due
+
+
+async def set_based_tick(db):
+    return [row.id for row in await get_due_reminders(db)]
+
+
+async def run(args):
+    engine, factory = await make_session_factory(args.url)
+    await seed_tasks(factory, users=args.users, tasks=args.tasks, rng=random.Random(args.seed))
+
+    variants = [("set-based", set_based_tick)]
+    if not args.skip_legacy:
+        variants.insert(0, ("legacy per-user loop", legacy_tick))
+
+    due_ids = []
+    for name, tick in variants:
+        samples = []
+        for _ in range(args.ticks):
+            async with factory() as db:
+                started = time.perf_counter()
+                due_ids = await tick(db)
+                samples.append(time.perf_counter() - started)
+        summarize(f"{name} ({len(due_ids)} due)", samples)
+
+    async with factory() as db:
+        started = time.perf_counter()
+        claimed = await claim_due_reminders(db)
+        print(f"claim_due_reminders: {len(claimed)} строк за {(time.perf_counter() - started) * 1000:.2f}ms")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = base_parser(__doc__)
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--skip-legacy", action="store_true", help="не измерять прежний алгоритм")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,90 @@
+"""
+Одинаковые одновременные чтения через API: сколько запросов доходит до
+базы с объединением (singleflight.SingleFlight) и без него.
+
+Клиенты волнами по --concurrency запросов читают одну и ту же страницу
+GET /tasks?user_id=...&limit=... (как вкладки и повторы фронтенда).
+Кэш списков и ограничение частоты выключены, чтобы считался только
+эффект объединения.
+
+    python -m benchmarks.bench_singleflight --waves 50 --concurrency 32
+"""
+import argparse
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import time
+
+from sqlalchemy import event
+
+from benchmarks.common import base_parser, make_session_factory, seed_tasks, summarize
+
+
+async def measure(args) -> int:
+    """Один режим в отдельном процессе: SINGLE_FLIGHT читается при импорте main."""
+    # Модули приложения читают настройки из окружения при импорте
+    os.environ["DATABASE_URL"] = args.url
+    os.environ["REMINDER_MODE"] = "off"
+    os.environ["TASK_CACHE_BACKEND"] = "off"
+    os.environ["RATE_LIMIT_BACKEND"] = "off"
+    import httpx
+    import main as app_module
+    from database import engine as app_engine
+
+    selects = [0]
+    event.listen(app_engine.sync_engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *rest: selects.__setitem__(0, selects[0] + statement.startswith("SELECT")))
+    samples = []
+    async with app_module.lifespan(app_module.app):
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            selects[0] = 0
+            started = time.perf_counter()
+            for wave in range(args.waves):
+                params = {"user_id": 1 + wave % args.users, "limit": args.limit}
+
+                async def read():
+                    t = time.perf_counter()
+                    response = await client.get("/tasks", params=params)
+                    response.raise_for_status()
+                    samples.append(time.perf_counter() - t)
+
+                await asyncio.gather(*(read() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+    name = "с объединением" if app_module.single_flight is not None else "без объединения"
+    summarize(name, samples, elapsed)
+    print(f"{'':<32} SELECT в базу: {selects[0]}")
+    await app_engine.dispose()
+    return 0
+
+
+async def prepare(args):
+    engine, factory = await make_session_factory(args.url)
+    await seed_tasks(factory, users=args.users, tasks=args.tasks)
+    await engine.dispose()
+
+
+def main(args) -> int:
+    asyncio.run(prepare(args))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for enabled in ("false", "true"):
+        env = dict(os.environ, SINGLE_FLIGHT=enabled, PYTHONPATH=root)
+        child = [sys.executable, "-m", "benchmarks.bench_singleflight", "--child"] + sys.argv[1:]
+        if subprocess.run(child, env=env).returncode != 0:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = base_parser(__doc__)
+    parser.add_argument("--waves", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--tasks", type=int, default=20000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    sys.exit(asyncio.run(measure(args)) if args.child else main(args))
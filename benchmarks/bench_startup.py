@@ -0,0 +1,107 @@
+"""
+Холодный старт воркера API: время импорта main и время до первого ответа
+(импорт + lifespan + первый запрос), с бюджетом для проверки регрессий.
+
+Каждый замер — отдельный процесс Python, поэтому кэш импортов не влияет
+на результат. Схема готовится один раз через init_db (migrations.migrate),
+как при деплое; воркер на старте только проверяет версию схемы. Для
+сравнения отдельно замеряется прежний шаг старта — create_all с отражением
+схемы.
+
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --import-budget-ms 1000 --first-request-budget-ms 1500
+"""
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.common import base_parser
+
+CHILD_CODE = """
+import asyncio, json, sys, time
+# Клиент нужен только замеру, воркер uvicorn его не импортирует
+import httpx
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def first_request():
+    async with main.lifespan(main.app):
+        ready = time.perf_counter()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+            response = await client.get("/tasks", params={"user_id": 1})
+            response.raise_for_status()
+        return ready, time.perf_counter()
+
+ready, answered = asyncio.run(first_request())
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - imported) * 1000,
+    "first_request_ms": (answered - started) * 1000,
+    "telegram_loaded": "telegram" in sys.modules,
+    "apscheduler_loaded": "apscheduler" in sys.modules,
+}))
+"""
+
+
+def run_child(env: dict) -> dict:
+    output = subprocess.run([sys.executable, "-c", CHILD_CODE], env=env, capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr.strip().splitlines()[-1] if output.stderr else "процесс завершился с ошибкой")
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+async def prepare_schema(url: str) -> float:
+    """Готовит схему как init_db и возвращает время прежнего шага старта (create_all) в мс."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from migrations import migrate
+    from models import Base
+
+    engine = create_async_engine(url)
+    await migrate(engine)
+    started = time.perf_counter()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    elapsed = (time.perf_counter() - started) * 1000
+    await engine.dispose()
+    return elapsed
+
+
+def main(args) -> int:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, DATABASE_URL=args.url, REMINDER_MODE="off", PYTHONPATH=root)
+    # Воркер API без токена Telegram должен стартовать
+    env.pop("TELEGRAM_BOT_TOKEN", None)
+    create_all_ms = asyncio.run(prepare_schema(args.url))
+
+    samples = [run_child(env) for _ in range(args.runs)]
+    import_ms = statistics.median(s["import_ms"] for s in samples)
+    startup_ms = statistics.median(s["startup_ms"] for s in samples)
+    first_ms = statistics.median(s["first_request_ms"] for s in samples)
+    loaded = [name for name in ("telegram", "apscheduler") if any(s[f"{name}_loaded"] for s in samples)]
+
+    print(f"Медиана по {args.runs} запускам:")
+    print(f"  импорт main:               {import_ms:8.1f} мс (бюджет {args.import_budget_ms:.0f})")
+    print(f"  lifespan (проверка схемы): {startup_ms:8.1f} мс (create_all на старте занимал бы {create_all_ms:.1f})")
+    print(f"  до первого ответа:         {first_ms:8.1f} мс (бюджет {args.first_request_budget_ms:.0f})")
+    print(f"  загружены telegram/apscheduler: {', '.join(loaded) if loaded else 'нет'}")
+    ok = import_ms <= args.import_budget_ms and first_ms <= args.first_request_budget_ms and not loaded
+    print("OK" if ok else "Бюджет старта превышен")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = base_parser(__doc__)
+    parser.set_defaults(url="sqlite+aiosqlite:///startup.db")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float, default=1200)
+    parser.add_argument("--first-request-budget-ms", type=float, default=1500)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    raise SystemExit(main(args))
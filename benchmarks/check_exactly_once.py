@@ -0,0 +1,103 @@
+"""
+Проверка, что при нескольких воркерах напоминаний каждое отправляется ровно один раз.
+
+Запускает --workers отдельных процессов, которые одновременно крутят
+reminders.deliver_reminders против одной базы (SQLite-файл или Postgres
+через --url) с локальным FakeBot, и сверяет отправленные id.
+
+    python -m benchmarks.check_exactly_once --workers 4 --reminders 500
+
+SQLite игнорирует SKIP LOCKED, поэтому значимый результат — только на Postgres.
+Тот же захват на Postgres в составе тестов: pytest -m postgres (tests/test_exactly_once.py).
+"""
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert
+
+from benchmarks.common import base_parser, make_session_factory
+
+
+async def seed_due(url: str, reminders: int, users: int, rng: random.Random):
+    engine, factory = await make_session_factory(url)
+    # Импорт внутри функции: models не должен тянуть database до установки DATABASE_URL
+    from models import Task
+    now = datetime.now(timezone.utc)
+    deadlines = [now + timedelta(minutes=rng.randint(1, 59)) for _ in range(reminders)]
+    rows = [{
+        "title": f"Задача {i}",
+        "deadline": deadline,
+        "priority": "Medium",
+        "reminder": True,
+        "completed": False,
+        "user_id": rng.randint(1, users),
+        "remind_at": deadline - timedelta(hours=1),
+    } for i, deadline in enumerate(deadlines)]
+    async with factory() as db:
+        await db.execute(insert(Task), rows)
+        await db.commit()
+    await engine.dispose()
+
+
+def worker(url: str, ticks: int, start_at: float, results):
+    os.environ["DATABASE_URL"] = url
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "000000:bench")
+    os.environ["TELEGRAM_PER_CHAT_INTERVAL"] = "0"
+    # Маленькие пачки, чтобы воркеры захватывали напоминания вперемешку
+    os.environ["REMINDER_BATCH_SIZE"] = "20"
+
+    async def run():
+        import reminders
+        from benchmarks.bench_dispatch import FakeBot
+        from database import get_db_context
+        bot = FakeBot(latency=(0.001, 0.005), global_rate=10_000, per_chat_interval=0)
+        await asyncio.sleep(max(0.0, start_at - time.time()))
+        sent = []
+        for _ in range(ticks):
+            async with get_db_context() as db:
+                sent.extend(await reminders.deliver_reminders(db, sender=bot))
+        results.put((os.getpid(), sent, sum(bot.delivered.values())))
+
+    asyncio.run(run())
+
+
+def main(args):
+    asyncio.run(seed_due(args.url, args.reminders, args.users, random.Random(args.seed)))
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    start_at = time.time() + 3
+    processes = [ctx.Process(target=worker, args=(args.url, args.ticks, start_at, results))
+                 for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    collected = [results.get(timeout=args.timeout) for _ in processes]
+    for process in processes:
+        process.join()
+
+    all_sent = [task_id for _, sent, _ in collected for task_id in sent]
+    messages = sum(delivered for _, _, delivered in collected)
+    for pid, sent, delivered in collected:
+        print(f"воркер {pid}: отправлено {len(sent)}")
+    duplicates = len(all_sent) - len(set(all_sent))
+    print(f"Всего напоминаний: {args.reminders}, отправлено: {len(set(all_sent))}, "
+          f"сообщений: {messages}, дубликатов: {duplicates}")
+    ok = duplicates == 0 and messages == len(all_sent) == args.reminders
+    print("OK" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = base_parser(__doc__)
+    parser.set_defaults(url="sqlite+aiosqlite:///bench.db")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--reminders", type=int, default=500)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--ticks", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120, help="сколько ждать каждого воркера, с")
+    sys.exit(main(parser.parse_args()))
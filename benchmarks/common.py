@@ -0,0 +1,110 @@
+"""
+Общие утилиты бенчмарков: отдельный движок БД, генерация синтетических данных
+и подсчёт перцентилей.
+
+По умолчанию используется локальный файл SQLite (нужен пакет aiosqlite),
+для Postgres передайте --url postgresql+asyncpg://...
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from migrations import create_schema
+from models import Base, Task
+
+DEFAULT_URL = "sqlite+aiosqlite:///bench.db"
+PRIORITIES = ("High", "Medium", "Low")
+
+
+def base_parser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--url", default=DEFAULT_URL, help="URL тестовой базы данных")
+    parser.add_argument("--seed", type=int, default=42, help="seed генератора случайных чисел")
+    return parser
+
+
+async def make_session_factory(url: str, drop_all: bool = True):
+    """Создаёт движок и фабрику сессий для тестовой базы, пересоздавая схему."""
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        if drop_all:
+            await conn.run_sync(Base.metadata.drop_all)
+        # Схема последней версии с записью версии, которая нужна проверке при старте приложения
+        await create_schema(conn)
+    factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False,
+                           autocommit=False, autoflush=False)
+    return engine, factory
+
+
+async def seed_tasks(factory, users: int, tasks: int, spread: timedelta = timedelta(days=30),
+                     reminder_share: float = 0.3, completed_share: float = 0.2,
+                     chunk: int = 10000, rng: random.Random = None):
+    """
+    Заполняет таблицу tasks синтетическими задачами.
+
+    Дедлайны равномерно распределены в интервале [now - spread, now + spread].
+    Вставка идёт пачками по chunk строк через executemany.
+    """
+    rng = rng or random.Random(42)
+    now = datetime.now(timezone.utc)
+    seconds = int(spread.total_seconds())
+    started = time.perf_counter()
+    async with factory() as db:
+        for offset in range(0, tasks, chunk):
+            rows = []
+            for i in range(offset, min(offset + chunk, tasks)):
+                created = now - timedelta(seconds=rng.randint(0, seconds))
+                deadline = now + timedelta(seconds=rng.randint(-seconds, seconds))
+                reminder = rng.random() < reminder_share
+                completed = rng.random() < completed_share
+                rows.append({
+                    "title": f"Задача {i}",
+                    "description": None,
+                    "deadline": deadline,
+                    "priority": rng.choice(PRIORITIES),
+                    "reminder": reminder,
+                    "completed": completed,
+                    "created_at": created,
+                    "updated_at": created,
+                    "user_id": rng.randint(1, users),
+                    # Как crud.compute_remind_at при настройках по умолчанию (за 60 минут)
+                    "remind_at": deadline - timedelta(hours=1) if reminder and not completed else None,
+                })
+            await db.execute(insert(Task), rows)
+            await db.commit()
+    elapsed = time.perf_counter() - started
+    print(f"Сгенерировано {tasks} задач для {users} пользователей за {elapsed:.1f}s")
+
+
+def percentile(samples, q: float) -> float:
+    """Перцентиль q (0..100) методом ближайшего ранга."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(name: str, samples, total_seconds: float = None) -> dict:
+    """Печатает и возвращает сводку по выборке длительностей (в секундах)."""
+    summary = {
+        "name": name,
+        "count": len(samples),
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "max_ms": max(samples) * 1000 if samples else 0.0,
+    }
+    if total_seconds:
+        summary["per_sec"] = len(samples) / total_seconds
+    line = (f"{name:<32} n={summary['count']:<7} p50={summary['p50_ms']:.2f}ms "
+            f"p95={summary['p95_ms']:.2f}ms p99={summary['p99_ms']:.2f}ms max={summary['max_ms']:.2f}ms")
+    if "per_sec" in summary:
+        line += f" {summary['per_sec']:.0f}/s"
+    print(line)
+    return summary
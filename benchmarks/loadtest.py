@@ -0,0 +1,242 @@
+"""
+Нагрузочный тест API и движка напоминаний с отчётом для сравнения между коммитами.
+
+Схема БД создаётся через init_db, затем генерируется синтетический набор
+пользователей и задач с дедлайнами, распределёнными во времени. Смешанный
+поток запросов подаётся на приложение FastAPI в том же процессе (по умолчанию)
+или на запущенный локально uvicorn (--base-url). Отдельно замеряются тики
+напоминаний с локальным FakeBot.
+
+    python -m benchmarks.loadtest --users 1000 --tasks 100000 --requests 5000 --output report.json
+    python -m benchmarks.loadtest --compare report.json --output new.json
+
+База задаётся через --url (по умолчанию SQLite-файл bench.db) и должна быть
+той же, что у сервера, если используется --base-url.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from benchmarks.common import DEFAULT_URL, percentile
+
+# Сколько запросов каждого вида в смеси (веса)
+DEFAULT_MIX = {
+    "list_day": 40,
+    "list_all": 10,
+    "list_page": 15,
+    "create": 15,
+    "update": 15,
+    "delete": 5,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=DEFAULT_URL, help="URL базы данных")
+    parser.add_argument("--base-url", default=None, help="адрес запущенного сервера вместо приложения в процессе")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--tasks", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--reminder-ticks", type=int, default=5)
+    parser.add_argument("--mix", default=None, help='веса запросов в JSON, например {"list_day": 80, "create": 20}')
+    parser.add_argument("--no-seed", action="store_true", help="использовать уже заполненную базу")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="куда записать отчёт в JSON")
+    parser.add_argument("--compare", default=None, help="отчёт предыдущего прогона для сравнения")
+    return parser.parse_args()
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+async def seed(args):
+    from database import async_session
+    from init_db import init_db
+    from benchmarks.common import seed_tasks
+
+    if not await init_db(drop_all=True):
+        raise RuntimeError("Не удалось инициализировать базу данных")
+    await seed_tasks(async_session, users=args.users, tasks=args.tasks, rng=random.Random(args.seed))
+
+
+class Traffic:
+    """Генератор смешанного потока запросов со сбором задержек по видам."""
+
+    def __init__(self, client, args, rng: random.Random):
+        self.client = client
+        self.users = args.users
+        self.rng = rng
+        mix = json.loads(args.mix) if args.mix else DEFAULT_MIX
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.samples = {kind: [] for kind in self.kinds}
+        self.errors = {kind: 0 for kind in self.kinds}
+        self.created = []
+
+    def _day(self) -> str:
+        return (date.today() + timedelta(days=self.rng.randint(-30, 30))).isoformat()
+
+    async def _request(self, kind: str):
+        user_id = self.rng.randint(1, self.users)
+        if kind == "list_day":
+            return await self.client.get("/tasks", params={"user_id": user_id, "date": self._day()})
+        if kind == "list_all":
+            return await self.client.get("/tasks", params={"user_id": user_id})
+        if kind == "list_page":
+            return await self.client.get("/tasks", params={"user_id": user_id, "limit": 50, "order": "desc"})
+        if kind == "create":
+            deadline = datetime.now(timezone.utc) + timedelta(minutes=self.rng.randint(-60 * 24, 60 * 24 * 30))
+            response = await self.client.post("/tasks", params={"user_id": user_id}, json={
+                "title": f"Нагрузка {self.rng.getrandbits(48):x}",
+                "deadline": deadline.isoformat(),
+                "reminder": self.rng.random() < 0.3,
+            })
+            if response.status_code == 200:
+                self.created.append((user_id, response.json()["id"]))
+            return response
+        if kind in ("update", "delete") and self.created:
+            user_id, task_id = self.created.pop(self.rng.randrange(len(self.created))) if kind == "delete" \
+                else self.rng.choice(self.created)
+            if kind == "update":
+                return await self.client.patch(f"/tasks/{task_id}", params={"user_id": user_id},
+                                               json={"completed": self.rng.random() < 0.5})
+            return await self.client.delete(f"/tasks/{task_id}", params={"user_id": user_id})
+        # Пока нечего обновлять или удалять — читаем
+        return await self.client.get("/tasks", params={"user_id": user_id, "date": self._day()})
+
+    async def worker(self, budget: list):
+        while budget:
+            budget.pop()
+            kind = self.rng.choices(self.kinds, self.weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await self._request(kind)
+                # 404 при гонке update/delete одной и той же задачи ошибкой сервера не считаем
+                ok = response.status_code < 500
+            except Exception:
+                ok = False
+            self.samples[kind].append(time.perf_counter() - started)
+            if not ok:
+                self.errors[kind] += 1
+
+    async def run(self, total: int, concurrency: int) -> float:
+        budget = list(range(total))
+        started = time.perf_counter()
+        await asyncio.gather(*(self.worker(budget) for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+
+def latency_summary(samples, elapsed: float = None, errors: int = 0) -> dict:
+    summary = {
+        "count": len(samples),
+        "errors": errors,
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
+    if elapsed:
+        summary["per_sec"] = round(len(samples) / elapsed, 1)
+    return summary
+
+
+async def run_traffic(args, rng) -> dict:
+    import httpx
+
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=30)
+    else:
+        from main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=30)
+    async with client:
+        traffic = Traffic(client, args, rng)
+        elapsed = await traffic.run(args.requests, args.concurrency)
+    all_samples = [s for samples in traffic.samples.values() for s in samples]
+    report = {"total": latency_summary(all_samples, elapsed, sum(traffic.errors.values()))}
+    for kind, samples in traffic.samples.items():
+        report[kind] = latency_summary(samples, elapsed, traffic.errors[kind])
+    return report
+
+
+async def run_reminder_ticks(args) -> dict:
+    from crud import get_due_reminders
+    from database import async_session
+    from benchmarks.bench_dispatch import FakeBot
+    import reminders
+
+    scan = []
+    for _ in range(args.reminder_ticks):
+        async with async_session() as db:
+            started = time.perf_counter()
+            due = await get_due_reminders(db)
+            scan.append(time.perf_counter() - started)
+    bot = FakeBot(latency=(0.001, 0.002), global_rate=10_000, per_chat_interval=0)
+    async with async_session() as db:
+        started = time.perf_counter()
+        sent = await reminders.deliver_reminders(db, sender=bot)
+        deliver = time.perf_counter() - started
+    return {
+        "due": len(due),
+        "scan": latency_summary(scan),
+        "deliver_ms": round(deliver * 1000, 3),
+        "sent": len(sent),
+    }
+
+
+def print_report(report: dict, baseline: dict = None):
+    print(f"\nКоммит {report['revision']}, {report['dataset']['tasks']} задач / {report['dataset']['users']} пользователей")
+    print(f"{'сценарий':<12}{'n':>8}{'ошибки':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>10}")
+    for kind, row in report["http"].items():
+        line = (f"{kind:<12}{row['count']:>8}{row['errors']:>8}{row['p50_ms']:>10.2f}"
+                f"{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}{row.get('per_sec', 0):>10.1f}")
+        old = (baseline or {}).get("http", {}).get(kind)
+        if old and old.get("p95_ms"):
+            line += f"   p95 {100 * (row['p95_ms'] - old['p95_ms']) / old['p95_ms']:+.1f}% к {baseline['revision']}"
+        print(line)
+    ticks = report["reminders"]
+    print(f"напоминания: к отправке {ticks['due']}, скан p50 {ticks['scan']['p50_ms']:.2f}ms "
+          f"p99 {ticks['scan']['p99_ms']:.2f}ms, доставка {ticks['deliver_ms']:.1f}ms ({ticks['sent']} шт.)")
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    if not args.no_seed:
+        await seed(args)
+    report = {
+        "revision": git_revision(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "dataset": {"users": args.users, "tasks": args.tasks, "url": args.url.split("://")[0]},
+        "http": await run_traffic(args, rng),
+        "reminders": await run_reminder_ticks(args),
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Отчёт записан в {args.output}")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # Модули приложения читают настройки из окружения при импорте
+    os.environ["DATABASE_URL"] = args.url
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "000000:bench")
+    os.environ.setdefault("REMINDER_MODE", "off")
+    # Построчные INFO-логи crud искажают замеры
+    logging.disable(logging.INFO)
+    sys.exit(asyncio.run(main(args)))
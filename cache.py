@@ -0,0 +1,344 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Awaitable, Callable, Iterable, List, Optional
+import serialization
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Сколько хранится счётчик поколений пользователя в общем кэше, секунд
+GENERATION_TTL = 24 * 3600
+
+class LRUTTLBackend:
+    """
+    Внутрипроцессный кэш: LRU с ограничением по числу записей и TTL.
+
+    Дополнительно хранит индекс ключей по пользователю, чтобы можно было
+    сбросить все записи одного пользователя.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._user_keys = {}
+        self._generations = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    async def generation(self, user_id: int) -> int:
+        return self._generations.get(user_id, 0)
+
+    async def bump_generation(self, user_id: int):
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    async def get(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, _, value = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value, user_id: int):
+        self._data[key] = (time.monotonic() + self.ttl, user_id, value)
+        self._data.move_to_end(key)
+        self._user_keys.setdefault(user_id, set()).add(key)
+        while len(self._data) > self.max_entries:
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    async def delete(self, keys: Iterable[str]) -> int:
+        return sum(1 for key in list(keys) if self._remove(key))
+
+    async def keys_for_user(self, user_id: int) -> List[str]:
+        return list(self._user_keys.get(user_id, ()))
+
+    def _remove(self, key: str) -> bool:
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return False
+        keys = self._user_keys.get(entry[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[entry[1]]
+        return True
+
+class InMemoryStore:
+    """
+    Локальная замена Redis для SharedBackend в тестах и бенчмарках: поддерживает
+    то подмножество команд (get/set с ex/delete/incr/sadd/smembers/expire),
+    которое использует кэш.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._sets = {}
+        self._expires = {}
+
+    def _alive(self, name: str) -> bool:
+        expires_at = self._expires.get(name)
+        if expires_at is not None and expires_at < time.monotonic():
+            self._values.pop(name, None)
+            self._sets.pop(name, None)
+            self._expires.pop(name, None)
+            return False
+        return True
+
+    async def get(self, name: str):
+        return self._values.get(name) if self._alive(name) else None
+
+    async def set(self, name: str, value, ex: Optional[int] = None):
+        self._values[name] = value
+        if ex is not None:
+            self._expires[name] = time.monotonic() + ex
+        return True
+
+    async def delete(self, *names: str) -> int:
+        removed = 0
+        for name in names:
+            if self._values.pop(name, None) is not None or self._sets.pop(name, None) is not None:
+                removed += 1
+            self._expires.pop(name, None)
+        return removed
+
+    async def incr(self, name: str) -> int:
+        value = int(await self.get(name) or 0) + 1
+        self._values[name] = value
+        return value
+
+    async def sadd(self, name: str, *values) -> int:
+        self._alive(name)
+        members = self._sets.setdefault(name, set())
+        before = len(members)
+        members.update(values)
+        return len(members) - before
+
+    async def smembers(self, name: str):
+        return set(self._sets.get(name, ())) if self._alive(name) else set()
+
+    async def expire(self, name: str, seconds: int) -> bool:
+        self._expires[name] = time.monotonic() + seconds
+        return True
+
+class SharedBackend:
+    """
+    Общий для всех процессов кэш поверх Redis-совместимого клиента
+    (redis.asyncio.Redis или InMemoryStore). Значения хранятся в JSON.
+    """
+
+    def __init__(self, client, ttl: int = 60, prefix: str = "taskcache"):
+        self.client = client
+        self.ttl = int(ttl)
+        self.prefix = prefix
+        self.evictions = 0  # Вытеснение выполняет сам Redis, здесь не отслеживается
+
+    def _index(self, user_id: int) -> str:
+        return f"{self.prefix}:user:{user_id}"
+
+    def _generation(self, user_id: int) -> str:
+        return f"{self.prefix}:gen:{user_id}"
+
+    async def generation(self, user_id: int) -> int:
+        return int(await self.client.get(self._generation(user_id)) or 0)
+
+    async def bump_generation(self, user_id: int):
+        name = self._generation(user_id)
+        await self.client.incr(name)
+        # Загрузка списка идёт намного меньше суток, поэтому счётчик можно не хранить вечно
+        await self.client.expire(name, GENERATION_TTL)
+
+    async def get(self, key: str):
+        raw = await self.client.get(f"{self.prefix}:{key}")
+        return serialization.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value, user_id: int):
+        await self.client.set(f"{self.prefix}:{key}", serialization.dumps(value), ex=self.ttl)
+        index = self._index(user_id)
+        await self.client.sadd(index, key)
+        await self.client.expire(index, self.ttl)
+
+    async def delete(self, keys: Iterable[str]) -> int:
+        names = [f"{self.prefix}:{key}" for key in keys]
+        return await self.client.delete(*names) if names else 0
+
+    async def keys_for_user(self, user_id: int) -> List[str]:
+        members = await self.client.smembers(self._index(user_id))
+        return [m.decode() if isinstance(m, bytes) else m for m in members]
+
+def _deadline_day(value: Optional[datetime]) -> Optional[date]:
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+class TaskCache:
+    """
+    Кэш списков задач по ключу (user_id, date) с инвалидацией при записи.
+
+    loader(db, user_id, date) загружает список при промахе. Метод invalidate
+    подписывается на изменения задач в crud и сбрасывает только затронутые
+    ключи: полный список пользователя и дни старого и нового дедлайна.
+    День считается в часовом поясе пользователя, которого кэш не знает,
+    поэтому сбрасываются день дедлайна по UTC и соседние с ним.
+    Если прежний дедлайн неизвестен, сбрасываются все ключи пользователя.
+
+    Чтение могло загрузить список до записи, а положить его в кэш уже после
+    инвалидации. Поэтому у пользователя есть счётчик поколений: инвалидация
+    увеличивает его до удаления ключей, а get_tasks кладёт список в кэш,
+    только если поколение за время загрузки не изменилось.
+    """
+
+    def __init__(self, backend, loader: Callable[..., Awaitable[list]]):
+        self.backend = backend
+        self.loader = loader
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(user_id: int, day: Optional[date]) -> str:
+        return f"{user_id}:{day.isoformat() if day else 'all'}"
+
+    async def get_tasks(self, db, user_id: int, day: Optional[date] = None) -> list:
+        key = self.key(user_id, day)
+        try:
+            cached = await self.backend.get(key)
+        except Exception as e:
+            logger.error(f"Ошибка чтения кэша задач {key}: {str(e)}")
+            cached = None
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        try:
+            generation = await self.backend.generation(user_id)
+        except Exception as e:
+            logger.error(f"Ошибка чтения поколения кэша задач user_id={user_id}: {str(e)}")
+            generation = None
+        tasks = await self.loader(db, user_id, day)
+        if generation is None:
+            return tasks
+        try:
+            if await self.backend.generation(user_id) == generation:
+                await self.backend.set(key, tasks, user_id)
+                # В общем кэше инвалидация могла пройти между проверкой и записью
+                if await self.backend.generation(user_id) != generation:
+                    await self.backend.delete([key])
+        except Exception as e:
+            logger.error(f"Ошибка записи кэша задач {key}: {str(e)}")
+        return tasks
+
+    async def invalidate(self, event: str, task, previous: Optional[dict] = None):
+        """Подписчик crud: сбрасывает ключи, затронутые изменением задачи."""
+        user_id = task.user_id
+        deadlines = [task.deadline]
+        if previous is not None and "deadline" in previous:
+            deadlines.append(previous["deadline"])
+        days = set()
+        for day in filter(None, map(_deadline_day, deadlines)):
+            # Локальный день отличается от дня по UTC не больше чем на сутки
+            days.update((day - timedelta(days=1), day, day + timedelta(days=1)))
+        try:
+            await self.backend.bump_generation(user_id)
+            if event == "updated" and previous is None or getattr(task, "recurrence", None) is not None:
+                # Прежние значения неизвестны — задача могла уйти с любого дня;
+                # повторяющаяся задача есть сразу во многих днях
+                keys = await self.backend.keys_for_user(user_id)
+            else:
+                keys = [self.key(user_id, None)] + [self.key(user_id, day) for day in days if day]
+            self.invalidations += await self.backend.delete(keys)
+        except Exception as e:
+            logger.error(f"Ошибка инвалидации кэша задач user_id={user_id}: {str(e)}")
+
+    async def invalidate_user(self, user_id: int):
+        """Сбрасывает все ключи пользователя (например, при смене часового пояса)."""
+        try:
+            await self.backend.bump_generation(user_id)
+            self.invalidations += await self.backend.delete(await self.backend.keys_for_user(user_id))
+        except Exception as e:
+            logger.error(f"Ошибка инвалидации кэша задач user_id={user_id}: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.backend.evictions,
+            "invalidations": self.invalidations,
+            "size": len(self.backend) if hasattr(self.backend, "__len__") else None,
+        }
+
+class SettingsCache:
+    """
+    Кэш настроек пользователей в памяти процесса, чтобы запрос по дню
+    не добавлял SELECT к user_settings.
+
+    loader(db, user_id) возвращает словарь настроек (для пользователей без
+    записи — значения по умолчанию, они тоже кэшируются). Изменение в этом
+    процессе сбрасывает запись сразу через invalidate; изменения из других
+    процессов видны не позже чем через ttl секунд.
+    """
+
+    def __init__(self, loader: Callable[..., Awaitable[dict]], ttl: float = 60, max_entries: int = 10000):
+        self.loader = loader
+        self.backend = LRUTTLBackend(max_entries=max_entries, ttl=ttl)
+
+    async def get(self, db, user_id: int) -> dict:
+        settings = await self.backend.get(str(user_id))
+        if settings is None:
+            settings = await self.loader(db, user_id)
+            await self.backend.set(str(user_id), settings, user_id)
+        return settings
+
+    async def invalidate(self, user_id: int, settings=None, previous=None):
+        """Подписчик crud на изменение настроек."""
+        await self.backend.delete([str(user_id)])
+
+def create_task_cache(loader: Callable[..., Awaitable[list]], workers: int = 1) -> Optional[TaskCache]:
+    """
+    Создаёт кэш по переменным окружения.
+
+    TASK_CACHE_BACKEND: memory, shared или off. Кэш memory сбрасывается
+    только записями своего процесса, поэтому по умолчанию он включён лишь
+    при одном воркере (workers); при нескольких по умолчанию кэш выключен.
+    Для shared нужны REDIS_URL и пакет redis.
+
+    Raises:
+        ValueError: shared без REDIS_URL
+        ImportError: shared без пакета redis
+    """
+    backend_name = os.environ.get("TASK_CACHE_BACKEND", "memory" if workers <= 1 else "off")
+    ttl = float(os.environ.get("TASK_CACHE_TTL", "60"))
+    if backend_name == "off":
+        logger.info("Кэш задач отключён")
+        return None
+    if backend_name == "shared":
+        redis_url = os.environ.get("REDIS_URL")
+        if not redis_url:
+            logger.error("TASK_CACHE_BACKEND=shared требует REDIS_URL")
+            raise ValueError("TASK_CACHE_BACKEND=shared требует REDIS_URL")
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            logger.error("TASK_CACHE_BACKEND=shared требует пакет redis")
+            raise
+        backend = SharedBackend(redis.from_url(redis_url), ttl=ttl)
+    else:
+        if workers > 1:
+            logger.warning(f"Кэш задач в памяти при {workers} воркерах: записи других воркеров "
+                           f"видны только через TASK_CACHE_TTL")
+        backend = LRUTTLBackend(max_entries=int(os.environ.get("TASK_CACHE_SIZE", "10000")), ttl=ttl)
+    logger.info(f"Кэш задач: {type(backend).__name__}, TTL {ttl:.0f}s")
+    return TaskCache(backend, loader)
@@ -1,84 +1,730 @@
-from typing import Optional, List
+from typing import NamedTuple, Optional, List, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import and_, func
-from models import Task
+from sqlalchemy import or_, func, update, insert, delete, tuple_, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import Task, TaskOccurrence, TaskTombstone, UserSettings
 from datetime import datetime, date, timedelta, timezone
+import base64
+from collections import namedtuple
+import inspect
+import json
 import logging
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import recurrence
+from serialization import as_utc
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def get_active_users(db: AsyncSession) -> List[int]:
+# Верхняя граница UserSettings.reminder_time. remind_at не раньше deadline - MAX_REMINDER_LEAD,
+# поэтому для задач с дедлайном в будущем это же и нижняя граница диапазона remind_at в запросах
+MAX_REMINDER_LEAD = timedelta(days=7)
+# Нижняя граница UserSettings.reminder_time в минутах. При 0 remind_at совпал бы с deadline,
+# а напоминание захватывается, только пока deadline > now, — оно не отправилось бы никогда
+MIN_REMINDER_TIME = 1
+
+# Поля правила повторения задачи; у обычной задачи все None
+RECURRENCE_FIELDS = ("recurrence", "recurrence_interval", "recurrence_until")
+# Поля, от которых зависит remind_at
+REMIND_AT_FIELDS = {"deadline", "reminder", "completed", *RECURRENCE_FIELDS}
+
+def task_rule(task) -> tuple:
+    """(recurrence, recurrence_interval, recurrence_until) задачи, строки или словаря с этими полями."""
+    if isinstance(task, dict):
+        return tuple(task.get(name) for name in RECURRENCE_FIELDS)
+    return tuple(getattr(task, name, None) for name in RECURRENCE_FIELDS)
+
+def compute_remind_at(deadline: Optional[datetime], reminder: bool, completed: bool,
+                      settings: dict, rule: Optional[tuple] = None, now: Optional[datetime] = None,
+                      done=()) -> Optional[datetime]:
+    """
+    Момент напоминания (deadline - reminder_time) или None, если напоминать не нужно.
+
+    У повторяющейся задачи (rule из task_rule) — момент напоминания о
+    ближайшем вхождении после now, кроме выполненных вхождений done.
+    """
+    if not reminder or completed or deadline is None or not settings["reminder_enabled"]:
+        return None
+    lead = timedelta(minutes=settings["reminder_time"])
+    if rule is None or rule[0] is None:
+        return as_utc(deadline) - lead
+    occurrence = recurrence.next_occurrence(deadline, *rule, after=now or datetime.now(timezone.utc),
+                                            tz=settings["timezone"], skip=done)
+    return occurrence - lead if occurrence is not None else None
+
+def _parse_recurrence(values: dict) -> dict:
+    """Проверяет поля правила повторения в values и разбирает recurrence_until (изменяет values)."""
+    if values.get("recurrence") is not None and values["recurrence"] not in recurrence.FREQUENCIES:
+        raise ValueError(f"Неизвестное правило повторения: {values['recurrence']}")
+    interval = values.get("recurrence_interval")
+    if interval is not None and (isinstance(interval, bool) or not isinstance(interval, int) or interval < 1):
+        raise ValueError(f"Неверный интервал повторения: {interval}")
+    if isinstance(values.get("recurrence_until"), str):
+        values["recurrence_until"] = parse_deadline(values["recurrence_until"])
+    return values
+
+def _remind_at_changed(task, expected: Optional[datetime]) -> bool:
+    current = task.remind_at
+    if current is None or expected is None:
+        return current is not expected
+    return as_utc(current) != expected
+
+def _known_remind_at(values: dict):
+    """
+    remind_at, если он следует из самих новых значений (задача выполнена или
+    напоминание выключено), иначе Ellipsis — тогда он пересчитывается по строке.
+    """
+    if values.get("completed") is True or values.get("reminder") is False:
+        return None
+    return ...
+
+# Подписчики на изменения задач: callback(event, task, previous=None), где event — "created",
+# "updated" или "deleted", а previous — прежние значения изменённых полей (если известны).
+# Подписчик может быть корутиной — тогда запись дожидается его завершения
+_task_listeners = []
+
+def add_task_listener(callback):
+    if callback not in _task_listeners:
+        _task_listeners.append(callback)
+
+def remove_task_listener(callback):
+    if callback in _task_listeners:
+        _task_listeners.remove(callback)
+
+async def _notify(event: str, task, previous: Optional[dict] = None):
+    for callback in _task_listeners:
+        try:
+            result = callback(event, task, previous=previous)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error(f"Ошибка в подписчике на изменения задач ({event}, id={task.id}): {str(e)}")
+
+async def get_due_reminders(db: AsyncSession, horizon: timedelta = timedelta(0),
+                            now: Optional[datetime] = None, task_ids: Optional[List[int]] = None):
+    """
+    Возвращает задачи, напоминание по которым наступает не позже now + horizon.
+
+    Момент напоминания хранится в remind_at (deadline минус время из настроек
+    пользователя), поэтому запрос — диапазон по индексу idx_remind_at.
+    Нижняя граница now - MAX_REMINDER_LEAD следует из условия deadline > now
+    и отсекает старые неотправленные записи. У повторяющейся задачи deadline —
+    начало серии, а remind_at относится к ближайшему вхождению, поэтому
+    условие на deadline к ней не применяется. Возвращаются только нужные для
+    отправки столбцы, без загрузки ORM-объектов.
+
+    Args:
+        db (AsyncSession): Сессия базы данных
+        horizon (timedelta): Насколько вперёд от now брать напоминания (0 — только наступившие)
+        now (datetime): Текущее время в UTC (по умолчанию — datetime.now)
+        task_ids (List[int]): Ограничить выборку этими задачами
+    """
     try:
-        query = select(Task.user_id).distinct().where(Task.reminder == True)
+        now = now or datetime.now(timezone.utc)
+        query = select(Task.id, Task.user_id, Task.title, Task.deadline, Task.remind_at).where(
+            Task.remind_at > now - MAX_REMINDER_LEAD,
+            Task.remind_at <= now + horizon,
+            or_(Task.deadline > now, Task.recurrence.isnot(None))
+        ).order_by(Task.remind_at)
+        if task_ids is not None:
+            query = query.where(Task.id.in_(task_ids))
         result = await db.execute(query)
-        return [row[0] for row in result.fetchall() if row[0] is not None]
+        return result.all()
     except Exception as e:
-        logger.error(f"Ошибка при получении списка пользователей: {str(e)}")
+        logger.error(f"Ошибка при получении задач для напоминаний: {str(e)}")
         raise
 
-async def get_tasks(db: AsyncSession, user_id: int, date: Optional[date] = None):
+# Все колонки задачи: напоминания захватываются и возвращаются строками, а не ORM-объектами,
+# чтобы подписчики на изменения получили свежие значения, а не копию из identity map сессии
+TASK_COLUMNS = tuple(Task.__table__.columns)
+TaskRow = namedtuple("TaskRow", [column.key for column in TASK_COLUMNS])
+
+class ClaimedReminder(NamedTuple):
+    id: int
+    user_id: int
+    title: str
+    deadline: datetime
+
+async def claim_due_reminders(db: AsyncSession, now: Optional[datetime] = None,
+                              task_ids: Optional[List[int]] = None, limit: Optional[int] = None):
+    """
+    Атомарно захватывает наступившие напоминания и снимает с них reminder и remind_at.
+
+    Один UPDATE ... RETURNING над подзапросом с FOR UPDATE SKIP LOCKED: строку
+    может захватить только один процесс, поэтому при нескольких воркерах каждое
+    напоминание отправляется ровно один раз. Неотправленные напоминания нужно
+    вернуть через release_reminders. limit ограничивает размер пачки.
+
+    Повторяющимся задачам в той же транзакции назначается напоминание о
+    следующем вхождении (_advance_recurring), а в результат они попадают
+    с deadline текущего вхождения. Если отправка не удалась, это вхождение
+    пропускается: release_reminders возвращает только разовые напоминания.
+
+    После коммита подписчики получают событие "updated" по каждой задаче.
+
+    Returns:
+        Строки с полями id, user_id, title, deadline
+    """
     try:
-        query = select(Task).where(Task.user_id == user_id)
+        now = now or datetime.now(timezone.utc)
+        due = select(Task.id).where(
+            Task.remind_at > now - MAX_REMINDER_LEAD,
+            Task.remind_at <= now,
+            or_(Task.deadline > now, Task.recurrence.isnot(None))
+        )
+        if task_ids is not None:
+            due = due.where(Task.id.in_(task_ids))
+        if limit is not None:
+            due = due.order_by(Task.remind_at).limit(limit)
+        stmt = (
+            update(Task)
+            .where(Task.id.in_(due.with_for_update(skip_locked=True).scalar_subquery()))
+            .values(reminder=False, remind_at=None)
+            .returning(*TASK_COLUMNS)
+            .execution_options(synchronize_session=False)
+        )
+        result = await db.execute(stmt)
+        claimed = changed = result.all()
+        if any(row.recurrence is not None for row in claimed):
+            claimed, changed = await _advance_recurring(db, claimed, now)
+        await db.commit()
+    except Exception as e:
+        logger.error(f"Ошибка при захвате напоминаний: {str(e)}")
+        await db.rollback()
+        raise
+    for row in changed:
+        await _notify("updated", row, previous={})
+    return claimed
+
+async def _settings_for_users(db: AsyncSession, user_ids) -> dict:
+    """Настройки нескольких пользователей одним запросом: {user_id: настройки}."""
+    rows = (await db.execute(
+        select(UserSettings.user_id, *(getattr(UserSettings, name) for name in SETTINGS_FIELDS))
+        .where(UserSettings.user_id.in_(set(user_ids)))
+    )).all()
+    settings = {user_id: dict(DEFAULT_SETTINGS) for user_id in user_ids}
+    for user_id, *values in rows:
+        settings[user_id] = {name: (value if value is not None else DEFAULT_SETTINGS[name])
+                             for name, value in zip(SETTINGS_FIELDS, values)}
+    return settings
+
+async def _completed_occurrences(db: AsyncSession, task_ids, since: datetime) -> dict:
+    """Выполненные вхождения задач не раньше since: {task_id: {вхождение, ...}}."""
+    rows = (await db.execute(
+        select(TaskOccurrence.task_id, TaskOccurrence.occurrence).where(
+            TaskOccurrence.task_id.in_(list(task_ids)),
+            TaskOccurrence.occurrence >= since,
+            TaskOccurrence.completed == True
+        )
+    )).all()
+    done = {}
+    for task_id, occurrence in rows:
+        done.setdefault(task_id, set()).add(as_utc(occurrence))
+    return done
+
+async def _advance_recurring(db: AsyncSession, claimed, now: datetime) -> list:
+    """
+    Захваченные напоминания повторяющихся задач: вычисляет вхождение, о котором
+    пора напомнить (последнее, чей момент напоминания наступил), и назначает
+    remind_at следующего невыполненного вхождения. Уже прошедшие и выполненные
+    вхождения не отправляются. Коммит — за вызывающим.
+
+    Returns:
+        Кортеж (строки для отправки, у повторяющихся задач deadline — время
+        вхождения; строки всех задач с новыми reminder и remind_at)
+    """
+    recurring = [row for row in claimed if row.recurrence is not None]
+    settings = await _settings_for_users(db, {row.user_id for row in recurring})
+    done = await _completed_occurrences(db, [row.id for row in recurring], now - MAX_REMINDER_LEAD)
+    due, advanced, changed = [], [], []
+    for row in claimed:
+        if row.recurrence is None:
+            due.append(row)
+            changed.append(row)
+            continue
+        user_settings = settings[row.user_id]
+        lead = timedelta(minutes=user_settings["reminder_time"])
+        occurrence = recurrence.last_occurrence(row.deadline, *task_rule(row), moment=now + lead,
+                                                tz=user_settings["timezone"])
+        skip = done.get(row.id, set())
+        if occurrence is not None and occurrence > now and occurrence not in skip:
+            due.append(ClaimedReminder(row.id, row.user_id, row.title, occurrence))
+        else:
+            logger.info(f"Вхождение {occurrence} задачи {row.id} прошло или выполнено, напоминание пропущено")
+        remind_at = compute_remind_at(row.deadline, True, False, user_settings, rule=task_rule(row),
+                                      now=max(occurrence or now, now), done=skip)
+        values = {"reminder": remind_at is not None, "remind_at": remind_at}
+        advanced.append({"id": row.id, **values})
+        changed.append(TaskRow(**{**row._asdict(), **values}))
+    await db.execute(update(Task), advanced)
+    return due, changed
+
+async def release_reminders(db: AsyncSession, task_ids: List[int]) -> List[int]:
+    """
+    Возвращает флаг reminder задачам, напоминания по которым не удалось отправить;
+    remind_at ставится на текущий момент, чтобы следующий проход повторил отправку.
+    После коммита подписчики получают событие "updated" по каждой задаче.
+
+    Returns:
+        List[int]: id задач, которым флаг возвращён
+    """
+    if not task_ids:
+        return []
+    try:
+        stmt = (
+            update(Task)
+            .where(Task.id.in_(task_ids), Task.completed == False, Task.remind_at.is_(None))
+            .values(reminder=True, remind_at=datetime.now(timezone.utc))
+            .returning(*TASK_COLUMNS)
+            .execution_options(synchronize_session=False)
+        )
+        released = (await db.execute(stmt)).all()
+        await db.commit()
+    except Exception as e:
+        logger.error(f"Ошибка при возврате напоминаний: {str(e)}")
+        await db.rollback()
+        raise
+    for row in released:
+        await _notify("updated", row, previous={})
+    return [row.id for row in released]
+
+def parse_timezone(name: Optional[str]) -> ZoneInfo:
+    """Часовой пояс IANA по имени (None — UTC)."""
+    try:
+        return ZoneInfo(name or "UTC")
+    except (ZoneInfoNotFoundError, ValueError) as e:
+        logger.error(f"Неизвестный часовой пояс: {name}, ошибка: {str(e)}")
+        raise ValueError(f"Неизвестный часовой пояс: {name}")
+
+def _day_bounds(day: date, tz: Optional[str] = None):
+    """
+    Начало дня day и начало следующего дня в часовом поясе tz, переведённые в UTC.
+
+    Границы считаются отдельно, поэтому дни перехода на летнее время
+    (23 или 25 часов) тоже правильные. Фильтр по ним остаётся диапазоном
+    по deadline и обслуживается индексом idx_user_deadline.
+    """
+    zone = parse_timezone(tz)
+    start_of_day = datetime.combine(day, datetime.min.time(), tzinfo=zone)
+    end_of_day = datetime.combine(day + timedelta(days=1), datetime.min.time(), tzinfo=zone)
+    return start_of_day.astimezone(timezone.utc), end_of_day.astimezone(timezone.utc)
+
+async def _expand_occurrences(db: AsyncSession, user_id: int, range_start: datetime, range_end: datetime,
+                              tz: Optional[str] = None, priority: Optional[str] = None) -> list:
+    """
+    Вхождения повторяющихся задач пользователя в [range_start, range_end).
+
+    Вхождения не хранятся: правила выбираются одним запросом по
+    idx_user_recurrence и разворачиваются в Python, а из task_occurrences
+    читаются только отметки о выполнении вхождений этого диапазона.
+
+    Returns:
+        Список (строка задачи, время вхождения, выполнено ли вхождение)
+    """
+    # Строками, а не ORM-объектами: identity map сессии не получает копий задач
+    query = select(*TASK_COLUMNS).where(
+        Task.user_id == user_id,
+        Task.recurrence.isnot(None),
+        Task.deadline < range_end,
+        or_(Task.recurrence_until.is_(None), Task.recurrence_until >= range_start)
+    )
+    if priority:
+        query = query.where(Task.priority == priority)
+    rules = (await db.execute(query)).all()
+    if not rules:
+        return []
+    overrides = {}
+    rows = await db.execute(
+        select(TaskOccurrence.task_id, TaskOccurrence.occurrence, TaskOccurrence.completed).where(
+            TaskOccurrence.task_id.in_([task.id for task in rules]),
+            TaskOccurrence.occurrence >= range_start,
+            TaskOccurrence.occurrence < range_end
+        )
+    )
+    for task_id, occurrence, completed in rows:
+        overrides[task_id, as_utc(occurrence)] = completed
+    expanded = []
+    for task in rules:
+        for occurrence in recurrence.occurrences_between(task.deadline, *task_rule(task), range_start=range_start,
+                                                         range_end=range_end, tz=tz):
+            expanded.append((task, occurrence, overrides.get((task.id, occurrence), task.completed)))
+    return expanded
+
+def _occurrence_rows(expanded: list, columns: Optional[tuple]) -> list:
+    """
+    Вхождения в виде строк выдачи: с deadline и completed вхождения. Без
+    columns — несохраняемые объекты Task (в сессию они не добавляются).
+    """
+    if columns:
+        row_type = namedtuple("OccurrenceRow", [column.key for column in columns])
+    rows = []
+    for task, occurrence, completed in expanded:
+        if task.deadline.tzinfo is None:
+            # Дедлайн вхождения в том же виде, что у сохранённых строк (SQLite
+            # возвращает naive UTC): иначе в выдаче и курсоре смешаются оба формата
+            occurrence = occurrence.astimezone(timezone.utc).replace(tzinfo=None)
+        values = {column.key: getattr(task, column.key) for column in TASK_COLUMNS}
+        values.update(deadline=occurrence, completed=completed)
+        if columns:
+            rows.append(row_type(*(values[column.key] for column in columns)))
+        else:
+            rows.append(Task(**values))
+    return rows
+
+# Допустимые ключи сортировки для постраничной выдачи; второй ключ — всегда id
+SORT_COLUMNS = {
+    "deadline": Task.deadline,
+    "created_at": Task.created_at,
+}
+
+def encode_cursor(sort_value: Optional[datetime], task_id: int) -> str:
+    payload = [sort_value.isoformat() if sort_value is not None else None, task_id]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, task_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (datetime.fromisoformat(sort_value) if sort_value is not None else None), int(task_id)
+    except (ValueError, TypeError) as e:
+        logger.error(f"Неверный курсор: {cursor}, ошибка: {str(e)}")
+        raise ValueError(f"Неверный курсор: {cursor}")
+
+async def get_tasks_page(db: AsyncSession, user_id: int, limit: Optional[int] = None,
+                         cursor: Optional[str] = None, sort: str = "deadline", order: str = "asc",
+                         date: Optional[date] = None, completed: Optional[bool] = None,
+                         priority: Optional[str] = None, deadline_from: Optional[datetime] = None,
+                         deadline_to: Optional[datetime] = None, columns: Optional[tuple] = None,
+                         tz: Optional[str] = None):
+    """
+    Постраничная (keyset) выдача задач пользователя с фильтрами и сортировкой.
+
+    Страница задаётся курсором (значение ключа сортировки, id) последней
+    выданной задачи, поэтому стоимость запроса не зависит от номера страницы.
+    Сортировка по deadline обслуживается индексом idx_user_deadline,
+    по created_at — idx_user_created. Задачи без дедлайна идут в конце.
+
+    Если при сортировке по deadline диапазон ограничен с обеих сторон (date
+    или deadline_from и deadline_to), повторяющиеся задачи выдаются
+    вхождениями в этом диапазоне (_expand_occurrences) — id у вхождений
+    общий, а deadline и completed свои. Без диапазона повторяющаяся задача
+    выдаётся одной строкой с дедлайном первого вхождения.
+
+    Args:
+        limit (int): Размер страницы; None — вернуть все задачи
+        cursor (str): Курсор из предыдущей страницы
+        sort (str): "deadline" или "created_at"
+        order (str): "asc" или "desc"
+        date (date): Только задачи с дедлайном в этот день по часовому поясу tz
+        tz (str): Часовой пояс пользователя для date и вхождений повторяющихся задач (по умолчанию UTC)
+        deadline_from (datetime): Дедлайн не раньше (включительно)
+        deadline_to (datetime): Дедлайн раньше (не включительно)
+        columns (tuple): Выбрать только эти колонки Task и вернуть строки вместо
+            ORM-объектов (без identity map); должны включать id и поле сортировки
+
+    Returns:
+        Кортеж (задачи, курсор следующей страницы или None)
+    """
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"Неверное поле сортировки: {sort}")
+    if order not in ("asc", "desc"):
+        raise ValueError(f"Неверный порядок сортировки: {order}")
+    try:
+        column = SORT_COLUMNS[sort]
+        query = (select(*columns) if columns else select(Task)).where(Task.user_id == user_id)
+        range_start = range_end = None
         if date:
-            start_of_day = datetime.combine(date, datetime.min.time()).replace(tzinfo=timezone.utc)
-            end_of_day = start_of_day + timedelta(days=1)
-            query = query.where(
-                and_(
-                    Task.deadline >= start_of_day,
-                    Task.deadline < end_of_day
-                )
-            )
+            start_of_day, end_of_day = _day_bounds(date, tz)
+            query = query.where(Task.deadline >= start_of_day, Task.deadline < end_of_day)
+            range_start, range_end = start_of_day, end_of_day
+        if deadline_from and deadline_to:
+            range_start = max(filter(None, (range_start, as_utc(deadline_from))))
+            range_end = min(filter(None, (range_end, as_utc(deadline_to))))
+        expand = sort == "deadline" and range_start is not None
+        if expand:
+            query = query.where(Task.recurrence.is_(None))
+        if deadline_from:
+            query = query.where(Task.deadline >= deadline_from)
+        if deadline_to:
+            query = query.where(Task.deadline < deadline_to)
+        if completed is not None:
+            query = query.where(Task.completed == completed)
+        if priority:
+            query = query.where(Task.priority == priority)
+
+        if cursor:
+            sort_value, last_id = decode_cursor(cursor)
+            newer = (lambda a, b: a > b) if order == "asc" else (lambda a, b: a < b)
+            if sort_value is None:
+                # Курсор уже в хвосте задач без дедлайна
+                query = query.where(column.is_(None), newer(Task.id, last_id))
+            else:
+                query = query.where(or_(
+                    newer(tuple_(column, Task.id), tuple_(sort_value, last_id)),
+                    column.is_(None)
+                ))
+
+        if order == "asc":
+            query = query.order_by(column.asc().nulls_last(), Task.id.asc())
+        else:
+            query = query.order_by(column.desc().nulls_last(), Task.id.desc())
+        if limit is not None:
+            query = query.limit(limit + 1)
+
         result = await db.execute(query)
-        return result.scalars().all()
+        tasks = result.all() if columns else result.scalars().all()
+        if expand and range_start < range_end:
+            expanded = [item for item in await _expand_occurrences(db, user_id, range_start, range_end, tz, priority)
+                        if completed is None or item[2] == completed]
+            if cursor:
+                if sort_value is None:
+                    expanded = []
+                else:
+                    position = (as_utc(sort_value), last_id)
+                    expanded = [item for item in expanded
+                                if newer((item[1], item[0].id), position)]
+            if expanded:
+                tasks = sorted(list(tasks) + _occurrence_rows(expanded, columns),
+                               key=lambda task: (as_utc(task.deadline), task.id), reverse=order == "desc")
+                if limit is not None:
+                    tasks = tasks[:limit + 1]
+        next_cursor = None
+        if limit is not None and len(tasks) > limit:
+            tasks = tasks[:limit]
+            last = tasks[-1]
+            next_cursor = encode_cursor(getattr(last, sort), last.id)
+        return tasks, next_cursor
+    except ValueError:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка при получении страницы задач для user_id={user_id}: {str(e)}")
+        raise
+
+# Запас на расхождение часов серверов и долгие транзакции: изменения последних секунд
+# отдаются повторно, чтобы запись с более ранним updated_at, закоммиченная позже, не потерялась
+SYNC_CLOCK_SKEW = timedelta(seconds=5)
+# Сколько хранятся записи об удалении; клиент с более старым курсором получает полный список
+TOMBSTONE_RETENTION = timedelta(days=30)
+_SYNC_START = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def encode_sync_cursor(tasks_position: Tuple[datetime, int], deleted_position: Tuple[datetime, int]) -> str:
+    payload = {
+        "t": [tasks_position[0].isoformat(), tasks_position[1]],
+        "d": [deleted_position[0].isoformat(), deleted_position[1]],
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+def decode_sync_cursor(cursor: str) -> Tuple[Tuple[datetime, int], Tuple[datetime, int]]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return tuple(
+            (as_utc(datetime.fromisoformat(payload[key][0])), int(payload[key][1])) for key in ("t", "d")
+        )
+    except (ValueError, TypeError, KeyError, IndexError) as e:
+        logger.error(f"Неверный курсор синхронизации: {cursor}, ошибка: {str(e)}")
+        raise ValueError(f"Неверный курсор: {cursor}")
+
+async def stream_task_rows(db: AsyncSession, user_id: int, columns: tuple, chunk: int = 1000):
+    """
+    Все задачи пользователя пачками строк через серверный курсор (yield_per).
+
+    Выбираются только колонки columns, без ORM-объектов, поэтому память
+    ограничена размером пачки независимо от числа задач. Порядок — по
+    created_at (индекс idx_user_created).
+
+    Yields:
+        list: Пачка строк до chunk штук
+    """
+    query = (
+        select(*columns)
+        .where(Task.user_id == user_id)
+        .order_by(Task.created_at)
+        .execution_options(yield_per=chunk)
+    )
+    try:
+        result = await db.stream(query)
+        async for partition in result.partitions():
+            yield partition
+    except Exception as e:
+        logger.error(f"Ошибка при выгрузке задач для user_id={user_id}: {str(e)}")
+        raise
+
+async def get_task_changes(db: AsyncSession, user_id: int, since: Optional[str] = None,
+                           limit: int = 500, now: Optional[datetime] = None) -> dict:
+    """
+    Изменения задач пользователя после курсора since.
+
+    Курсор хранит две позиции (updated_at, id): в задачах (индекс
+    idx_user_updated) и в записях об удалении (idx_tombstone_user_deleted).
+    Обе выборки идут по индексу, поэтому стоимость пропорциональна числу
+    изменений, а не числу задач. Без since (или если since старше срока
+    хранения записей об удалении) отдаются все задачи и reset=True —
+    клиент должен заменить свой список целиком.
+
+    Returns:
+        dict: tasks, deleted (task_id, deleted_at), cursor, has_more, reset
+    """
+    now = now or datetime.now(timezone.utc)
+    horizon = (now - SYNC_CLOCK_SKEW, 0)
+    reset = since is None
+    if since:
+        tasks_position, deleted_position = decode_sync_cursor(since)
+        # Выдача идёт в общем порядке по времени, поэтому клиент видел все изменения
+        # до более новой из двух позиций; удаления раньше неё ему уже не нужны
+        if max(tasks_position[0], deleted_position[0]) < now - TOMBSTONE_RETENTION:
+            logger.info(f"Курсор синхронизации user_id={user_id} устарел, отдаю полный список")
+            reset = True
+    if reset:
+        tasks_position, deleted_position = (_SYNC_START, 0), horizon
+    try:
+        tasks = (await db.scalars(
+            select(Task)
+            .where(Task.user_id == user_id,
+                   tuple_(Task.updated_at, Task.id) > tuple_(tasks_position[0], tasks_position[1]))
+            .order_by(Task.updated_at, Task.id)
+            .limit(limit + 1)
+        )).all()
+        tombstones = (await db.scalars(
+            select(TaskTombstone)
+            .where(TaskTombstone.user_id == user_id,
+                   tuple_(TaskTombstone.deleted_at, TaskTombstone.id) > tuple_(deleted_position[0], deleted_position[1]))
+            .order_by(TaskTombstone.deleted_at, TaskTombstone.id)
+            .limit(limit + 1)
+        )).all()
     except Exception as e:
-        logger.error(f"Ошибка при получении задач для user_id={user_id}: {str(e)}")
+        logger.error(f"Ошибка при получении изменений задач для user_id={user_id}: {str(e)}")
+        raise
+
+    # Сливаем обе выборки по времени; в каждой не больше limit + 1 записей,
+    # поэтому первые limit элементов слияния — верный префикс общего порядка
+    merged = sorted(
+        [(as_utc(task.updated_at), 0, task.id, task) for task in tasks]
+        + [(as_utc(tombstone.deleted_at), 1, tombstone.id, tombstone) for tombstone in tombstones],
+        key=lambda item: item[:3]
+    )
+    has_more = len(merged) > limit
+    changed, deleted = [], []
+    new_tasks_position, new_deleted_position = tasks_position, deleted_position
+    for moment, kind, row_id, row in merged[:limit]:
+        if kind == 0:
+            changed.append(row)
+            new_tasks_position = (moment, row_id)
+        else:
+            deleted.append({"id": row.task_id, "deleted_at": moment})
+            new_deleted_position = (moment, row_id)
+    if not has_more:
+        # Последняя страница: всё до horizon отдано, обе позиции доходят до него,
+        # даже если в одной из выборок ничего не нашлось. В окно SYNC_CLOCK_SKEW
+        # курсор не заходит: изменения из него придут повторно
+        new_tasks_position = max(tasks_position, horizon)
+        new_deleted_position = max(deleted_position, horizon)
+    return {
+        "tasks": changed,
+        "deleted": deleted,
+        "cursor": encode_sync_cursor(new_tasks_position, new_deleted_position),
+        "has_more": has_more,
+        "reset": reset,
+    }
+
+async def prune_tombstones(db: AsyncSession, older_than: timedelta = TOMBSTONE_RETENTION) -> int:
+    """Удаляет записи об удалении старше срока хранения."""
+    try:
+        result = await db.execute(
+            delete(TaskTombstone).where(TaskTombstone.deleted_at < datetime.now(timezone.utc) - older_than)
+        )
+        await db.commit()
+        if result.rowcount:
+            logger.info(f"Удалено устаревших записей об удалении задач: {result.rowcount}")
+        return result.rowcount
+    except Exception as e:
+        logger.error(f"Ошибка при очистке записей об удалении задач: {str(e)}")
+        await db.rollback()
         raise
 
+def parse_deadline(deadline: Optional[str]) -> Optional[datetime]:
+    """Разбирает дедлайн в формате ISO 8601 и приводит его к UTC (без зоны — считается UTC)."""
+    if not deadline:
+        return None
+    try:
+        deadline_dt = datetime.fromisoformat(deadline.replace('Z', '+00:00'))
+    except ValueError as e:
+        logger.error(f"Неверный формат deadline: {deadline}, ошибка: {str(e)}")
+        raise ValueError(f"Неверный формат deadline: {deadline}")
+    if deadline_dt.tzinfo is None:
+        return deadline_dt.replace(tzinfo=timezone.utc)
+    return deadline_dt.astimezone(timezone.utc)
+
+def _dialect_insert(db: AsyncSession, model=Task):
+    """INSERT с поддержкой ON CONFLICT для диалекта текущей сессии."""
+    if db.bind.dialect.name == "sqlite":
+        return sqlite_insert(model)
+    return pg_insert(model)
+
+def dedup_bucket(moment: datetime) -> int:
+    """Номер минуты с начала эпохи — часть ключа защиты от дублей при создании."""
+    return int(moment.timestamp() // 60)
+
 async def create_task(db: AsyncSession, user_id: int, title: str, description: Optional[str] = None, 
                      deadline: Optional[str] = None, priority: str = "Medium", reminder: bool = False, 
-                     completed: bool = False):
+                     completed: bool = False, settings: Optional[dict] = None,
+                     recurrence: Optional[str] = None, recurrence_interval: Optional[int] = None,
+                     recurrence_until: Optional[str] = None):
     logger.info(f"Создание задачи для user_id={user_id}, title={title}")
     try:
-        # Проверка на дубликаты
-        query = select(Task).where(
-            Task.user_id == user_id,
-            Task.title == title,
-            Task.created_at >= datetime.now(timezone.utc) - timedelta(minutes=1)
+        deadline_dt = parse_deadline(deadline)
+        rule = _parse_recurrence({"recurrence": recurrence, "recurrence_interval": recurrence_interval,
+                                  "recurrence_until": recurrence_until})
+        if recurrence is not None:
+            # deadline повторяющейся задачи — первое вхождение серии
+            if deadline_dt is None:
+                raise ValueError("Для повторяющейся задачи нужен deadline")
+            rule["recurrence_interval"] = recurrence_interval or 1
+        else:
+            rule = dict.fromkeys(RECURRENCE_FIELDS)
+        now = datetime.now(timezone.utc)
+        settings = settings or await get_user_settings(db, user_id)
+
+        # Один INSERT ... ON CONFLICT DO NOTHING RETURNING: повторная отправка той же задачи
+        # в пределах минуты упирается в уникальный индекс uq_task_dedup вместо отдельного SELECT
+        stmt = (
+            _dialect_insert(db)
+            .values(
+                title=title,
+                description=description,
+                deadline=deadline_dt,
+                priority=priority,
+                reminder=reminder,
+                completed=completed,
+                user_id=user_id,
+                created_at=now,
+                updated_at=now,
+                dedup_bucket=dedup_bucket(now),
+                remind_at=compute_remind_at(deadline_dt, reminder, completed, settings,
+                                            rule=task_rule(rule), now=now),
+                **rule
+            )
+            .on_conflict_do_nothing(index_elements=["user_id", "title", "dedup_bucket"])
+            .returning(Task)
         )
-        result = await db.execute(query)
-        existing_task = result.scalars().first()
+        db_task = (await db.scalars(stmt)).first()
         
-        if existing_task:
+        if db_task is None:
             logger.info("Задача с таким названием уже существует, пропускаем создание.")
+            query = select(Task).where(
+                Task.user_id == user_id,
+                Task.title == title,
+                Task.dedup_bucket == dedup_bucket(now)
+            )
+            existing_task = (await db.scalars(query)).first()
+            await db.commit()
             return existing_task
 
-        deadline_dt = None
-        if deadline:
-            try:
-                deadline_dt = datetime.fromisoformat(deadline.replace('Z', '+00:00'))
-                if deadline_dt.tzinfo is None:
-                    deadline_dt = deadline_dt.replace(tzinfo=timezone.utc)
-                else:
-                    deadline_dt = deadline_dt.astimezone(timezone.utc)
-            except ValueError as e:
-                logger.error(f"Неверный формат deadline: {deadline}, ошибка: {str(e)}")
-                raise ValueError(f"Неверный формат deadline: {deadline}")
-
-        db_task = Task(
-            title=title,
-            description=description,
-            deadline=deadline_dt,
-            priority=priority,
-            reminder=reminder,
-            completed=completed,
-            user_id=user_id
-        )
-        db.add(db_task)
         await db.commit()
-        await db.refresh(db_task)
         logger.info(f"Задача создана: id={db_task.id}, deadline в UTC: {db_task.deadline}")
+        await _notify("created", db_task)
         return db_task
     except Exception as e:
         logger.error(f"Ошибка при создании задачи для user_id={user_id}: {str(e)}")
@@ -87,45 +733,463 @@ async def create_task(db: AsyncSession, user_id: int, title: str, description: O
 
 async def delete_task(db: AsyncSession, user_id: int, task_id: int):
     try:
-        task = await db.get(Task, task_id)
-        if not task or task.user_id != user_id:
+        stmt = (
+            delete(Task)
+            .where(Task.id == task_id, Task.user_id == user_id)
+            .returning(Task)
+            .execution_options(synchronize_session=False)
+        )
+        task = (await db.scalars(stmt)).first()
+        if not task:
             logger.warning(f"Задача с task_id={task_id} не найдена или не принадлежит user_id={user_id}")
+            await db.rollback()
             return None
-        await db.delete(task)
+        await db.execute(insert(TaskTombstone).values(
+            task_id=task.id, user_id=user_id, deleted_at=datetime.now(timezone.utc)
+        ))
+        if task.recurrence is not None:
+            await db.execute(delete(TaskOccurrence).where(TaskOccurrence.task_id == task.id))
         await db.commit()
         logger.info(f"Задача успешно удалена: task_id={task_id}, user_id={user_id}")
+        await _notify("deleted", task)
         return task
     except Exception as e:
         logger.error(f"Ошибка при удалении задачи task_id={task_id}: {str(e)}")
         await db.rollback()
         raise
 
-async def update_task(db: AsyncSession, user_id: int, task_id: int, **kwargs):
+async def _sync_remind_at(db: AsyncSession, user_id: int, tasks, settings: Optional[dict]) -> Optional[dict]:
+    """
+    Приводит remind_at задач после UPDATE ... RETURNING в соответствие с их полями.
+    Исправленные значения записываются при ближайшем коммите (flush сессии).
+    """
+    now = datetime.now(timezone.utc)
+    recurring = [task.id for task in tasks if task.recurrence is not None]
+    done = await _completed_occurrences(db, recurring, now) if recurring else {}
+    for task in tasks:
+        settings = settings or await get_user_settings(db, user_id)
+        expected = compute_remind_at(task.deadline, task.reminder, task.completed, settings,
+                                     rule=task_rule(task), now=now, done=done.get(task.id, ()))
+        if _remind_at_changed(task, expected):
+            task.remind_at = expected
+    return settings
+
+async def update_task(db: AsyncSession, user_id: int, task_id: int, settings: Optional[dict] = None, **kwargs):
     try:
-        task = await db.get(Task, task_id)
-        if not task or task.user_id != user_id:
-            logger.warning(f"Задача с task_id={task_id} не найдена или не принадлежит user_id={user_id}")
-            return None
-            
+        values = {}
         for key, value in kwargs.items():
             if value is not None:
                 if key == "deadline" and value:
-                    try:
-                        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
-                        if value.tzinfo is None:
-                            value = value.replace(tzinfo=timezone.utc)
-                        else:
-                            value = value.astimezone(timezone.utc)
-                    except ValueError as e:
-                        logger.error(f"Неверный формат deadline в обновлении: {value}, ошибка: {str(e)}")
-                        raise ValueError(f"Неверный формат deadline: {value}")
-                setattr(task, key, value)
+                    value = parse_deadline(value)
+                values[key] = value
+        _parse_recurrence(values)
+        # remind_at зависит от deadline, reminder, completed и правила повторения: если он
+        # не следует из новых значений напрямую, он пересчитывается по вернувшейся строке
+        recompute = False
+        if values.keys() & REMIND_AT_FIELDS:
+            remind_at = _known_remind_at(values)
+            if remind_at is ...:
+                recompute = True
+            else:
+                values["remind_at"] = remind_at
+        if not values:
+            task = (await db.scalars(select(Task).where(Task.id == task_id, Task.user_id == user_id))).first()
+            if not task:
+                logger.warning(f"Задача с task_id={task_id} не найдена или не принадлежит user_id={user_id}")
+            return task
+
+        stmt = (
+            update(Task)
+            .where(Task.id == task_id, Task.user_id == user_id)
+            .values(**values)
+            .returning(Task)
+            .execution_options(synchronize_session=False)
+        )
+        task = (await db.scalars(stmt)).first()
+        if not task:
+            logger.warning(f"Задача с task_id={task_id} не найдена или не принадлежит user_id={user_id}")
+            await db.rollback()
+            return None
+        if recompute:
+            await _sync_remind_at(db, user_id, [task], settings)
+        # Прежний дедлайн и правило без отдельного SELECT неизвестны — тогда подписчики получают previous=None
+        previous = None if values.keys() & {"deadline", *RECURRENCE_FIELDS} else {}
                 
         await db.commit()
-        await db.refresh(task)
         logger.info(f"Задача успешно обновлена: task_id={task_id}, user_id={user_id}")
+        await _notify("updated", task, previous=previous)
         return task
     except Exception as e:
         logger.error(f"Ошибка при обновлении задачи task_id={task_id}: {str(e)}")
         await db.rollback()
         raise
+
+# Поля задачи, которые можно передавать в пакетных операциях
+TASK_FIELDS = ("title", "description", "deadline", "priority", "reminder", "completed") + RECURRENCE_FIELDS
+
+async def create_tasks_bulk(db: AsyncSession, user_id: int, items: List[dict],
+                            settings: Optional[dict] = None) -> List[dict]:
+    """
+    Создаёт пачку задач одним многострочным INSERT ... RETURNING и одним коммитом.
+
+    Элементы с ошибками (например, неверный deadline) пропускаются и попадают
+    в результат со статусом "error", остальные создаются.
+
+    Returns:
+        List[dict]: По элементу на каждый входной: index, status, task или error
+    """
+    results = [None] * len(items)
+    rows, indexes = [], []
+    settings = settings or await get_user_settings(db, user_id)
+    for index, item in enumerate(items):
+        try:
+            row = _parse_recurrence({key: item[key] for key in TASK_FIELDS if key in item})
+            row["deadline"] = parse_deadline(item.get("deadline"))
+            if row.get("recurrence") is not None:
+                if row["deadline"] is None:
+                    raise ValueError("Для повторяющейся задачи нужен deadline")
+                row["recurrence_interval"] = row.get("recurrence_interval") or 1
+            row["user_id"] = user_id
+            row["remind_at"] = compute_remind_at(row["deadline"], row.get("reminder", False),
+                                                 row.get("completed", False), settings, rule=task_rule(row))
+        except ValueError as e:
+            results[index] = {"index": index, "status": "error", "error": str(e)}
+            continue
+        rows.append(row)
+        indexes.append(index)
+
+    try:
+        tasks = []
+        if rows:
+            result = await db.scalars(insert(Task).returning(Task, sort_by_parameter_order=True), rows)
+            tasks = result.all()
+            await db.commit()
+        for index, task in zip(indexes, tasks):
+            results[index] = {"index": index, "status": "created", "id": task.id, "task": task}
+        logger.info(f"Пакетно создано задач: {len(tasks)} для user_id={user_id}")
+    except Exception as e:
+        logger.error(f"Ошибка при пакетном создании задач для user_id={user_id}: {str(e)}")
+        await db.rollback()
+        raise
+    for task in tasks:
+        await _notify("created", task)
+    return results
+
+async def update_tasks_bulk(db: AsyncSession, user_id: int, items: List[dict],
+                            settings: Optional[dict] = None) -> List[dict]:
+    """
+    Обновляет пачку задач пользователя в одной транзакции.
+
+    Элементы с одинаковым набором новых значений объединяются в один
+    UPDATE ... WHERE user_id AND id IN (...) RETURNING, поэтому, например,
+    «выполнить все задачи на сегодня» — это один запрос.
+
+    Returns:
+        List[dict]: По элементу на каждый входной: index, id, status, task или error
+    """
+    results = [None] * len(items)
+    groups = {}
+    for index, item in enumerate(items):
+        task_id = item.get("id")
+        try:
+            values = _parse_recurrence({key: item[key] for key in TASK_FIELDS if item.get(key) is not None})
+            if "deadline" in values:
+                values["deadline"] = parse_deadline(values["deadline"])
+        except ValueError as e:
+            results[index] = {"index": index, "id": task_id, "status": "error", "error": str(e)}
+            continue
+        if not values:
+            results[index] = {"index": index, "id": task_id, "status": "error", "error": "Нет полей для обновления"}
+            continue
+        groups.setdefault(tuple(sorted(values.items())), []).append((index, task_id))
+
+    updated = {}
+    try:
+        for values, members in groups.items():
+            values = dict(values)
+            recompute = False
+            if values.keys() & REMIND_AT_FIELDS:
+                remind_at = _known_remind_at(values)
+                if remind_at is ...:
+                    recompute = True
+                else:
+                    values["remind_at"] = remind_at
+            stmt = (
+                update(Task)
+                .where(Task.user_id == user_id, Task.id.in_([task_id for _, task_id in members]))
+                .values(**values)
+                .returning(Task)
+                .execution_options(synchronize_session=False)
+            )
+            tasks = (await db.scalars(stmt)).all()
+            if recompute:
+                settings = await _sync_remind_at(db, user_id, tasks, settings)
+            updated.update({task.id: task for task in tasks})
+        if groups:
+            await db.commit()
+        logger.info(f"Пакетно обновлено задач: {len(updated)} для user_id={user_id}")
+    except Exception as e:
+        logger.error(f"Ошибка при пакетном обновлении задач для user_id={user_id}: {str(e)}")
+        await db.rollback()
+        raise
+
+    for members in groups.values():
+        for index, task_id in members:
+            task = updated.get(task_id)
+            if task is None:
+                results[index] = {"index": index, "id": task_id, "status": "error",
+                                  "error": "Задача не найдена или не принадлежит пользователю"}
+            else:
+                results[index] = {"index": index, "id": task_id, "status": "updated", "task": task}
+    for task in updated.values():
+        await _notify("updated", task)
+    return results
+
+async def delete_tasks_bulk(db: AsyncSession, user_id: int, task_ids: List[int]) -> List[dict]:
+    """
+    Удаляет пачку задач пользователя одним DELETE ... RETURNING и в той же
+    транзакции записывает их в task_tombstones.
+
+    Returns:
+        List[dict]: По элементу на каждый входной id: index, id, status или error
+    """
+    try:
+        stmt = (
+            delete(Task)
+            .where(Task.user_id == user_id, Task.id.in_(task_ids))
+            .returning(Task)
+            .execution_options(synchronize_session=False)
+        )
+        result = await db.scalars(stmt)
+        deleted = {task.id: task for task in result.all()}
+        if deleted:
+            now = datetime.now(timezone.utc)
+            await db.execute(insert(TaskTombstone), [
+                {"task_id": task_id, "user_id": user_id, "deleted_at": now} for task_id in deleted
+            ])
+            recurring = [task.id for task in deleted.values() if task.recurrence is not None]
+            if recurring:
+                await db.execute(delete(TaskOccurrence).where(TaskOccurrence.task_id.in_(recurring)))
+        await db.commit()
+        logger.info(f"Пакетно удалено задач: {len(deleted)} для user_id={user_id}")
+    except Exception as e:
+        logger.error(f"Ошибка при пакетном удалении задач для user_id={user_id}: {str(e)}")
+        await db.rollback()
+        raise
+
+    results = []
+    for index, task_id in enumerate(task_ids):
+        if task_id in deleted:
+            results.append({"index": index, "id": task_id, "status": "deleted"})
+        else:
+            results.append({"index": index, "id": task_id, "status": "error",
+                            "error": "Задача не найдена или не принадлежит пользователю"})
+    for task in deleted.values():
+        await _notify("deleted", task)
+    return results
+
+async def set_occurrence_completed(db: AsyncSession, user_id: int, task_id: int, occurrence: datetime,
+                                   completed: bool = True, settings: Optional[dict] = None):
+    """
+    Отмечает одно вхождение повторяющейся задачи выполненным (или снимает отметку).
+
+    Отметка — единственное, что хранится о вхождении: строка task_occurrences
+    создаётся или обновляется одним INSERT ... ON CONFLICT DO UPDATE. remind_at
+    задачи пересчитывается, чтобы не напоминать о выполненном вхождении.
+
+    Returns:
+        Строка TaskOccurrence или None, если задача не найдена
+    """
+    try:
+        task = (await db.scalars(select(Task).where(Task.id == task_id, Task.user_id == user_id))).first()
+        if not task:
+            logger.warning(f"Задача с task_id={task_id} не найдена или не принадлежит user_id={user_id}")
+            return None
+        if task.recurrence is None:
+            raise ValueError(f"Задача {task_id} не повторяющаяся")
+        settings = settings or await get_user_settings(db, user_id)
+        occurrence = as_utc(occurrence)
+        if occurrence not in recurrence.occurrences_between(task.deadline, *task_rule(task), range_start=occurrence,
+                                                            range_end=occurrence + timedelta(seconds=1),
+                                                            tz=settings["timezone"]):
+            raise ValueError(f"{occurrence.isoformat()} не является вхождением задачи {task_id}")
+        now = datetime.now(timezone.utc)
+        stmt = (
+            _dialect_insert(db, TaskOccurrence)
+            .values(task_id=task_id, user_id=user_id, occurrence=occurrence, completed=completed, updated_at=now)
+            .on_conflict_do_update(index_elements=["task_id", "occurrence"],
+                                   set_={"completed": completed, "updated_at": now})
+            .returning(TaskOccurrence)
+        )
+        row = (await db.scalars(stmt)).first()
+        await _sync_remind_at(db, user_id, [task], settings)
+        task.updated_at = now
+        await db.commit()
+        logger.info(f"Вхождение {occurrence.isoformat()} задачи task_id={task_id} выполнено: {completed}")
+    except ValueError:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка при отметке вхождения задачи task_id={task_id}: {str(e)}")
+        await db.rollback()
+        raise
+    await _notify("updated", task, previous=None)
+    return row
+
+async def get_task_calendar(db: AsyncSession, user_id: int, start: date, end: date,
+                            tz: Optional[str] = None) -> List[dict]:
+    """
+    Число задач (всего и выполненных) по дням [start, end) в часовом поясе tz.
+
+    Диапазон переводится в UTC и фильтруется по deadline (idx_user_deadline).
+    В Postgres дни считаются одним агрегирующим запросом через timezone();
+    в SQLite функций часовых поясов нет, поэтому выбираются только deadline
+    и completed в том же диапазоне и раскладываются по дням в Python.
+    Повторяющиеся задачи считаются по вхождениям (_expand_occurrences).
+
+    Returns:
+        List[dict]: date, total, completed — только дни, где есть задачи
+    """
+    zone = parse_timezone(tz)
+    range_start, _ = _day_bounds(start, tz)
+    range_end, _ = _day_bounds(end, tz)
+    conditions = (Task.user_id == user_id, Task.deadline >= range_start, Task.deadline < range_end,
+                  Task.recurrence.is_(None))
+    try:
+        counts = {}
+        for _, occurrence, completed in await _expand_occurrences(db, user_id, range_start, range_end, zone.key):
+            day = occurrence.astimezone(zone).date()
+            total, done = counts.get(day, (0, 0))
+            counts[day] = (total + 1, done + int(bool(completed)))
+
+        if db.bind.dialect.name == "postgresql":
+            # Имя пояса подставляется литералом: иначе выражения в SELECT и GROUP BY
+            # получат разные параметры, и Postgres не сочтёт их одинаковыми
+            day = func.date(func.timezone(bindparam("tz", zone.key, literal_execute=True), Task.deadline))
+            query = (
+                select(day, func.count(), func.count().filter(Task.completed))
+                .where(*conditions)
+                .group_by(day)
+                .order_by(day)
+            )
+            for day, total, done in (await db.execute(query)).all():
+                extra_total, extra_done = counts.get(day, (0, 0))
+                counts[day] = (total + extra_total, done + extra_done)
+            return [{"date": day, "total": total, "completed": done} for day, (total, done) in sorted(counts.items())]
+
+        result = await db.execute(select(Task.deadline, Task.completed).where(*conditions))
+        for deadline, completed in result:
+            day = as_utc(deadline).astimezone(zone).date()
+            total, done = counts.get(day, (0, 0))
+            counts[day] = (total + 1, done + int(bool(completed)))
+        return [{"date": day, "total": total, "completed": done} for day, (total, done) in sorted(counts.items())]
+    except Exception as e:
+        logger.error(f"Ошибка при получении календаря задач для user_id={user_id}: {str(e)}")
+        raise
+
+# Настройки пользователя без записи в user_settings
+DEFAULT_SETTINGS = {"timezone": "UTC", "reminder_time": 60, "reminder_enabled": True}
+SETTINGS_FIELDS = tuple(DEFAULT_SETTINGS)
+
+# Подписчики на изменение настроек: callback(user_id, settings, previous) со словарями полей SETTINGS_FIELDS
+_settings_listeners = []
+
+def add_settings_listener(callback):
+    if callback not in _settings_listeners:
+        _settings_listeners.append(callback)
+
+async def get_user_settings(db: AsyncSession, user_id: int) -> dict:
+    """Настройки пользователя словарём; если записи нет — значения по умолчанию."""
+    try:
+        row = (await db.execute(
+            select(*(getattr(UserSettings, name) for name in SETTINGS_FIELDS)).where(UserSettings.user_id == user_id)
+        )).first()
+        if row is None:
+            return dict(DEFAULT_SETTINGS)
+        return {name: (value if value is not None else DEFAULT_SETTINGS[name])
+                for name, value in zip(SETTINGS_FIELDS, row)}
+    except Exception as e:
+        logger.error(f"Ошибка при получении настроек user_id={user_id}: {str(e)}")
+        raise
+
+async def _recompute_user_remind_at(db: AsyncSession, user_id: int, settings: dict, now: datetime) -> list:
+    """
+    Пересчитывает remind_at всех ожидающих напоминаний пользователя после смены
+    времени напоминания или часового пояса: одна выборка по idx_user_deadline
+    и один executemany UPDATE по первичному ключу. Коммит — за вызывающим.
+
+    Returns:
+        Строки задач (TaskRow), у которых remind_at изменился
+    """
+    rows = (await db.execute(
+        select(*TASK_COLUMNS).where(
+            Task.user_id == user_id,
+            or_(Task.deadline > now, Task.recurrence.isnot(None)),
+            Task.reminder == True,
+            Task.completed == False
+        )
+    )).all()
+    changed = []
+    if rows:
+        done = await _completed_occurrences(db, [row.id for row in rows if row.recurrence is not None], now)
+        for row in rows:
+            remind_at = compute_remind_at(row.deadline, True, False, settings, rule=task_rule(row),
+                                          now=now, done=done.get(row.id, ()))
+            if _remind_at_changed(row, remind_at):
+                changed.append(TaskRow(**{**row._asdict(), "remind_at": remind_at, "updated_at": now}))
+    if changed:
+        await db.execute(update(Task), [
+            {"id": row.id, "remind_at": row.remind_at, "updated_at": now} for row in changed
+        ])
+    logger.info(f"Пересчитано напоминаний для user_id={user_id}: {len(changed)}")
+    return changed
+
+async def update_user_settings(db: AsyncSession, user_id: int, **kwargs) -> dict:
+    """
+    Создаёт или обновляет настройки пользователя (INSERT ... ON CONFLICT DO UPDATE).
+
+    Значения None пропускаются. После коммита подписчики получают новые
+    и прежние настройки, а подписчики на задачи — событие "updated" по
+    каждой задаче с пересчитанным remind_at.
+
+    Returns:
+        dict: Новые настройки
+    """
+    values = {key: value for key, value in kwargs.items() if key in SETTINGS_FIELDS and value is not None}
+    if "reminder_time" in values and \
+            not MIN_REMINDER_TIME <= values["reminder_time"] <= MAX_REMINDER_LEAD.total_seconds() // 60:
+        raise ValueError(f"Неверное время напоминания: {values['reminder_time']}")
+    if "timezone" in values:
+        values["timezone"] = parse_timezone(values["timezone"]).key
+    try:
+        previous = await get_user_settings(db, user_id)
+        if not values:
+            return previous
+        now = datetime.now(timezone.utc)
+        stmt = (
+            _dialect_insert(db, UserSettings)
+            .values(user_id=user_id, created_at=now, updated_at=now, **{**previous, **values})
+            .on_conflict_do_update(index_elements=["user_id"], set_={**values, "updated_at": now})
+        )
+        await db.execute(stmt)
+        settings = {**previous, **values}
+        recomputed = []
+        # Вхождения повторяющихся задач считаются по местному времени — от пояса тоже зависит remind_at
+        if (settings["reminder_time"], settings["reminder_enabled"], settings["timezone"]) != \
+                (previous["reminder_time"], previous["reminder_enabled"], previous["timezone"]):
+            recomputed = await _recompute_user_remind_at(db, user_id, settings, now)
+        await db.commit()
+        logger.info(f"Настройки обновлены для user_id={user_id}: {values}")
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении настроек user_id={user_id}: {str(e)}")
+        await db.rollback()
+        raise
+    for row in recomputed:
+        await _notify("updated", row, previous={})
+    for callback in _settings_listeners:
+        try:
+            result = callback(user_id, settings, previous)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error(f"Ошибка в подписчике на изменения настроек (user_id={user_id}): {str(e)}")
+    return settings
@@ -1,9 +1,16 @@
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import NullPool
+from starlette.requests import Request
+import asyncio
 import os
 import logging
+import time
 from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from uuid import uuid4
+import metrics
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -21,18 +28,199 @@ if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql+asyncpg://", 1)
     logger.info("DATABASE_URL изменён для совместимости с asyncpg")
 
+# Реплика для чтения; без неё все запросы идут в основную базу
+DATABASE_REPLICA_URL = os.environ.get("DATABASE_REPLICA_URL")
+if DATABASE_REPLICA_URL and DATABASE_REPLICA_URL.startswith("postgres://"):
+    DATABASE_REPLICA_URL = DATABASE_REPLICA_URL.replace("postgres://", "postgresql+asyncpg://", 1)
+# Сколько секунд после записи чтения пользователя идут в основную базу,
+# чтобы он увидел свои изменения несмотря на отставание реплики
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", "5"))
+
 logger.info(f"Используется тип базы данных: {DATABASE_URL.split('://')[0]}")
 
+# Режим пула: "pool" — собственный пул процесса, "pgbouncer" — соединения
+# держит внешний пулер в режиме транзакций, процесс свой пул не ведёт
+DB_POOL_MODE = os.environ.get("DB_POOL_MODE", "pool").lower()
+if DB_POOL_MODE not in ("pool", "pgbouncer"):
+    raise ValueError(f"Неизвестный DB_POOL_MODE: {DB_POOL_MODE}")
+# Число воркеров uvicorn (его же uvicorn берёт по умолчанию для --workers)
+WEB_CONCURRENCY = max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+# Сколько соединений с базой могут занять все воркеры вместе; остаток
+# max_connections Postgres (по умолчанию 100) остаётся для init_db и администрирования
+DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", "90"))
+# Адрес в обход пулера для блокировок уровня сессии (выбор лидера напоминаний)
+DATABASE_DIRECT_URL = os.environ.get("DATABASE_DIRECT_URL")
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+def _asyncpg_args(mode: str) -> dict:
+    """
+    Параметры подключения asyncpg. PgBouncer в режиме транзакций отдаёт
+    каждую транзакцию любому серверному соединению, поэтому подготовленные
+    выражения нельзя кэшировать, а их имена должны быть уникальными.
+    """
+    cache_size = _env_int("DB_STATEMENT_CACHE_SIZE", 0 if mode == "pgbouncer" else 100)
+    args = {
+        # Кэш самого asyncpg и кэш диалекта SQLAlchemy поверх него
+        "statement_cache_size": cache_size,
+        "prepared_statement_cache_size": cache_size,
+    }
+    if mode == "pgbouncer":
+        args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid4()}__"
+    return args
+
+def pool_profile(url: str, mode: str = DB_POOL_MODE, workers: int = WEB_CONCURRENCY,
+                 max_connections: int = DB_MAX_CONNECTIONS) -> dict:
+    """
+    Параметры create_async_engine для пула соединений.
+
+    Бюджет соединений делится между воркерами: постоянная часть пула —
+    треть доли воркера (не больше 10), остальное — overflow на пики
+    (не больше 20). DB_POOL_SIZE и DB_MAX_OVERFLOW задают размеры явно.
+
+    Args:
+        url (str): URL базы данных
+        mode (str): "pool" или "pgbouncer"
+        workers (int): Число процессов приложения
+        max_connections (int): Бюджет соединений на все процессы
+
+    Returns:
+        dict: Именованные аргументы для create_async_engine
+    """
+    # SQLite использует свой пул
+    if url.startswith("sqlite"):
+        return {}
+    options = {}
+    if url.startswith("postgresql+asyncpg"):
+        options["connect_args"] = _asyncpg_args(mode)
+    if mode == "pgbouncer":
+        # Соединения переиспользует пулер, держать второй пул в процессе незачем
+        options["poolclass"] = NullPool
+        return options
+    per_worker = max(2, max_connections // workers)
+    pool_size = _env_int("DB_POOL_SIZE", min(10, max(1, per_worker // 3)))
+    options.update(
+        pool_size=pool_size,
+        max_overflow=_env_int("DB_MAX_OVERFLOW", min(20, max(0, per_worker - pool_size))),
+        pool_timeout=_env_int("DB_POOL_TIMEOUT", 30),
+        pool_recycle=1800,  # Пересоздает соединения каждые 30 минут
+        # Соединение, закрытое сервером или балансировщиком, заменяется до выдачи запросу
+        pool_pre_ping=os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true",
+    )
+    return options
+
+pool_options = pool_profile(DATABASE_URL)
+if pool_options:
+    logger.info(f"Пул соединений: режим {DB_POOL_MODE}, воркеров {WEB_CONCURRENCY}, "
+                f"pool_size={pool_options.get('pool_size', 0)}, max_overflow={pool_options.get('max_overflow', 0)}")
+
 # Создание асинхронного движка
 engine = create_async_engine(
     DATABASE_URL,
     echo=bool(os.environ.get("SQL_ECHO", "False").lower() == "true"),
-    pool_size=10,
-    max_overflow=20,
-    pool_timeout=30,
-    pool_recycle=1800,  # Пересоздает соединения каждые 30 минут
+    **pool_options
 )
 
+# Замеры времени SQL-запросов и ожидания соединения для /metrics
+metrics.instrument_engine(engine)
+
+# Движок реплики с тем же профилем пула; схему создаёт и обновляет только основная база
+replica_engine = None
+if DATABASE_REPLICA_URL:
+    replica_engine = create_async_engine(DATABASE_REPLICA_URL, **pool_profile(DATABASE_REPLICA_URL))
+    metrics.instrument_engine(replica_engine)
+    logger.info(f"Чтения направляются в реплику, окно read-your-writes {READ_YOUR_WRITES_SECONDS} с")
+
+# Движок для блокировок уровня сессии: через пулер в режиме транзакций
+# advisory lock остался бы на чужом серверном соединении
+session_engine = engine
+if DATABASE_DIRECT_URL:
+    session_engine = create_async_engine(DATABASE_DIRECT_URL, poolclass=NullPool)
+elif DB_POOL_MODE == "pgbouncer" and not DATABASE_URL.startswith("sqlite"):
+    logger.warning("DB_POOL_MODE=pgbouncer без DATABASE_DIRECT_URL: выбор лидера напоминаний "
+                   "через пулер в режиме транзакций ненадёжен")
+
+def _pool_counters(target) -> dict:
+    pool = target.sync_engine.pool
+    stats = {"pool_class": type(pool).__name__}
+    # NullPool и пул SQLite не ведут счётчиков
+    if hasattr(pool, "checkedout"):
+        stats.update(
+            pool_size=pool.size(),
+            max_overflow=pool._max_overflow,
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(0, pool.overflow()),
+        )
+    return stats
+
+def pool_stats() -> dict:
+    """
+    Состояние пула соединений для /db/pool и метрик.
+
+    Returns:
+        dict: Режим, размеры пула, занятые и свободные соединения,
+        overflow, число и суммарное время ожиданий соединения;
+        при настроенной реплике — её пул в ключе replica
+    """
+    stats = {
+        "mode": DB_POOL_MODE,
+        "workers": WEB_CONCURRENCY,
+        **_pool_counters(engine),
+        "wait_count": metrics.db_pool_wait.count(),
+        "wait_seconds_total": round(metrics.db_pool_wait.total(), 6),
+        "timeouts": metrics.db_pool_timeouts.value(),
+    }
+    if replica_engine is not None:
+        stats["replica"] = _pool_counters(replica_engine)
+    return stats
+
+async def _warm(target, connections: Optional[int]) -> int:
+    pool = target.sync_engine.pool
+    if not hasattr(pool, "checkedout"):
+        return 0
+    count = min(connections if connections is not None else _env_int("DB_POOL_WARM", pool.size()), pool.size())
+
+    async def _touch():
+        async with target.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    # Соединения должны быть открыты одновременно, иначе пул выдаст одно и то же
+    results = await asyncio.gather(*(_touch() for _ in range(count)), return_exceptions=True)
+    failed = [r for r in results if isinstance(r, Exception)]
+    if failed:
+        logger.warning(f"Не удалось открыть {len(failed)} из {count} соединений при прогреве: {str(failed[0])}")
+    return count - len(failed)
+
+async def warm_pool(connections: Optional[int] = None) -> int:
+    """
+    Открывает соединения пула заранее, чтобы первые запросы после старта
+    не ждали установки соединения. По умолчанию — весь pool_size
+    основной базы и реплики.
+    """
+    started = time.perf_counter()
+    opened = await _warm(engine, connections)
+    if replica_engine is not None:
+        opened += await _warm(replica_engine, connections)
+    if opened:
+        logger.info(f"Пул прогрет: {opened} соединений за {time.perf_counter() - started:.3f} с")
+    return opened
+
+async def dispose_engines():
+    await engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
+    if session_engine is not engine:
+        await session_engine.dispose()
+
+if hasattr(engine.sync_engine.pool, "checkedout"):
+    metrics.registry.gauge("db_pool_checked_out", "Соединения, выданные из пула").set_function(
+        lambda: engine.sync_engine.pool.checkedout())
+    metrics.registry.gauge("db_pool_overflow", "Соединения сверх pool_size").set_function(
+        lambda: max(0, engine.sync_engine.pool.overflow()))
+
 # Создание фабрики сессий
 async_session = sessionmaker(
     engine,
@@ -70,3 +258,75 @@ async def get_db_context():
             yield session
         finally:
             await session.close()
+
+replica_session = sessionmaker(
+    replica_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False
+) if replica_engine is not None else None
+
+# Пользователи, недавно писавшие в базу: user_id -> время (monotonic), до которого их чтения идут в основную базу.
+# Хранится в памяти процесса: запись, принятая другим воркером, здесь не видна
+_recent_writers: Dict[int, float] = {}
+_MAX_RECENT_WRITERS = 100_000
+
+def mark_user_write(user_id: int):
+    """Отмечает запись пользователя: следующие READ_YOUR_WRITES_SECONDS его чтения идут в основную базу."""
+    if replica_session is None:
+        return
+    now = time.monotonic()
+    if len(_recent_writers) >= _MAX_RECENT_WRITERS:
+        for key in [key for key, until in _recent_writers.items() if until <= now]:
+            del _recent_writers[key]
+    _recent_writers[user_id] = now + READ_YOUR_WRITES_SECONDS
+
+def read_session_factory(user_id: Optional[int] = None):
+    """Фабрика сессий для чтения: реплика, если она есть и пользователь недавно ничего не записывал."""
+    if replica_session is None:
+        return async_session
+    if user_id is not None:
+        until = _recent_writers.get(user_id)
+        if until is not None:
+            if until > time.monotonic():
+                metrics.db_reads.inc(target="primary")
+                return async_session
+            _recent_writers.pop(user_id, None)
+    metrics.db_reads.inc(target="replica")
+    return replica_session
+
+def _request_user_id(request: Request) -> Optional[int]:
+    try:
+        return int(request.query_params["user_id"])
+    except (KeyError, ValueError):
+        return None
+
+async def get_read_db(request: Request):
+    """
+    Сессия только для чтения (зависимость FastAPI): реплика, если она
+    настроена, иначе основная база. user_id берётся из параметров запроса
+    для read-your-writes.
+
+    Yields:
+        AsyncSession: Сессия базы данных
+    """
+    async with read_session_factory(_request_user_id(request))() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+@asynccontextmanager
+async def get_read_db_context(user_id: Optional[int] = None):
+    """
+    Как get_read_db, но вне зависимостей FastAPI (например, для потоковой выгрузки).
+
+    Yields:
+        AsyncSession: Сессия базы данных
+    """
+    async with read_session_factory(user_id)() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
@@ -0,0 +1,286 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+from typing import Callable, Dict, Optional, Set
+from urllib.parse import urlparse
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Интервал комментариев-пингов, чтобы прокси не закрывали простаивающие соединения
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get("EVENTS_HEARTBEAT_SECONDS", "25"))
+# Сколько кадров может накопиться у медленного клиента, прежде чем его попросят перечитать список
+EVENTS_QUEUE_SIZE = int(os.environ.get("EVENTS_QUEUE_SIZE", "100"))
+# Адрес брокера для рассылки между процессами, например tcp://127.0.0.1:8765; без него — только в процессе
+EVENTS_BROKER_URL = os.environ.get("EVENTS_BROKER_URL")
+# Предел буфера записи брокера на одного клиента, после него клиент отключается
+BROKER_WRITE_BUFFER_LIMIT = 4 * 1024 * 1024
+
+RETRY_FRAME = b"retry: 5000\n\n"
+PING_FRAME = b": ping\n\n"
+RESYNC_FRAME = b"event: resync\ndata: {}\n\n"
+
+def _parse_address(url: str):
+    parsed = urlparse(url if "://" in url else f"tcp://{url}")
+    return parsed.hostname or "127.0.0.1", parsed.port or 8765
+
+def _frame(data: str) -> bytes:
+    return f"data: {data}\n\n".encode()
+
+class Subscriber:
+    """Одно SSE-соединение: очередь готовых кадров без отдельной задачи на соединение."""
+
+    __slots__ = ("user_id", "queue", "closed")
+
+    def __init__(self, user_id: int, maxsize: int):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize)
+        self.closed = False
+
+    def offer(self, frame: bytes):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # Клиент не успевает читать: выбрасываем накопленное и просим перечитать список
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC_FRAME)
+            self.queue.put_nowait(None)
+            self.closed = True
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+class BrokerLink:
+    """
+    Соединение процесса с брокером событий (python events.py).
+
+    Протокол — JSON по строке на сообщение. Брокер пересылает сообщение
+    всем остальным подключённым процессам. При обрыве соединение
+    восстанавливается, а локальным клиентам отправляется resync: события
+    других процессов за время разрыва потеряны.
+
+    Args:
+        url (str): Адрес брокера, tcp://host:port
+        on_message: вызывается для каждого сообщения от других процессов
+        on_reconnect: вызывается после восстановления соединения
+    """
+
+    def __init__(self, url: str, on_message: Callable[[dict], None], on_reconnect: Callable[[], None]):
+        self.host, self.port = _parse_address(url)
+        self.on_message = on_message
+        self.on_reconnect = on_reconnect
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._runner: Optional[asyncio.Task] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None
+
+    def start(self):
+        if self._runner is None:
+            self._runner = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+
+    def publish(self, message: dict):
+        if self._writer is None:
+            return
+        self._writer.write(json.dumps(message, ensure_ascii=False).encode() + b"\n")
+
+    async def _run(self):
+        delay = 1.0
+        connected_before = False
+        while True:
+            writer = None
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+                self._writer = writer
+                delay = 1.0
+                logger.info(f"Подключено к брокеру событий {self.host}:{self.port}")
+                if connected_before:
+                    self.on_reconnect()
+                connected_before = True
+                while line := await reader.readline():
+                    try:
+                        self.on_message(json.loads(line))
+                    except Exception as e:
+                        logger.error(f"Ошибка обработки сообщения брокера: {str(e)}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Брокер событий {self.host}:{self.port} недоступен: {str(e)}")
+            finally:
+                self._writer = None
+                if writer is not None:
+                    writer.close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+class EventHub:
+    """
+    Рассылка изменений задач подписчикам по user_id (server-sent events).
+
+    Метод on_task_change подписывается на изменения задач в crud. Кадр
+    кодируется один раз и раскладывается по очередям всех соединений
+    пользователя; пинги для всех соединений шлёт одна общая задача,
+    поэтому простаивающее соединение стоит одну очередь. Если задан
+    broker_url, события пересылаются остальным процессам через брокер.
+
+    Args:
+        serialize: превращает задачу в словарь для JSON
+        broker_url (str): Адрес брокера событий или None
+    """
+
+    def __init__(self, serialize: Callable[[object], dict], broker_url: Optional[str] = None,
+                 heartbeat: float = EVENTS_HEARTBEAT_SECONDS, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.serialize = serialize
+        self.heartbeat = heartbeat
+        self.queue_size = queue_size
+        self.published = 0
+        self._subscribers: Dict[int, Set[Subscriber]] = {}
+        self._link = BrokerLink(broker_url, self._on_remote, self.resync_all) if broker_url else None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._heartbeat_task is None:
+            self._heartbeat_task = loop.create_task(self._heartbeat())
+        if self._link is not None:
+            self._link.start()
+
+    async def stop(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
+        if self._link is not None:
+            await self._link.stop()
+        # Завершаем открытые потоки, иначе сервер будет ждать их при остановке
+        for subscribers in list(self._subscribers.values()):
+            for subscriber in list(subscribers):
+                subscriber.close()
+
+    def subscribe(self, user_id: int) -> Subscriber:
+        subscriber = Subscriber(user_id, self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._subscribers.get(subscriber.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[subscriber.user_id]
+
+    async def stream(self, user_id: int):
+        """Генератор кадров SSE для StreamingResponse; отписывается при разрыве соединения."""
+        subscriber = self.subscribe(user_id)
+        try:
+            yield RETRY_FRAME
+            while True:
+                frame = await subscriber.queue.get()
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            self.unsubscribe(subscriber)
+
+    def publish_local(self, user_id: int, frame: bytes):
+        for subscriber in list(self._subscribers.get(user_id, ())):
+            subscriber.offer(frame)
+
+    def resync_all(self):
+        for subscribers in list(self._subscribers.values()):
+            for subscriber in list(subscribers):
+                subscriber.offer(RESYNC_FRAME)
+
+    async def on_task_change(self, event: str, task, previous: Optional[dict] = None):
+        """Подписчик crud: отправляет изменение задачи всем соединениям её владельца."""
+        user_id = task.user_id
+        if user_id not in self._subscribers and not (self._link and self._link.connected):
+            return
+        try:
+            data = json.dumps({"type": event, "task": self.serialize(task)}, ensure_ascii=False)
+        except Exception as e:
+            logger.error(f"Ошибка сериализации события {event} задачи {task.id}: {str(e)}")
+            return
+        self.published += 1
+        self.publish_local(user_id, _frame(data))
+        if self._link is not None:
+            self._link.publish({"user_id": user_id, "data": data})
+
+    def _on_remote(self, message: dict):
+        self.publish_local(int(message["user_id"]), _frame(message["data"]))
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            for subscribers in list(self._subscribers.values()):
+                for subscriber in list(subscribers):
+                    # Если в очереди уже есть кадры, соединение и так не простаивает
+                    if subscriber.queue.empty():
+                        subscriber.offer(PING_FRAME)
+
+async def run_broker(url: str):
+    """
+    Локальный брокер событий для нескольких воркеров uvicorn: пересылает
+    каждую строку от одного процесса всем остальным.
+    """
+    host, port = _parse_address(url)
+    clients: Set[asyncio.StreamWriter] = set()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        clients.add(writer)
+        peer = writer.get_extra_info("peername")
+        logger.info(f"Процесс подключился к брокеру: {peer}")
+        try:
+            while line := await reader.readline():
+                for other in list(clients):
+                    if other is writer:
+                        continue
+                    if other.transport.get_write_buffer_size() > BROKER_WRITE_BUFFER_LIMIT:
+                        logger.warning("Процесс не успевает читать события, отключаю")
+                        clients.discard(other)
+                        other.close()
+                        continue
+                    other.write(line)
+        except Exception as e:
+            logger.warning(f"Соединение с {peer} прервано: {str(e)}")
+        finally:
+            clients.discard(writer)
+            writer.close()
+            logger.info(f"Процесс отключился от брокера: {peer}")
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Брокер событий слушает {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    url = sys.argv[1] if len(sys.argv) > 1 else (EVENTS_BROKER_URL or "tcp://127.0.0.1:8765")
+    try:
+        asyncio.run(run_broker(url))
+    except KeyboardInterrupt:
+        logger.info("Брокер событий остановлен")
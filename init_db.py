@@ -3,6 +3,7 @@ import logging
 import sys
 import os
 from database import engine
+from migrations import migrate
 from models import Base
 
 # Настройка логирования
@@ -14,22 +15,22 @@ logger = logging.getLogger(__name__)
 
 async def init_db(drop_all=False):
     """
-    Инициализирует базу данных, создавая или пересоздавая таблицы.
+    Инициализирует базу данных: создаёт схему или выполняет недостающие
+    миграции (migrations.py). Запускается один раз перед стартом процессов
+    приложения, сами процессы только проверяют версию схемы.
     
     Args:
         drop_all (bool): Если True, все существующие таблицы будут удалены перед созданием новых.
     """
     try:
-        async with engine.begin() as conn:
-            if drop_all:
+        if drop_all:
+            async with engine.begin() as conn:
                 logger.warning("Сбрасываю все таблицы базы данных!")
                 await conn.run_sync(Base.metadata.drop_all)
                 logger.info("Все таблицы успешно удалены")
-            
-            # Создаем таблицы
-            await conn.run_sync(Base.metadata.create_all)
-            logger.info("Таблицы базы данных успешно созданы с поддержкой временных зон")
         
+        version = await migrate(engine)
+        logger.info(f"База данных готова, версия схемы {version}")
         return True
     except Exception as e:
         logger.error(f"Ошибка при инициализации базы данных: {str(e)}")
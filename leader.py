@@ -0,0 +1,81 @@
+import logging
+import zlib
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class LeaderElection:
+    """
+    Выбор единственного лидера среди процессов через advisory lock Postgres.
+
+    Лидер держит pg_try_advisory_lock на отдельном соединении; при обрыве
+    соединения Postgres снимает блокировку сам, и лидером становится другой
+    процесс при следующей попытке. Для баз без advisory lock (SQLite)
+    каждый процесс считается лидером — от дублей тогда защищает захват строк
+    в crud.claim_due_reminders.
+
+    Args:
+        engine (AsyncEngine): Движок базы данных
+        name (str): Имя блокировки, из него вычисляется числовой ключ
+    """
+
+    def __init__(self, engine: AsyncEngine, name: str):
+        self.engine = engine
+        self.name = name
+        self.key = zlib.crc32(name.encode())
+        self._conn = None
+
+    @property
+    def supported(self) -> bool:
+        return self.engine.dialect.name == "postgresql"
+
+    @property
+    def is_leader(self) -> bool:
+        return self._conn is not None or not self.supported
+
+    async def try_acquire(self) -> bool:
+        """Пытается стать лидером (или подтверждает, что лидерство не потеряно)."""
+        if not self.supported:
+            return True
+        if self._conn is not None:
+            try:
+                await self._conn.execute(text("SELECT 1"))
+                await self._conn.commit()
+                return True
+            except Exception as e:
+                logger.warning(f"Соединение лидера '{self.name}' потеряно: {str(e)}")
+                await self._drop_connection()
+        conn = await self.engine.connect()
+        try:
+            acquired = await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key})
+            # Закрываем неявную транзакцию, блокировка уровня сессии при этом сохраняется
+            await conn.commit()
+        except Exception:
+            await conn.close()
+            raise
+        if not acquired:
+            await conn.close()
+            return False
+        self._conn = conn
+        logger.info(f"Процесс стал лидером '{self.name}'")
+        return True
+
+    async def release(self):
+        if self._conn is None:
+            return
+        try:
+            await self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+            await self._conn.commit()
+        except Exception as e:
+            logger.warning(f"Не удалось снять блокировку '{self.name}': {str(e)}")
+        await self._drop_connection()
+        logger.info(f"Процесс больше не лидер '{self.name}'")
+
+    async def _drop_connection(self):
+        try:
+            await self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
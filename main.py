@@ -1,21 +1,47 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from database import get_db, engine
-from models import Base
-from crud import get_tasks, create_task, delete_task, update_task
+from database import (get_db, get_db_context, get_read_db, get_read_db_context, engine, replica_engine, dispose_engines,
+                      mark_user_write, pool_stats, warm_pool, WEB_CONCURRENCY)
+from models import Task
+from migrations import ensure_schema
+from crud import (get_tasks_page, create_task, delete_task, update_task, add_task_listener,
+                  create_tasks_bulk, update_tasks_bulk, delete_tasks_bulk, get_task_changes,
+                  get_task_calendar, get_user_settings, update_user_settings, add_settings_listener,
+                  set_occurrence_completed, MAX_REMINDER_LEAD, MIN_REMINDER_TIME, parse_deadline)
+from cache import create_task_cache, SettingsCache
+from write_behind import WriteBehindQueue, WRITE_BEHIND_MODE
+from events import EventHub, EVENTS_BROKER_URL
+from ratelimit import RateLimitMiddleware, create_rate_limiter
+from search import search_tasks
+from singleflight import SingleFlight, SingleFlightMiddleware, SINGLE_FLIGHT_ENABLED
+from task_io import EXPORT_FORMATS, export_chunks, import_tasks, iter_csv, iter_ndjson
 from pydantic import BaseModel, Field
-from typing import Optional, List
-from datetime import datetime, date
+from typing import Optional, List, Literal
+from datetime import datetime, date, timedelta
 from enum import StrEnum
 from contextlib import asynccontextmanager
-from reminders import start_scheduler
 import logging
+import os
+import random
+import time
+import metrics
+import serialization
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# worker (по умолчанию) — только API, напоминания отправляет отдельный процесс `python reminders.py`;
+# embedded — напоминания запускаются внутри API (лидер выбирается среди воркеров uvicorn),
+# тогда каждый воркер загружает Telegram и APScheduler и держит соединение для выбора лидера;
+# off — API без напоминаний и без отдельного процесса (тесты, бенчмарки)
+REMINDER_MODE = os.environ.get("REMINDER_MODE", "worker")
+
+# Доля запросов, которые пишутся в лог (0 — только ошибки 5xx, 1 — все запросы)
+REQUEST_LOG_SAMPLE_RATE = float(os.environ.get("REQUEST_LOG_SAMPLE_RATE", "0"))
+
 class Priority(StrEnum):
     HIGH = "High"
     MEDIUM = "Medium"
@@ -28,6 +54,10 @@ class TaskCreate(BaseModel):
     priority: Priority = Priority.MEDIUM
     reminder: bool = False
     completed: bool = False
+    recurrence: Optional[Literal["daily", "weekly", "monthly"]] = Field(
+        None, description="Повторять задачу; deadline — первое вхождение")
+    recurrence_interval: Optional[int] = Field(None, ge=1, le=365, description="Каждые N дней, недель или месяцев")
+    recurrence_until: Optional[str] = Field(None, description="Последний возможный момент вхождения")
 
 class TaskOut(BaseModel):
     id: int
@@ -39,6 +69,9 @@ class TaskOut(BaseModel):
     completed: bool
     created_at: datetime
     user_id: int
+    recurrence: Optional[str] = None
+    recurrence_interval: Optional[int] = None
+    recurrence_until: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -50,25 +83,176 @@ class TaskUpdate(BaseModel):
     priority: Optional[Priority] = None
     reminder: Optional[bool] = None
     completed: Optional[bool] = None
+    recurrence: Optional[Literal["daily", "weekly", "monthly"]] = None
+    recurrence_interval: Optional[int] = Field(None, ge=1, le=365)
+    recurrence_until: Optional[str] = None
+
+class TaskBatchUpdateItem(TaskUpdate):
+    id: int
+
+class TaskBatchCreate(BaseModel):
+    tasks: List[TaskCreate] = Field(..., max_length=500)
+
+class TaskBatchUpdate(BaseModel):
+    tasks: List[TaskBatchUpdateItem] = Field(..., max_length=500)
+
+class TaskBatchDelete(BaseModel):
+    ids: List[int] = Field(..., max_length=500)
+
+class BatchItemResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    status: str
+    error: Optional[str] = None
+    task: Optional[TaskOut] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchItemResult]
+
+class DeletedTaskOut(BaseModel):
+    id: int
+    deleted_at: datetime
+
+class TaskChanges(BaseModel):
+    tasks: List[TaskOut]
+    deleted: List[DeletedTaskOut]
+    cursor: str
+    has_more: bool
+    reset: bool
+
+class ImportLineError(BaseModel):
+    line: int
+    error: str
+
+class ImportResponse(BaseModel):
+    created: int
+    error_count: int
+    errors: List[ImportLineError]
+
+class OccurrenceUpdate(BaseModel):
+    occurrence: datetime = Field(..., description="Момент вхождения, как deadline в списке задач")
+    completed: bool = True
+
+class OccurrenceOut(BaseModel):
+    task_id: int
+    occurrence: datetime
+    completed: bool
+
+    class Config:
+        from_attributes = True
+
+class SettingsOut(BaseModel):
+    timezone: str
+    reminder_time: int
+    reminder_enabled: bool
+
+class SettingsUpdate(BaseModel):
+    timezone: Optional[str] = Field(None, description="Часовой пояс IANA, например Europe/Moscow")
+    reminder_time: Optional[int] = Field(None, ge=MIN_REMINDER_TIME, le=int(MAX_REMINDER_LEAD.total_seconds() // 60),
+                                         description="За сколько минут до дедлайна напоминать")
+    reminder_enabled: Optional[bool] = None
+
+class CalendarDay(BaseModel):
+    date: date
+    total: int
+    completed: int
 
 class HealthResponse(BaseModel):
     status: str
     database: str
 
+# Колонки ответа TaskOut: списки задач выбираются строками и кодируются в JSON напрямую,
+# минуя ORM-объекты и валидацию Pydantic; response_model остаётся только для схемы OpenAPI
+TASK_OUT_FIELDS = tuple(TaskOut.model_fields)
+TASK_OUT_COLUMNS = tuple(getattr(Task, name) for name in TASK_OUT_FIELDS)
+
+def json_response(content, headers: Optional[dict] = None, status_code: int = 200) -> Response:
+    return Response(serialization.dumps(content), status_code=status_code, media_type="application/json",
+                    headers=headers)
+
+# Настройки пользователей (часовой пояс и напоминания) без запроса к БД на каждый вызов
+settings_cache = SettingsCache(get_user_settings)
+add_settings_listener(settings_cache.invalidate)
+
+async def user_timezone(db: AsyncSession, user_id: int) -> str:
+    return (await settings_cache.get(db, user_id))["timezone"]
+
+async def load_task_list(db: AsyncSession, user_id: int, day: Optional[date]) -> list:
+    tz = await user_timezone(db, user_id) if day else None
+    rows, _ = await get_tasks_page(db, user_id=user_id, date=day, columns=TASK_OUT_COLUMNS, tz=tz)
+    return serialization.rows_to_dicts(rows, TASK_OUT_FIELDS)
+
+# Кэш списков задач по (user_id, date); сбрасывается при записи через подписку на crud
+task_cache = create_task_cache(load_task_list, workers=WEB_CONCURRENCY)
+if task_cache:
+    add_task_listener(task_cache.invalidate)
+    for counter in ("hits", "misses", "evictions", "invalidations"):
+        metrics.registry.gauge(f"task_cache_{counter}", f"Кэш задач: {counter}").set_function(
+            lambda counter=counter: task_cache.stats()[counter]
+        )
+
+    async def drop_days_on_timezone_change(user_id: int, settings: dict, previous: dict):
+        # Ключи по дням посчитаны в прежнем часовом поясе
+        if settings["timezone"] != previous["timezone"]:
+            await task_cache.invalidate_user(user_id)
+
+    add_settings_listener(drop_days_on_timezone_change)
+
+# Поток изменений задач для клиентов (SSE); между воркерами — через брокер events.py
+event_hub = EventHub(lambda task: TaskOut.model_validate(task).model_dump(mode="json"), EVENTS_BROKER_URL)
+add_task_listener(event_hub.on_task_change)
+
+# После записи чтения пользователя какое-то время идут в основную базу, а не в реплику
+add_task_listener(lambda event, task, previous=None: mark_user_write(task.user_id))
+add_settings_listener(lambda user_id, settings, previous: mark_user_write(user_id))
+
+async def flush_task_updates(user_id: int, items: List[dict]) -> List[dict]:
+    async with get_db_context() as db:
+        return await update_tasks_bulk(db, user_id=user_id, items=items,
+                                       settings=await settings_cache.get(db, user_id))
+
+# Очередь PATCH /tasks/{id} с объединением изменений одной задачи (WRITE_BEHIND_MODE, по умолчанию выключена)
+write_behind = WriteBehindQueue(flush_task_updates) if WRITE_BEHIND_MODE != "off" else None
+if write_behind is not None:
+    metrics.registry.gauge("write_behind_pending", "Задачи с изменениями в очереди").set_function(
+        lambda: len(write_behind))
+# Одинаковые одновременные чтения выполняются один раз; после записи пользователя — заново
+single_flight = SingleFlight() if SINGLE_FLIGHT_ENABLED else None
+if single_flight is not None:
+    add_task_listener(single_flight.on_task_change)
+    add_settings_listener(single_flight.on_settings_change)
+    metrics.registry.gauge("single_flight_in_flight", "Выполняющиеся объединяемые запросы").set_function(
+        lambda: len(single_flight))
+rate_limiter = create_rate_limiter()
+metrics.registry.gauge("task_event_subscribers", "Открытые потоки событий задач").set_function(lambda: len(event_hub))
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Схему создаёт и мигрирует init_db.py, здесь только проверяется её версия
     try:
-        async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
-        logger.info("Таблицы базы данных успешно созданы")
+        await ensure_schema(engine)
     except Exception as e:
-        logger.error(f"Ошибка при создании таблиц базы данных: {str(e)}")
+        logger.error(f"Ошибка при проверке схемы базы данных: {str(e)}")
         raise
+    await warm_pool()
     
-    scheduler = start_scheduler()  # Запускаем планировщик
+    event_hub.start()
+    if write_behind is not None:
+        write_behind.start()
+    reminders = None
+    if REMINDER_MODE == "embedded":
+        # Telegram и APScheduler загружаются только там, где работают напоминания
+        import reminders
+        reminders.start_scheduler()  # Запускаем планировщик
     yield
+    # Изменения из очереди записываются до закрытия соединений с базой
+    if write_behind is not None:
+        await write_behind.stop()
+    await event_hub.stop()
     # Останавливаем планировщик при завершении работы приложения
-    scheduler.shutdown()
+    if reminders is not None:
+        await reminders.stop_scheduler()
+    await dispose_engines()
 
 app = FastAPI(
     title="Task Manager API",
@@ -77,32 +261,87 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Порядок снаружи внутрь: метрики, CORS, ограничение частоты, объединение чтений.
+# Ответ 429 получает заголовки CORS и попадает в метрики запросов
+app.add_middleware(SingleFlightMiddleware, flights=single_flight,
+                   paths=("/tasks", "/tasks/search", "/tasks/calendar", "/settings"))
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter, exempt_paths=("/health", "/metrics"))
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
-    allow_methods=["GET", "POST", "DELETE", "OPTIONS", "PATCH"],
+    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
     allow_headers=["Content-Type", "Authorization"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = datetime.now()
-    logger.info(f"Получен запрос: {request.method} {request.url}")
-    response = await call_next(request)
-    process_time = datetime.now() - start_time
-    logger.info(f"Ответ: статус {response.status_code}, время обработки: {process_time.total_seconds():.3f}s")
-    return response
+# Длинные потоки событий не попадают в метрики задержек, их число видно в task_event_subscribers
+UNTRACKED_PATHS = {"/tasks/events"}
+
+class RequestMetricsMiddleware:
+    """
+    Метрики и выборочный лог HTTP-запросов.
+
+    Написан как чистое ASGI-middleware, а не через @app.middleware: тот
+    оборачивает каждый ответ в промежуточный поток с отдельной задачей,
+    что заметно для тысяч одновременно открытых потоков событий.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in UNTRACKED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        start_time = time.perf_counter()
+        metrics.http_in_flight.inc()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            process_time = time.perf_counter() - start_time
+            metrics.http_in_flight.dec()
+            method = scope["method"]
+            # Шаблон маршрута (/tasks/{task_id}), а не сам путь — иначе метки не агрегируются
+            route = getattr(scope.get("route"), "path", "unmatched")
+            metrics.http_requests.inc(method=method, route=route, status=status)
+            metrics.http_latency.observe(process_time, method=method, route=route)
+            if status >= 500 or (REQUEST_LOG_SAMPLE_RATE and random.random() < REQUEST_LOG_SAMPLE_RATE):
+                logger.info(f"{method} {scope['path']} -> {status}, время обработки: {process_time:.3f}s")
+
+app.add_middleware(RequestMetricsMiddleware)
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["System"])
+async def read_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/health", response_model=HealthResponse, tags=["System"])
-async def health_check(db: AsyncSession = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_db), read_db: AsyncSession = Depends(get_read_db)):
     try:
         await db.execute(select(1))
+        if replica_engine is not None:
+            await read_db.execute(select(1))
         return {"status": "healthy", "database": "connected"}
     except Exception as e:
         logger.error(f"Ошибка проверки состояния: {str(e)}")
         raise HTTPException(status_code=500, detail="Ошибка проверки состояния")
 
+@app.get("/db/pool", tags=["System"])
+async def db_pool():
+    return pool_stats()
+
+@app.get("/cache/stats", tags=["System"])
+async def cache_stats():
+    return task_cache.stats() if task_cache else {"backend": None}
+
 @app.get("/", tags=["General"])
 async def root():
     return {"message": "Добро пожаловать в Task Manager! Используйте /tasks для списка задач."}
@@ -111,15 +350,211 @@ async def root():
 async def read_tasks(
     user_id: int, 
     date: Optional[date] = None, 
-    db: AsyncSession = Depends(get_db)
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Размер страницы; без него возвращаются все задачи"),
+    cursor: Optional[str] = Query(None, description="Курсор из заголовка X-Next-Cursor предыдущей страницы"),
+    completed: Optional[bool] = None,
+    priority: Optional[Priority] = None,
+    deadline_from: Optional[datetime] = None,
+    deadline_to: Optional[datetime] = None,
+    sort: Literal["deadline", "created_at"] = "deadline",
+    order: Literal["asc", "desc"] = "asc",
+    db: AsyncSession = Depends(get_read_db)
 ):
     try:
-        tasks = await get_tasks(db, user_id=user_id, date=date)
-        return tasks
+        # Обычный запрос фронтенда (весь список или один день) обслуживается из кэша
+        plain = limit is None and cursor is None and completed is None and priority is None \
+            and deadline_from is None and deadline_to is None and sort == "deadline" and order == "asc"
+        if plain and task_cache:
+            return json_response(await task_cache.get_tasks(db, user_id, date))
+
+        rows, next_cursor = await get_tasks_page(
+            db,
+            user_id=user_id,
+            limit=limit,
+            cursor=cursor,
+            sort=sort,
+            order=order,
+            date=date,
+            completed=completed,
+            priority=priority,
+            deadline_from=deadline_from,
+            deadline_to=deadline_to,
+            columns=TASK_OUT_COLUMNS,
+            # Часовой пояс нужен и для вхождений повторяющихся задач в диапазоне дедлайнов
+            tz=await user_timezone(db, user_id) if date or (deadline_from and deadline_to) else None
+        )
+        return json_response(
+            serialization.rows_to_dicts(rows, TASK_OUT_FIELDS),
+            headers={"X-Next-Cursor": next_cursor} if next_cursor else None
+        )
+    except ValueError as ve:
+        logger.error(f"Ошибка валидации в read_tasks: {str(ve)}")
+        raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         logger.error(f"Ошибка в read_tasks: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Не удалось получить задачи: {str(e)}")
 
+@app.get("/settings", response_model=SettingsOut, tags=["Settings"])
+async def read_settings(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    try:
+        return await settings_cache.get(db, user_id)
+    except Exception as e:
+        logger.error(f"Ошибка в read_settings: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Не удалось получить настройки: {str(e)}")
+
+@app.put("/settings", response_model=SettingsOut, tags=["Settings"])
+async def update_settings(settings: SettingsUpdate, user_id: int, db: AsyncSession = Depends(get_db)):
+    try:
+        return await update_user_settings(db, user_id=user_id, **settings.model_dump(exclude_unset=True))
+    except ValueError as ve:
+        logger.error(f"Ошибка валидации в update_settings: {str(ve)}")
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        logger.error(f"Ошибка в update_settings: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Не удалось обновить настройки: {str(e)}")
+
+@app.get("/tasks/search", response_model=List[TaskOut], tags=["Tasks"])
+async def search_user_tasks(
+    user_id: int,
+    q: str = Query(..., min_length=1, max_length=200, description="Слова для поиска в заголовке и описании"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Курсор из заголовка X-Next-Cursor предыдущей страницы"),
+    completed: Optional[bool] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Полнотекстовый поиск задач, самые релевантные первыми."""
+    try:
+        rows, next_cursor = await search_tasks(db, user_id=user_id, q=q, limit=limit, cursor=cursor,
+                                               completed=completed, columns=TASK_OUT_COLUMNS)
+        return json_response(
+            serialization.rows_to_dicts(rows, TASK_OUT_FIELDS),
+            headers={"X-Next-Cursor": next_cursor} if next_cursor else None
+        )
+    except ValueError as ve:
+        logger.error(f"Ошибка валидации в search_user_tasks: {str(ve)}")
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        logger.error(f"Ошибка в search_user_tasks: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Не удалось выполнить поиск задач: {str(e)}")
+
+@app.get("/tasks/calendar", response_model=List[CalendarDay], tags=["Tasks"])
+async def read_task_calendar(
+    user_id: int,
+    month: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$", description="Месяц в формате YYYY-MM"),
+    start: Optional[date] = Query(None, description="Начало диапазона (вместо month), например для недели"),
+    end: Optional[date] = Query(None, description="Конец диапазона, не включительно"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Число задач по дням месяца или диапазона в часовом поясе пользователя — одним запросом."""
+    try:
+        if month:
+            start = date.fromisoformat(f"{month}-01")
+            end = (start + timedelta(days=32)).replace(day=1)
+        if start is None or end is None:
+            raise ValueError("Укажите month или start и end")
+        if not timedelta(0) < end - start <= timedelta(days=62):
+            raise ValueError("Диапазон должен быть от 1 до 62 дней")
+        return await get_task_calendar(db, user_id=user_id, start=start, end=end,
+                                       tz=await user_timezone(db, user_id))
+    except ValueError as ve:
+        logger.error(f"Ошибка валидации в read_task_calendar: {str(ve)}")
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        logger.error(f"Ошибка в read_task_calendar: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Не удалось получить календарь задач: {str(e)}")
+
+@app.get("/tasks/events", tags=["Tasks"])
+async def task_events(user_id: int):
+    """
+    Поток server-sent events с изменениями задач пользователя.
+
+    Каждое событие — JSON {"type": "created"|"updated"|"deleted", "task": {...}}.
+    Событие resync означает, что часть изменений могла быть пропущена
+    и список нужно перечитать.
+    """
+    return StreamingResponse(
+        event_hub.stream(user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/tasks/changes", response_model=TaskChanges, tags=["Tasks"])
+async def read_task_changes(
+    user_id: int,
+    since: Optional[str] = Query(None, description="Курсор из предыдущего ответа; без него — полный список"),
+    limit: int = Query(500, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Инкрементальная синхронизация: задачи, созданные или изменённые после
+    курсора, и id удалённых. Пока has_more=true, запрос повторяют с новым
+    курсором; reset=true означает, что клиент должен заменить список целиком.
+    """
+    # Читается из основной базы: курсор последней страницы сдвигается до
+    # now - SYNC_CLOCK_SKEW, и отставшая реплика потеряла бы изменения
+    try:
+        return await get_task_changes(db, user_id=user_id, since=since, limit=limit)
+    except ValueError as ve:
+        logger.error(f"Ошибка валидации в read_task_changes: {str(ve)}")
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        logger.error(f"Ошибка в read_task_changes: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Не удалось получить изменения задач: {str(e)}")
+
+@app.get("/tasks/export", tags=["Tasks"])
+async def export_tasks(user_id: int, format: Literal["ndjson", "csv"] = "ndjson"):
+    """
+    Выгрузка всех задач пользователя в NDJSON или CSV потоком.
+
+    Строки читаются серверным курсором пачками, поэтому память не зависит
+    от числа задач. Сессия открывается внутри генератора: зависимость
+    get_db закрывается до начала отправки потокового ответа.
+    """
+    async def body():
+        async with get_read_db_context(user_id) as db:
+            try:
+                async for chunk in export_chunks(db, user_id, format):
+                    yield chunk
+            except Exception as e:
+                logger.error(f"Ошибка в export_tasks для user_id={user_id}: {str(e)}")
+                raise
+
+    return StreamingResponse(
+        body(),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="tasks-{user_id}.{format}"'},
+    )
+
+@app.post(
+    "/tasks/import",
+    response_model=ImportResponse,
+    tags=["Tasks"],
+    openapi_extra={"requestBody": {"required": True, "content": {
+        media_type.split(";")[0]: {"schema": {"type": "string"}} for media_type in EXPORT_FORMATS.values()
+    }}},
+)
+async def import_tasks_endpoint(
+    request: Request,
+    user_id: int,
+    format: Optional[Literal["ndjson", "csv"]] = Query(None, description="По умолчанию определяется по Content-Type"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Загрузка задач из выгрузки /tasks/export. Тело читается потоком и
+    вставляется пачками; строки с ошибками пропускаются и перечисляются в ответе.
+    """
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    records = iter_csv(request.stream()) if format == "csv" else iter_ndjson(request.stream())
+    try:
+        return await import_tasks(db, user_id=user_id, records=records)
+    except ValueError as ve:
+        logger.error(f"Ошибка валидации в import_tasks_endpoint: {str(ve)}")
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        logger.error(f"Ошибка в import_tasks_endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Не удалось загрузить задачи: {str(e)}")
+
 @app.post("/tasks", response_model=TaskOut, tags=["Tasks"])
 async def create_new_task(
     task: TaskCreate, 
@@ -135,7 +570,11 @@ async def create_new_task(
             deadline=task.deadline,
             priority=task.priority,
             reminder=task.reminder,
-            completed=task.completed
+            completed=task.completed,
+            settings=await settings_cache.get(db, user_id),
+            recurrence=task.recurrence,
+            recurrence_interval=task.recurrence_interval,
+            recurrence_until=task.recurrence_until
         )
         return new_task
     except ValueError as ve:
@@ -145,6 +584,52 @@ async def create_new_task(
         logger.error(f"Ошибка в create_new_task: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Не удалось создать задачу: {str(e)}")
 
+# Пакетные операции объявлены до /tasks/{task_id}, чтобы "batch" не разбирался как task_id
+@app.post("/tasks/batch", response_model=BatchResponse, tags=["Tasks"])
+async def create_tasks_batch(
+    batch: TaskBatchCreate,
+    user_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        results = await create_tasks_bulk(db, user_id=user_id, items=[task.model_dump() for task in batch.tasks],
+                                          settings=await settings_cache.get(db, user_id))
+        return {"results": results}
+    except Exception as e:
+        logger.error(f"Ошибка в create_tasks_batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Не удалось создать задачи: {str(e)}")
+
+@app.patch("/tasks/batch", response_model=BatchResponse, tags=["Tasks"])
+async def update_tasks_batch(
+    batch: TaskBatchUpdate,
+    user_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        results = await update_tasks_bulk(
+            db,
+            user_id=user_id,
+            items=[task.model_dump(exclude_unset=True) | {"id": task.id} for task in batch.tasks],
+            settings=await settings_cache.get(db, user_id)
+        )
+        return {"results": results}
+    except Exception as e:
+        logger.error(f"Ошибка в update_tasks_batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Не удалось обновить задачи: {str(e)}")
+
+@app.delete("/tasks/batch", response_model=BatchResponse, tags=["Tasks"])
+async def delete_tasks_batch(
+    batch: TaskBatchDelete,
+    user_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        results = await delete_tasks_bulk(db, user_id=user_id, task_ids=batch.ids)
+        return {"results": results}
+    except Exception as e:
+        logger.error(f"Ошибка в delete_tasks_batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Не удалось удалить задачи: {str(e)}")
+
 @app.delete("/tasks/{task_id}", tags=["Tasks"])
 async def delete_task_endpoint(
     task_id: int, 
@@ -156,30 +641,78 @@ async def delete_task_endpoint(
         if not task:
             raise HTTPException(status_code=404, detail="Задача не найдена или не принадлежит пользователю")
         return {"message": "Задача удалена", "id": task_id}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Ошибка в delete_task_endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Не удалось удалить задачу: {str(e)}")
 
-@app.patch("/tasks/{task_id}", response_model=TaskOut, tags=["Tasks"])
+@app.patch(
+    "/tasks/{task_id}",
+    response_model=TaskOut,
+    tags=["Tasks"],
+    responses={202: {"description": "WRITE_BEHIND_MODE=buffered: изменение принято в очередь, но ещё не записано"}},
+)
 async def update_task_endpoint(
     task_id: int, 
     task_update: TaskUpdate, 
     user_id: int, 
     db: AsyncSession = Depends(get_db)
 ):
+    """
+    Обновление задачи. С WRITE_BEHIND_MODE=durable изменение проходит через
+    очередь и ответ приходит после коммита пачки; с buffered — сразу 202,
+    и изменение может быть потеряно при аварийной остановке процесса.
+    """
     try:
-        task = await update_task(
-            db, 
-            user_id=user_id, 
-            task_id=task_id, 
-            **task_update.model_dump(exclude_unset=True)
-        )
+        values = task_update.model_dump(exclude_unset=True)
+        if write_behind is not None and values:
+            # Ошибку в дедлайне клиент должен получить сразу, а не потерять в очереди
+            parse_deadline(values.get("deadline"))
+            parse_deadline(values.get("recurrence_until"))
+            if WRITE_BEHIND_MODE == "buffered":
+                write_behind.submit(user_id, task_id, values, wait=False)
+                return json_response({"id": task_id, "status": "queued"}, status_code=202)
+            task = await write_behind.submit(user_id, task_id, values)
+        else:
+            task = await update_task(
+                db, 
+                user_id=user_id, 
+                task_id=task_id, 
+                settings=await settings_cache.get(db, user_id),
+                **values
+            )
         if not task:
             raise HTTPException(status_code=404, detail="Задача не найдена или не принадлежит пользователю")
         return task
+    except HTTPException:
+        raise
     except ValueError as ve:
         logger.error(f"Ошибка валидации в update_task_endpoint: {str(ve)}")
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         logger.error(f"Ошибка в update_task_endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Не удалось обновить задачу: {str(e)}")
+
+@app.put("/tasks/{task_id}/occurrences", response_model=OccurrenceOut, tags=["Tasks"])
+async def update_task_occurrence(
+    task_id: int,
+    body: OccurrenceUpdate,
+    user_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """Отметка о выполнении одного вхождения повторяющейся задачи."""
+    try:
+        row = await set_occurrence_completed(db, user_id=user_id, task_id=task_id, occurrence=body.occurrence,
+                                             completed=body.completed, settings=await settings_cache.get(db, user_id))
+        if row is None:
+            raise HTTPException(status_code=404, detail="Задача не найдена или не принадлежит пользователю")
+        return row
+    except HTTPException:
+        raise
+    except ValueError as ve:
+        logger.error(f"Ошибка валидации в update_task_occurrence: {str(ve)}")
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        logger.error(f"Ошибка в update_task_occurrence: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Не удалось отметить вхождение задачи: {str(e)}")
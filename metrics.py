@@ -0,0 +1,233 @@
+import bisect
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, в секундах
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def header(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self):
+        yield from self.header()
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.label_names, key)} {value}"
+
+class Gauge(_Metric):
+    """Значение, которое может расти и падать; можно задать функцию, вычисляемую при сборе."""
+
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self):
+        yield from self.header()
+        if self._function is not None:
+            try:
+                yield f"{self.name} {self._function()}"
+            except Exception as e:
+                logger.error(f"Ошибка при вычислении метрики {self.name}: {str(e)}")
+            return
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.label_names, key)} {value}"
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def total(self, **labels) -> float:
+        entry = self._values.get(self._key(labels))
+        return entry[1] if entry else 0.0
+
+    def collect(self):
+        yield from self.header()
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.label_names, key, 'le="' + le + '"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, key)} {total}"
+            yield f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}"
+
+class Registry:
+    """
+    Реестр метрик процесса и вывод в текстовом формате Prometheus.
+
+    Метрики живут в памяти процесса: при нескольких воркерах uvicorn
+    каждый отдаёт свои значения.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# HTTP
+http_requests = registry.counter("http_requests_total", "Количество HTTP-запросов", ("method", "route", "status"))
+http_latency = registry.histogram("http_request_duration_seconds", "Время обработки HTTP-запроса",
+                                  ("method", "route"))
+http_in_flight = registry.gauge("http_requests_in_flight", "HTTP-запросы в обработке")
+
+# База данных
+db_query_latency = registry.histogram("db_query_duration_seconds", "Время выполнения SQL-запроса", ("operation",))
+db_pool_wait = registry.histogram("db_pool_checkout_seconds", "Ожидание соединения из пула")
+db_reads = registry.counter("db_reads_total", "Сессии чтения по базе назначения", ("target",))
+db_pool_timeouts = registry.counter("db_pool_timeouts_total", "Соединение из пула не получено за pool_timeout")
+
+# Напоминания
+reminder_delivery_latency = registry.histogram("reminder_delivery_duration_seconds",
+                                               "Длительность доставки пачки напоминаний", ("trigger",),
+                                               buckets=DEFAULT_BUCKETS + (30.0, 60.0, 300.0))
+reminders_sent = registry.counter("reminders_sent_total", "Отправленные напоминания")
+reminders_failed = registry.counter("reminders_failed_total", "Напоминания, которые не удалось отправить")
+reminder_backlog = registry.gauge("reminder_timer_backlog", "Напоминания в очереди таймера")
+
+def instrument_engine(engine):
+    """
+    Подключает к движку SQLAlchemy замеры времени SQL-запросов и ожидания
+    соединения из пула.
+    """
+    from sqlalchemy import event
+
+    sync_engine = engine.sync_engine
+
+    # Запросы на одном соединении не вложены, поэтому хватает одного значения. Если запрос
+    # упал, after_cursor_execute не вызывается — отметку убирает handle_error
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_start"] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("query_start", None)
+        if started is None:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        db_query_latency.observe(time.perf_counter() - started, operation=operation)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _on_error(context):
+        if context.connection is not None:
+            context.connection.info.pop("query_start", None)
+
+    # У пула нет события «начало ожидания», поэтому оборачиваем Pool.connect
+    from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+    pool = sync_engine.pool
+    connect = pool.connect
+
+    def _timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        except PoolTimeout:
+            db_pool_timeouts.inc()
+            raise
+        finally:
+            db_pool_wait.observe(time.perf_counter() - started)
+
+    pool.connect = _timed_connect
@@ -0,0 +1,205 @@
+import logging
+import os
+import zlib
+from datetime import datetime, timezone
+
+from sqlalchemy import bindparam, delete, func, insert, inspect, select, text, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from crud import DEFAULT_SETTINGS, compute_remind_at
+from models import Base, SchemaVersion, Task, TaskOccurrence, TaskTombstone, UserSettings
+from search import create_search_index
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Выполнять миграции при старте приложения вместо проверки версии (для локальной разработки)
+SCHEMA_AUTO_MIGRATE = os.environ.get("SCHEMA_AUTO_MIGRATE", "false").lower() == "true"
+# Версия, которую имеет база, созданная create_all до появления schema_version
+BASELINE_VERSION = 1
+# Ключ advisory lock Postgres, чтобы миграции не выполнялись двумя процессами сразу
+MIGRATION_LOCK_KEY = zlib.crc32(b"task-manager-migrations")
+
+class SchemaOutdatedError(RuntimeError):
+    """Версия схемы в базе меньше той, которую ожидает код."""
+
+def _index(name: str):
+    for table in Base.metadata.tables.values():
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise KeyError(name)
+
+async def _add_column(conn: AsyncConnection, column):
+    """ALTER TABLE ... ADD COLUMN, если колонки ещё нет (база могла быть создана create_all новой версии)."""
+    existing = await conn.run_sync(lambda c: {col["name"] for col in inspect(c).get_columns(column.table.name)})
+    if column.name in existing:
+        return
+    column_type = column.type.compile(dialect=conn.dialect)
+    await conn.execute(text(f"ALTER TABLE {column.table.name} ADD COLUMN {column.name} {column_type}"))
+
+async def _create_index(conn: AsyncConnection, name: str):
+    index = _index(name)
+    await conn.run_sync(lambda c: index.create(c, checkfirst=True))
+
+async def _drop_index(conn: AsyncConnection, name: str):
+    await conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+async def _v2_dedup_and_created_index(conn: AsyncConnection):
+    await _add_column(conn, Task.__table__.c.dedup_bucket)
+    await _create_index(conn, "uq_task_dedup")
+    await _create_index(conn, "idx_user_created")
+
+async def _v3_sync(conn: AsyncConnection):
+    await conn.run_sync(lambda c: TaskTombstone.__table__.create(c, checkfirst=True))
+    await _create_index(conn, "idx_user_updated")
+
+async def _v4_remind_at(conn: AsyncConnection):
+    await _add_column(conn, Task.__table__.c.remind_at)
+    # Заполняем remind_at для будущих напоминаний по настройкам пользователей
+    rows = (await conn.execute(
+        select(Task.id, Task.deadline, UserSettings.reminder_time, UserSettings.reminder_enabled)
+        .outerjoin(UserSettings, UserSettings.user_id == Task.user_id)
+        .where(Task.reminder.is_(True), Task.completed.is_(False),
+               Task.deadline > datetime.now(timezone.utc))
+    )).all()
+    values = []
+    for row in rows:
+        settings = dict(DEFAULT_SETTINGS)
+        if row.reminder_time is not None:
+            settings["reminder_time"] = row.reminder_time
+        if row.reminder_enabled is not None:
+            settings["reminder_enabled"] = row.reminder_enabled
+        remind_at = compute_remind_at(row.deadline, True, False, settings)
+        if remind_at is not None:
+            values.append({"task_id": row.id, "remind_at": remind_at})
+    if values:
+        tasks = Task.__table__
+        # updated_at не трогаем: для клиентов задачи не менялись
+        await conn.execute(
+            update(tasks).where(tasks.c.id == bindparam("task_id"))
+            .values(remind_at=bindparam("remind_at"), updated_at=tasks.c.updated_at),
+            values,
+        )
+    logger.info(f"remind_at заполнен для {len(values)} задач")
+    await _create_index(conn, "idx_remind_at")
+    await _drop_index(conn, "idx_reminder_deadline")
+
+async def _v5_search(conn: AsyncConnection):
+    await create_search_index(conn)
+
+async def _v6_recurrence(conn: AsyncConnection):
+    for name in ("recurrence", "recurrence_interval", "recurrence_until"):
+        await _add_column(conn, Task.__table__.c[name])
+    await conn.run_sync(lambda c: TaskOccurrence.__table__.create(c, checkfirst=True))
+    await _create_index(conn, "idx_user_recurrence")
+
+# Миграции по порядку: (версия, описание, функция). Новая миграция добавляется
+# в конец; модели в models.py должны соответствовать последней версии
+MIGRATIONS = [
+    (2, "tasks.dedup_bucket и индекс idx_user_created", _v2_dedup_and_created_index),
+    (3, "таблица task_tombstones и индекс idx_user_updated", _v3_sync),
+    (4, "tasks.remind_at и индекс idx_remind_at", _v4_remind_at),
+    (5, "полнотекстовый индекс задач (tsvector/GIN или FTS5)", _v5_search),
+    (6, "повторяющиеся задачи: tasks.recurrence*, таблица task_occurrences", _v6_recurrence),
+]
+LATEST_VERSION = MIGRATIONS[-1][0] if MIGRATIONS else BASELINE_VERSION
+
+async def _lock(conn: AsyncConnection):
+    if conn.dialect.name == "postgresql":
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+async def _has_table(conn: AsyncConnection, name: str) -> bool:
+    return await conn.run_sync(lambda c: inspect(c).has_table(name))
+
+async def current_version(conn: AsyncConnection):
+    """Версия схемы или None, если таблицы schema_version нет."""
+    if not await _has_table(conn, SchemaVersion.__tablename__):
+        return None
+    return await conn.scalar(select(func.max(SchemaVersion.version)))
+
+async def stamp(conn: AsyncConnection, version: int = LATEST_VERSION):
+    """Записывает версию схемы без выполнения миграций (для базы, созданной create_all)."""
+    await conn.run_sync(lambda c: SchemaVersion.__table__.create(c, checkfirst=True))
+    await conn.execute(delete(SchemaVersion))
+    await conn.execute(insert(SchemaVersion).values(version=version, applied_at=datetime.now(timezone.utc)))
+
+async def create_schema(conn: AsyncConnection):
+    """
+    Создаёт схему последней версии в пустой базе: create_all, объекты,
+    которых нет в models.py (полнотекстовый индекс), и запись версии.
+    """
+    await conn.run_sync(Base.metadata.create_all)
+    await create_search_index(conn)
+    await stamp(conn, LATEST_VERSION)
+
+async def migrate(engine: AsyncEngine) -> int:
+    """
+    Приводит схему базы к LATEST_VERSION.
+
+    Пустая база создаётся целиком (create_schema) и сразу получает
+    последнюю версию. База без schema_version считается созданной
+    исходной версией кода (BASELINE_VERSION). Каждая миграция выполняется
+    в своей транзакции вместе с записью новой версии.
+
+    Returns:
+        int: Версия схемы после миграций
+    """
+    async with engine.begin() as conn:
+        await _lock(conn)
+        version = await current_version(conn)
+        if version is None:
+            if not await _has_table(conn, Task.__tablename__):
+                await create_schema(conn)
+                logger.info(f"Схема базы данных создана, версия {LATEST_VERSION}")
+                return LATEST_VERSION
+            await stamp(conn, BASELINE_VERSION)
+            version = BASELINE_VERSION
+            logger.info(f"База без schema_version, считаю версию {BASELINE_VERSION}")
+
+    for target, description, upgrade in MIGRATIONS:
+        if target <= version:
+            continue
+        async with engine.begin() as conn:
+            await _lock(conn)
+            # Пока ждали блокировку, миграцию мог выполнить другой процесс
+            version = await current_version(conn)
+            if target <= version:
+                continue
+            logger.info(f"Миграция схемы {version} -> {target}: {description}")
+            await upgrade(conn)
+            await stamp(conn, target)
+            version = target
+    # Таблицы, добавленные в models.py без миграции, создаются пустыми
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    logger.info(f"Схема базы данных в актуальном состоянии, версия {version}")
+    return version
+
+async def check_schema(engine: AsyncEngine) -> int:
+    """
+    Быстрая проверка при старте: один SELECT из schema_version вместо
+    отражения схемы и create_all.
+
+    Raises:
+        SchemaOutdatedError: Версия схемы меньше LATEST_VERSION или неизвестна
+    """
+    try:
+        async with engine.connect() as conn:
+            version = await conn.scalar(select(func.max(SchemaVersion.version)))
+    except DBAPIError as e:
+        raise SchemaOutdatedError(f"Не удалось прочитать версию схемы ({str(e).splitlines()[0]}): "
+                                  f"выполните python init_db.py") from e
+    if version is None or version < LATEST_VERSION:
+        raise SchemaOutdatedError(f"Схема базы данных версии {version}, требуется {LATEST_VERSION}: "
+                                  f"выполните python init_db.py")
+    if version > LATEST_VERSION:
+        logger.warning(f"Схема базы данных новее кода ({version} > {LATEST_VERSION})")
+    return version
+
+async def ensure_schema(engine: AsyncEngine) -> int:
+    """Проверка схемы при старте процесса; с SCHEMA_AUTO_MIGRATE=true — миграции."""
+    if SCHEMA_AUTO_MIGRATE:
+        return await migrate(engine)
+    return await check_schema(engine)
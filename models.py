@@ -25,17 +25,69 @@ class Task(Base):
     updated_at = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(datetime.timezone.utc), 
                         onupdate=lambda: datetime.datetime.now(datetime.timezone.utc))
     user_id = Column(Integer, nullable=False, index=True)
+    # Минута создания (см. crud.dedup_bucket) для защиты от повторной отправки той же задачи;
+    # у задач из пакетного создания и импорта не заполняется
+    dedup_bucket = Column(Integer, nullable=True)
+    # Момент отправки напоминания: deadline - UserSettings.reminder_time (см. crud.compute_remind_at).
+    # NULL, если напоминать не нужно: напоминание выключено, уже отправлено или задача выполнена
+    remind_at = Column(DateTime(timezone=True), nullable=True)
+    # Правило повторения (см. recurrence.py): daily, weekly или monthly каждые recurrence_interval
+    # единиц, не позже recurrence_until. deadline — первое вхождение серии; вхождения не хранятся,
+    # а разворачиваются при чтении. У повторяющейся задачи remind_at — напоминание о ближайшем вхождении
+    recurrence = Column(String(10), nullable=True)
+    recurrence_interval = Column(Integer, nullable=True)
+    recurrence_until = Column(DateTime(timezone=True), nullable=True)
     
     # Создаём составной индекс для частых запросов
     __table_args__ = (
         Index('idx_user_deadline', user_id, deadline),
         Index('idx_user_completed', user_id, completed),
-        Index('idx_reminder_deadline', reminder, deadline),
+        Index('idx_remind_at', remind_at),
+        Index('idx_user_created', user_id, created_at),
+        Index('idx_user_updated', user_id, updated_at, id),
+        Index('uq_task_dedup', user_id, title, dedup_bucket, unique=True),
+        Index('idx_user_recurrence', user_id, recurrence),
     )
     
     def __repr__(self):
         return f"<Task(id={self.id}, title='{self.title[:20]}...', user_id={self.user_id})>"
 
+class TaskTombstone(Base):
+    """Запись об удалённой задаче для инкрементальной синхронизации (GET /tasks/changes)."""
+    __tablename__ = "task_tombstones"
+
+    id = Column(Integer, primary_key=True)
+    task_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime(timezone=True), nullable=False,
+                        default=lambda: datetime.datetime.now(datetime.timezone.utc))
+
+    __table_args__ = (
+        Index('idx_tombstone_user_deleted', user_id, deleted_at, id),
+    )
+
+    def __repr__(self):
+        return f"<TaskTombstone(task_id={self.task_id}, user_id={self.user_id})>"
+
+class TaskOccurrence(Base):
+    """Отметка о выполнении одного вхождения повторяющейся задачи."""
+    __tablename__ = "task_occurrences"
+
+    id = Column(Integer, primary_key=True)
+    task_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    # Момент вхождения по правилу (в UTC), а не время выполнения
+    occurrence = Column(DateTime(timezone=True), nullable=False)
+    completed = Column(Boolean, nullable=False, default=True)
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(datetime.timezone.utc))
+
+    __table_args__ = (
+        Index('uq_task_occurrence', task_id, occurrence, unique=True),
+    )
+
+    def __repr__(self):
+        return f"<TaskOccurrence(task_id={self.task_id}, occurrence={self.occurrence})>"
+
 # Дополнительная модель для хранения настроек пользователя (можно использовать в будущем)
 class UserSettings(Base):
     __tablename__ = "user_settings"
@@ -50,3 +102,13 @@ class UserSettings(Base):
     
     def __repr__(self):
         return f"<UserSettings(user_id={self.user_id}, timezone='{self.timezone}')>"
+
+class SchemaVersion(Base):
+    """Версия схемы БД (одна строка); обновляется миграциями из migrations.py."""
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    applied_at = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(datetime.timezone.utc))
+
+    def __repr__(self):
+        return f"<SchemaVersion(version={self.version})>"
@@ -0,0 +1,182 @@
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+from urllib.parse import parse_qs
+
+import metrics
+import serialization
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+rejected = metrics.registry.counter("rate_limit_rejected_total", "Запросы, отклонённые ограничением частоты (429)",
+                                    labels=("key",))
+backend_errors = metrics.registry.counter("rate_limit_backend_errors_total",
+                                          "Ошибки общего хранилища ограничения частоты (запрос пропускается)")
+
+class TokenBucket:
+    """
+    Ограничение частоты «ведро токенов» в памяти процесса.
+
+    Ведро ключа вмещает burst токенов и пополняется со скоростью rate
+    токенов в секунду; запрос забирает cost токенов. Хранится не больше
+    max_keys вёдер: давно не использованное ведро вытесняется, а ведро,
+    простоявшее burst / rate секунд, и так было бы полным. У каждого
+    воркера свои вёдра, поэтому общий предел равен пределу, умноженному
+    на число воркеров; общий для всех процессов — SharedTokenBucket.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    async def acquire(self, key: str, cost: float = 1) -> float:
+        """Забирает токены; возвращает 0, если запрос разрешён, иначе сколько секунд ждать."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+# Проверка и списание в одном скрипте, чтобы воркеры не гонялись за одно ведро;
+# время берётся у Redis, а не у воркеров с разными часами
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+class SharedTokenBucket:
+    """
+    Ведро токенов в Redis, общее для всех воркеров и инстансов.
+
+    Если хранилище недоступно, запрос пропускается: ограничение частоты
+    не должно останавливать API.
+    """
+
+    def __init__(self, client, rate: float, burst: float, prefix: str = "ratelimit"):
+        self.client = client
+        self.rate = rate
+        self.burst = burst
+        self.prefix = prefix
+
+    async def acquire(self, key: str, cost: float = 1) -> float:
+        try:
+            wait = await self.client.eval(_TOKEN_BUCKET_SCRIPT, 1, f"{self.prefix}:{key}",
+                                          self.rate, self.burst, cost)
+            return float(wait)
+        except Exception as e:
+            backend_errors.inc()
+            logger.error(f"Ошибка ограничения частоты для {key}: {str(e)}")
+            return 0.0
+
+def client_key(scope) -> str:
+    """
+    Ключ ведра: user_id из строки запроса, иначе адрес клиента.
+
+    За прокси адрес клиента берётся из X-Forwarded-For самим uvicorn
+    (--proxy-headers, --forwarded-allow-ips), здесь заголовок не читается,
+    чтобы клиент не мог подставить чужой адрес.
+    """
+    user_id = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("user_id")
+    if user_id and user_id[0].isdigit():
+        return f"user:{user_id[0]}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+class RateLimitMiddleware:
+    """
+    ASGI-middleware: ограничение частоты запросов по пользователю или IP.
+
+    Запрос сверх предела получает 429 с заголовком Retry-After и до
+    приложения не доходит. Пути из exempt_paths (проверки здоровья,
+    метрики) не ограничиваются.
+    """
+
+    def __init__(self, app, limiter, exempt_paths: Iterable[str] = ()):
+        self.app = app
+        self.limiter = limiter
+        self.exempt_paths = frozenset(exempt_paths)
+
+    async def __call__(self, scope, receive, send):
+        if self.limiter is None or scope["type"] != "http" or scope["path"] in self.exempt_paths \
+                or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        key = client_key(scope)
+        wait = await self.limiter.acquire(key)
+        if wait <= 0:
+            await self.app(scope, receive, send)
+            return
+        rejected.inc(key=key.split(":", 1)[0])
+        body = serialization.dumps({"detail": "Слишком много запросов, повторите позже"})
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+def create_rate_limiter() -> Optional[object]:
+    """
+    Создаёт ограничитель частоты по переменным окружения.
+
+    RATE_LIMIT_BACKEND: memory (по умолчанию), shared или off.
+    RATE_LIMIT_RATE — запросов в секунду на ключ, RATE_LIMIT_BURST —
+    допустимый всплеск. Для shared нужен REDIS_URL и пакет redis; без
+    них используется ограничение в памяти процесса.
+    """
+    backend_name = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+    rate = float(os.environ.get("RATE_LIMIT_RATE", "20"))
+    burst = float(os.environ.get("RATE_LIMIT_BURST", "60"))
+    if backend_name == "off":
+        logger.info("Ограничение частоты запросов отключено")
+        return None
+    if backend_name == "shared":
+        redis_url = os.environ.get("REDIS_URL")
+        if redis_url:
+            try:
+                import redis.asyncio as redis
+                limiter = SharedTokenBucket(redis.from_url(redis_url), rate=rate, burst=burst)
+                logger.info(f"Ограничение частоты в Redis: {rate:g}/s, всплеск {burst:g}")
+                return limiter
+            except ImportError:
+                logger.error("Пакет redis не установлен, ограничение частоты только в памяти процесса")
+        else:
+            logger.warning("REDIS_URL не задан, ограничение частоты только в памяти процесса")
+    logger.info(f"Ограничение частоты в памяти процесса: {rate:g}/s, всплеск {burst:g}")
+    return TokenBucket(rate=rate, burst=burst, max_keys=int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000")))
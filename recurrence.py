@@ -0,0 +1,106 @@
+import calendar
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Collection, Iterator, List, Optional
+from zoneinfo import ZoneInfo
+
+from serialization import as_utc
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Правила повторения задачи: каждые recurrence_interval дней, недель или месяцев
+FREQUENCIES = ("daily", "weekly", "monthly")
+# Сколько вхождений одного правила разворачивается за раз (защита от огромных диапазонов)
+MAX_OCCURRENCES = 1000
+
+def _add_months(value: datetime, months: int) -> datetime:
+    # 31 января + 1 месяц — последний день февраля; следующее вхождение снова 31 марта
+    month = value.month - 1 + months
+    year = value.year + month // 12
+    month = month % 12 + 1
+    return value.replace(year=year, month=month, day=min(value.day, calendar.monthrange(year, month)[1]))
+
+def _local(value: datetime, zone: ZoneInfo) -> datetime:
+    return as_utc(value).astimezone(zone).replace(tzinfo=None)
+
+def _nth(start_local: datetime, frequency: str, interval: int, index: int) -> datetime:
+    if frequency == "monthly":
+        return _add_months(start_local, index * interval)
+    return start_local + timedelta(days=index * interval * (7 if frequency == "weekly" else 1))
+
+def _index_before(start_local: datetime, frequency: str, interval: int, moment_local: datetime) -> int:
+    """Номер вхождения не позже первого вхождения после moment (с запасом в одно на переход часов)."""
+    if moment_local <= start_local:
+        return 0
+    if frequency == "monthly":
+        months = (moment_local.year - start_local.year) * 12 + moment_local.month - start_local.month
+        return max(0, months // interval - 1)
+    step = interval * (7 if frequency == "weekly" else 1)
+    return max(0, (moment_local - start_local).days // step - 1)
+
+def iter_occurrences(start: datetime, frequency: str, interval: Optional[int], until: Optional[datetime],
+                     since: datetime, tz: Optional[str] = None) -> Iterator[datetime]:
+    """
+    Вхождения правила (в UTC) не раньше since.
+
+    Вхождения считаются по местному времени tz: задача «каждый день в 9:00»
+    остаётся в 9:00 и после перехода на летнее время. Первое вхождение —
+    start (дедлайн задачи), последнее — не позже until. Перебор начинается
+    сразу с нужного номера, а не с начала серии.
+    """
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"Неизвестное правило повторения: {frequency}")
+    zone = ZoneInfo(tz or "UTC")
+    interval = interval or 1
+    until = as_utc(until) if until is not None else None
+    since = as_utc(since)
+    start_local = _local(start, zone)
+    index = _index_before(start_local, frequency, interval, _local(since, zone))
+    while True:
+        occurrence = _nth(start_local, frequency, interval, index).replace(tzinfo=zone).astimezone(timezone.utc)
+        index += 1
+        if until is not None and occurrence > until:
+            return
+        if occurrence >= since:
+            yield occurrence
+
+def occurrences_between(start: datetime, frequency: str, interval: Optional[int], until: Optional[datetime],
+                        range_start: datetime, range_end: datetime, tz: Optional[str] = None) -> List[datetime]:
+    """Вхождения в [range_start, range_end), не больше MAX_OCCURRENCES."""
+    range_end = as_utc(range_end)
+    result = []
+    for occurrence in iter_occurrences(start, frequency, interval, until, range_start, tz):
+        if occurrence >= range_end:
+            break
+        if len(result) >= MAX_OCCURRENCES:
+            logger.warning(f"Развёрнуто {MAX_OCCURRENCES} вхождений правила {frequency}, остальные отброшены")
+            break
+        result.append(occurrence)
+    return result
+
+def next_occurrence(start: datetime, frequency: str, interval: Optional[int], until: Optional[datetime],
+                    after: datetime, tz: Optional[str] = None, skip: Collection[datetime] = ()) -> Optional[datetime]:
+    """Первое вхождение строго после after, кроме вхождений из skip; None, если серия закончилась."""
+    after = as_utc(after)
+    for checked, occurrence in enumerate(iter_occurrences(start, frequency, interval, until, after, tz)):
+        if checked >= MAX_OCCURRENCES:
+            return None
+        if occurrence > after and occurrence not in skip:
+            return occurrence
+    return None
+
+def last_occurrence(start: datetime, frequency: str, interval: Optional[int], until: Optional[datetime],
+                    moment: datetime, tz: Optional[str] = None) -> Optional[datetime]:
+    """Последнее вхождение не позже moment; None, если серия ещё не началась."""
+    moment = as_utc(moment)
+    zone = ZoneInfo(tz or "UTC")
+    # Начинаем на одно вхождение раньше moment, чтобы было что вернуть
+    since = _nth(_local(start, zone), frequency, interval or 1,
+                 _index_before(_local(start, zone), frequency, interval or 1, _local(moment, zone)))
+    found = None
+    for occurrence in iter_occurrences(start, frequency, interval, until, since.replace(tzinfo=zone), tz):
+        if occurrence > moment:
+            break
+        found = occurrence
+    return found
@@ -0,0 +1,160 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Iterable, List, Optional, Tuple
+
+from serialization import as_utc
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ReminderTimer:
+    """
+    Внутрипроцессный планировщик напоминаний на двоичной куче.
+
+    Хранит момент срабатывания (remind_at задачи) в пределах горизонта
+    horizon и вызывает on_fire(task_ids) ровно в этот момент, без опроса БД.
+    Переназначение и отмена ленивые: в куче остаются устаревшие записи,
+    актуальное значение хранится в словаре _entries.
+
+    Пока напоминание отправляется, переназначения задачи откладываются в
+    _pending и применяются после отправки, но не раньше чем через
+    retry_delay: неотправленное напоминание возвращается с remind_at = now,
+    и без задержки таймер повторял бы его без паузы.
+
+    Args:
+        on_fire: корутина, получающая список id задач, которым пора напомнить
+        horizon (timedelta): насколько вперёд держать задачи в памяти
+        retry_delay (timedelta): минимальная пауза перед повторным срабатыванием задачи
+    """
+
+    def __init__(self, on_fire: Callable[[List[int]], Awaitable[None]],
+                 horizon: timedelta = timedelta(hours=24), retry_delay: timedelta = timedelta(minutes=1)):
+        self.on_fire = on_fire
+        self.horizon = horizon
+        self.retry_delay = retry_delay
+        self._heap: List[Tuple[datetime, int, int]] = []
+        self._entries = {}
+        self._in_flight = set()
+        self._pending = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._runner: Optional[asyncio.Task] = None
+        self._fires = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def running(self) -> bool:
+        return self._runner is not None
+
+    def schedule(self, task_id: int, fire_at: datetime):
+        """Назначает (или переназначает) срабатывание задачи на fire_at."""
+        fire_at = as_utc(fire_at)
+        if task_id in self._in_flight:
+            # Например, следующее вхождение повторяющейся задачи, назначенное при захвате
+            self._pending[task_id] = fire_at
+            return
+        if fire_at > datetime.now(timezone.utc) + self.horizon:
+            self.cancel(task_id)
+            return
+        if self._entries.get(task_id) == fire_at:
+            return
+        self._entries[task_id] = fire_at
+        heapq.heappush(self._heap, (fire_at, next(self._counter), task_id))
+        if self._heap[0][2] == task_id:
+            self._wakeup.set()
+
+    def cancel(self, task_id: int):
+        self._entries.pop(task_id, None)
+        self._pending.pop(task_id, None)
+
+    def replace_all(self, items: Iterable[Tuple[int, datetime]]):
+        """Полностью заменяет содержимое кучи (сверка с БД)."""
+        self._entries.clear()
+        self._heap.clear()
+        self._pending.clear()
+        for task_id, fire_at in items:
+            self.schedule(task_id, fire_at)
+        self._wakeup.set()
+
+    def sync_task(self, event: str, task, previous=None):
+        """Подписчик crud: поддерживает кучу в актуальном состоянии при изменениях задач."""
+        # remind_at уже учитывает reminder, completed и настройки пользователя
+        if event == "deleted" or task.remind_at is None or task.deadline is None:
+            self.cancel(task.id)
+            return
+        # У повторяющейся задачи deadline — начало серии, а remind_at — ближайшее вхождение
+        if task.recurrence is None and as_utc(task.deadline) <= datetime.now(timezone.utc):
+            self.cancel(task.id)
+            return
+        self.schedule(task.id, task.remind_at)
+
+    def start(self):
+        if self._runner is None:
+            self._runner = asyncio.get_running_loop().create_task(self._run())
+            logger.info("Таймер напоминаний запущен")
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        if self._fires:
+            await asyncio.gather(*self._fires, return_exceptions=True)
+        self._entries.clear()
+        self._heap.clear()
+        self._pending.clear()
+
+    def _pop_due(self, now: datetime) -> List[int]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, _, task_id = heapq.heappop(self._heap)
+            if self._entries.get(task_id) == fire_at:
+                del self._entries[task_id]
+                due.append(task_id)
+        return due
+
+    def _next_delay(self) -> Optional[float]:
+        # Выбрасываем устаревшие записи с вершины кучи
+        while self._heap and self._entries.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return max(0.0, (self._heap[0][0] - datetime.now(timezone.utc)).total_seconds())
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._next_delay()
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+            due = self._pop_due(datetime.now(timezone.utc))
+            if due:
+                fire = asyncio.get_running_loop().create_task(self._fire(due))
+                self._fires.add(fire)
+                fire.add_done_callback(self._fires.discard)
+
+    async def _fire(self, task_ids: List[int]):
+        self._in_flight.update(task_ids)
+        try:
+            await self.on_fire(task_ids)
+        except Exception as e:
+            logger.error(f"Ошибка при срабатывании напоминаний {task_ids}: {str(e)}")
+        finally:
+            self._in_flight.difference_update(task_ids)
+            retry_at = datetime.now(timezone.utc) + self.retry_delay
+            for task_id in task_ids:
+                fire_at = self._pending.pop(task_id, None)
+                if fire_at is not None:
+                    self.schedule(task_id, max(fire_at, retry_at))
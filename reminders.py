@@ -1,66 +1,384 @@
-from telegram import Bot
-from telegram.error import InvalidToken, TelegramError
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from collections import defaultdict
+import asyncio
+import json
 import logging
-from crud import get_tasks, get_active_users, update_task
+import time
+from crud import (get_due_reminders, claim_due_reminders, release_reminders, add_task_listener, remove_task_listener,
+                  prune_tombstones, add_settings_listener)
 import os
-from database import get_db
+from database import get_db_context, engine, session_engine
+from migrations import ensure_schema
+from leader import LeaderElection
+from reminder_timer import ReminderTimer
+from events import BrokerLink, EVENTS_BROKER_URL
+import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-scheduler = AsyncIOScheduler()
-
-# Получаем токен из переменной окружения
-token = os.environ.get("TELEGRAM_BOT_TOKEN")
-if not token:
-    logger.error("TELEGRAM_BOT_TOKEN не задан в переменных окружения")
-    raise ValueError("TELEGRAM_BOT_TOKEN не задан в переменных окружения")
-
-try:
-    bot = Bot(token)
-    logger.info("Telegram Bot успешно инициализирован")
-except InvalidToken as e:
-    logger.error(f"Недействительный токен Telegram: {e}")
-    raise
-
-async def check_reminders():
-    logger.info("Проверка напоминаний...")
-    
-    async with await get_db() as db:
+# Планировщик создаётся в start_scheduler: APScheduler и Telegram импортируются
+# только там, где напоминания действительно отправляются
+scheduler = None
+
+_bot = None
+
+def get_bot():
+    """
+    Telegram Bot создаётся при первом обращении, а не при импорте: модуль
+    импортируют бенчмарки с собственным отправителем, и им токен не нужен.
+
+    Raises:
+        ValueError: TELEGRAM_BOT_TOKEN не задан
+    """
+    global _bot
+    if _bot is None:
+        from telegram import Bot
+        from telegram.error import InvalidToken
+        # Получаем токен из переменной окружения
+        token = os.environ.get("TELEGRAM_BOT_TOKEN")
+        if not token:
+            logger.error("TELEGRAM_BOT_TOKEN не задан в переменных окружения")
+            raise ValueError("TELEGRAM_BOT_TOKEN не задан в переменных окружения")
         try:
-            # Получаем только активных пользователей из базы данных
-            users = await get_active_users(db)
-            
-            for user_id in users:
-                tasks = await get_tasks(db, user_id)
-                for task in tasks:
-                    # Если задача имеет включённое напоминание, задан дедлайн и не завершена
-                    if task.reminder and task.deadline and not task.completed:
-                        deadline = task.deadline.astimezone(timezone.utc)
-                        now = datetime.now(timezone.utc)
-                        time_diff = (deadline - now).total_seconds()
-                        
-                        # Если осталось меньше или равно 1 часу до дедлайна
-                        if 0 < time_diff <= 3600:
-                            logger.info(f"Отправка напоминания для задачи {task.title} (user_id={user_id})")
-                            
-                            try:
-                                await bot.send_message(
-                                    chat_id=user_id,
-                                    text=f"Напоминание: {task.title} (дедлайн: {deadline.strftime('%Y-%m-%d %H:%M:%S UTC')})"
-                                )
-                                # Обновляем статус напоминания с помощью существующей функции update_task
-                                await update_task(db, user_id, task.id, reminder=False)
-                                logger.info(f"Напоминание для задачи {task.id} успешно отправлено")
-                            except TelegramError as e:
-                                logger.error(f"Ошибка при отправке напоминания пользователю {user_id}: {str(e)}")
-        
+            _bot = Bot(token)
+            logger.info("Telegram Bot успешно инициализирован")
+        except InvalidToken as e:
+            logger.error(f"Недействительный токен Telegram: {e}")
+            raise
+    return _bot
+
+# Лимиты Telegram Bot API: ~30 сообщений в секунду на бота и 1 сообщение в секунду в один чат
+TELEGRAM_GLOBAL_RATE = float(os.environ.get("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_PER_CHAT_INTERVAL = float(os.environ.get("TELEGRAM_PER_CHAT_INTERVAL", "1.0"))
+REMINDER_CONCURRENCY = int(os.environ.get("REMINDER_CONCURRENCY", "10"))
+REMINDER_MAX_RETRIES = int(os.environ.get("REMINDER_MAX_RETRIES", "3"))
+# Сколько напоминаний захватывается одним UPDATE
+REMINDER_BATCH_SIZE = int(os.environ.get("REMINDER_BATCH_SIZE", "500"))
+
+# Таймер держит в памяти напоминания на REMINDER_HORIZON_HOURS вперёд,
+# раз в REMINDER_RECONCILE_MINUTES минут содержимое сверяется с БД.
+# Изменения из других процессов (воркеры API, не ставшие лидером) приходят
+# через брокер событий (EVENTS_BROKER_URL); без брокера таймер видит их только после сверки
+REMINDER_HORIZON = timedelta(hours=float(os.environ.get("REMINDER_HORIZON_HOURS", "24")))
+REMINDER_RECONCILE_MINUTES = float(os.environ.get("REMINDER_RECONCILE_MINUTES", "10"))
+# За сколько секунд копятся изменения из других процессов перед одним запросом к БД
+REMINDER_REMOTE_BATCH_SECONDS = float(os.environ.get("REMINDER_REMOTE_BATCH_SECONDS", "0.5"))
+# Пауза перед повторной попыткой отправить напоминание, которое не удалось доставить
+REMINDER_RETRY_SECONDS = float(os.environ.get("REMINDER_RETRY_SECONDS", "60"))
+
+# Как часто процессы, не ставшие лидером, пытаются им стать
+LEADER_RETRY_SECONDS = float(os.environ.get("REMINDER_LEADER_RETRY_SECONDS", "30"))
+
+class RateLimiter:
+    """
+    Асинхронный token bucket: не более rate отправок в секунду с допуском всплеска burst.
+    По умолчанию burst = 1, то есть отправки равномерно распределены во времени —
+    так скользящее окно Telegram в одну секунду никогда не переполняется.
+
+    Метод pause() блокирует все отправки до заданного момента — используется
+    при получении RetryAfter от Telegram.
+    """
+
+    def __init__(self, rate: float, burst: float = 1):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def format_reminder(task) -> str:
+    deadline = task.deadline.astimezone(timezone.utc)
+    return f"Напоминание: {task.title} (дедлайн: {deadline.strftime('%Y-%m-%d %H:%M:%S UTC')})"
+
+class ReminderDispatcher:
+    """
+    Отправляет пачку напоминаний с ограниченным параллелизмом.
+
+    Напоминания группируются по чату: сообщения в один чат уходят последовательно
+    с интервалом per_chat_interval, разные чаты обрабатываются параллельно
+    (не более concurrency одновременных запросов). Общий темп ограничивается
+    RateLimiter. На RetryAfter отправка приостанавливается для всех чатов,
+    сетевые ошибки повторяются с экспоненциальной задержкой.
+    """
+
+    def __init__(self, bot, concurrency: int = REMINDER_CONCURRENCY,
+                 global_rate: float = TELEGRAM_GLOBAL_RATE,
+                 per_chat_interval: float = TELEGRAM_PER_CHAT_INTERVAL,
+                 max_retries: int = REMINDER_MAX_RETRIES):
+        self.bot = bot
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiter = RateLimiter(global_rate)
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+
+    async def dispatch(self, reminders) -> list:
+        """
+        Отправляет напоминания и возвращает id задач, сообщения по которым доставлены.
+
+        Args:
+            reminders: строки с полями id, user_id, title, deadline
+        """
+        by_chat = defaultdict(list)
+        for task in reminders:
+            by_chat[task.user_id].append(task)
+        results = await asyncio.gather(*(self._send_chat(chat_id, tasks) for chat_id, tasks in by_chat.items()))
+        return [task_id for sent in results for task_id in sent]
+
+    async def _send_chat(self, chat_id: int, tasks) -> list:
+        sent = []
+        last_sent = None
+        for task in tasks:
+            if last_sent is not None:
+                delay = self.per_chat_interval - (time.monotonic() - last_sent)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if await self._send(chat_id, task):
+                sent.append(task.id)
+            last_sent = time.monotonic()
+        return sent
+
+    async def _send(self, chat_id: int, task) -> bool:
+        from telegram.error import NetworkError, RetryAfter, TelegramError
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            try:
+                async with self.semaphore:
+                    await self.bot.send_message(chat_id=chat_id, text=format_reminder(task))
+                logger.info(f"Напоминание для задачи {task.id} успешно отправлено")
+                return True
+            except RetryAfter as e:
+                logger.warning(f"Telegram просит подождать {e.retry_after}s (задача {task.id})")
+                self.limiter.pause(float(e.retry_after))
+            except NetworkError as e:
+                logger.warning(f"Сетевая ошибка при отправке напоминания {task.id}, попытка {attempt + 1}: {str(e)}")
+                await asyncio.sleep(min(2 ** attempt * 0.5, 10))
+            except TelegramError as e:
+                logger.error(f"Ошибка при отправке напоминания пользователю {chat_id}: {str(e)}")
+                return False
+        logger.error(f"Напоминание для задачи {task.id} не отправлено после {self.max_retries + 1} попыток")
+        return False
+
+async def deliver_reminders(db, task_ids=None, sender=None) -> list:
+    """
+    Захватывает напоминания к отправке, рассылает их и возвращает неотправленные.
+
+    Захват атомарный (crud.claim_due_reminders), поэтому вызывать функцию
+    одновременно из нескольких процессов безопасно: каждое напоминание
+    будет отправлено ровно один раз.
+
+    Args:
+        db (AsyncSession): Сессия базы данных
+        task_ids (list): Ограничить захват этими задачами
+        sender: Объект с методом send_message (по умолчанию — Telegram Bot)
+
+    Returns:
+        list: id задач, напоминания по которым отправлены
+    """
+    dispatcher = ReminderDispatcher(sender or get_bot())
+    trigger = "timer" if task_ids is not None else "scan"
+    started = time.perf_counter()
+    sent_ids = []
+    while True:
+        claimed = await claim_due_reminders(db, task_ids=task_ids, limit=REMINDER_BATCH_SIZE)
+        if not claimed:
+            break
+        logger.info(f"Захвачено напоминаний к отправке: {len(claimed)}")
+        sent = set(await dispatcher.dispatch(claimed))
+        sent_ids.extend(sent)
+        failed = [task.id for task in claimed if task.id not in sent]
+        await release_reminders(db, failed)
+        metrics.reminders_sent.inc(len(sent))
+        metrics.reminders_failed.inc(len(failed))
+        # Если пачка не отправилась целиком, не захватываем её повторно в этом же тике
+        if len(claimed) < REMINDER_BATCH_SIZE or not sent:
+            break
+    metrics.reminder_delivery_latency.observe(time.perf_counter() - started, trigger=trigger)
+    return sent_ids
+
+async def fire_reminders(task_ids):
+    """
+    Срабатывание таймера: перепроверяет задачи в БД, отправляет и отмечает напоминания.
+    """
+    async with get_db_context() as db:
+        try:
+            # Задача могла измениться в другом процессе — захватываются только актуальные напоминания
+            await deliver_reminders(db, task_ids=task_ids)
+        except Exception as e:
+            logger.error(f"Ошибка при отправке напоминаний {task_ids}: {str(e)}")
+
+timer = ReminderTimer(fire_reminders, horizon=REMINDER_HORIZON, retry_delay=timedelta(seconds=REMINDER_RETRY_SECONDS))
+election = LeaderElection(session_engine, "task-manager-reminders")
+metrics.reminder_backlog.set_function(lambda: len(timer))
+
+async def reconcile_reminders():
+    """
+    Низкочастотная сверка таймера с БД: подхватывает изменения, сделанные
+    в других процессах, и напоминания, вошедшие в горизонт таймера.
+    """
+    if not timer.running:
+        return
+    async with get_db_context() as db:
+        try:
+            upcoming = await get_due_reminders(db, horizon=REMINDER_HORIZON)
+            timer.replace_all((task.id, task.remind_at) for task in upcoming)
+            logger.info(f"Таймер напоминаний сверен с БД: {len(timer)} задач в очереди")
+        except Exception as e:
+            logger.error(f"Ошибка при сверке напоминаний: {str(e)}")
+
+_remote_ids = set()
+_remote_refresh = None
+_background = set()
+
+def _spawn(coro):
+    task = asyncio.get_running_loop().create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return task
+
+def on_remote_task_change(message: dict):
+    """
+    Сообщение брокера событий об изменении задачи в другом процессе.
+
+    Воркеры API рассылают через брокер каждое изменение (events.EventHub).
+    Лидер копит id задач REMINDER_REMOTE_BATCH_SECONDS и перечитывает
+    их напоминания из БД одним запросом (refresh_remote_tasks).
+    """
+    global _remote_refresh
+    if not timer.running:
+        return
+    task = json.loads(message["data"])["task"]
+    _remote_ids.add(int(task["id"]))
+    if _remote_refresh is None:
+        _remote_refresh = _spawn(refresh_remote_tasks(REMINDER_REMOTE_BATCH_SECONDS))
+
+async def refresh_remote_tasks(delay: float = 0):
+    """Обновляет в таймере накопленные задачи из других процессов по их состоянию в БД."""
+    global _remote_refresh
+    await asyncio.sleep(delay)
+    task_ids = list(_remote_ids)
+    _remote_ids.clear()
+    _remote_refresh = None
+    if not task_ids or not timer.running:
+        return
+    async with get_db_context() as db:
+        try:
+            upcoming = await get_due_reminders(db, horizon=REMINDER_HORIZON, task_ids=task_ids)
         except Exception as e:
-            logger.error(f"Ошибка при проверке напоминаний: {str(e)}")
+            logger.error(f"Ошибка при обновлении напоминаний {task_ids}: {str(e)}")
+            return
+    remind_at = {task.id: task.remind_at for task in upcoming}
+    for task_id in task_ids:
+        if task_id in remind_at:
+            timer.schedule(task_id, remind_at[task_id])
+        else:
+            timer.cancel(task_id)
+
+def on_broker_reconnect():
+    # Изменения за время разрыва потеряны — сверяем таймер с БД целиком
+    _spawn(reconcile_reminders())
+
+broker = BrokerLink(EVENTS_BROKER_URL, on_remote_task_change, on_broker_reconnect) if EVENTS_BROKER_URL else None
+
+async def on_settings_change(user_id, settings, previous):
+    """
+    Смена времени напоминания или часового пояса пересчитывает remind_at
+    задач пользователя в БД (crud.update_user_settings); таймер подхватывает
+    их сверкой. Пересчёт в других процессах приходит через брокер событий
+    как изменения задач, а без брокера — при плановой сверке.
+    """
+    if (settings["reminder_time"], settings["reminder_enabled"], settings["timezone"]) != \
+            (previous["reminder_time"], previous["reminder_enabled"], previous["timezone"]):
+        await reconcile_reminders()
+
+add_settings_listener(on_settings_change)
+
+async def elect_leader():
+    """
+    Запускает таймер только в процессе-лидере, чтобы при нескольких воркерах
+    uvicorn сканирование напоминаний не выполнялось N раз. Лидер же слушает
+    брокер событий, через который приходят изменения задач из других процессов.
+    """
+    try:
+        leader = await election.try_acquire()
+    except Exception as e:
+        logger.error(f"Ошибка при выборе лидера напоминаний: {str(e)}")
+        leader = False
+    if leader and not timer.running:
+        add_task_listener(timer.sync_task)
+        timer.start()
+        if broker is not None:
+            broker.start()
+        await reconcile_reminders()
+    elif not leader and timer.running:
+        remove_task_listener(timer.sync_task)
+        if broker is not None:
+            await broker.stop()
+        await timer.stop()
+
+async def cleanup_tombstones():
+    """Периодическая очистка устаревших записей об удалении задач (только в лидере)."""
+    if not timer.running:
+        return
+    async with get_db_context() as db:
+        try:
+            await prune_tombstones(db)
+        except Exception as e:
+            logger.error(f"Ошибка при очистке записей об удалении: {str(e)}")
 
 def start_scheduler():
-    scheduler.add_job(check_reminders, 'interval', minutes=1)
+    global scheduler
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    # Без токена напоминания не отправить — ошибка сразу при запуске, а не в первом тике
+    get_bot()
+    scheduler = AsyncIOScheduler()
+    scheduler.add_job(elect_leader, 'interval', seconds=LEADER_RETRY_SECONDS,
+                      next_run_time=datetime.now(timezone.utc), max_instances=1)
+    scheduler.add_job(reconcile_reminders, 'interval', minutes=REMINDER_RECONCILE_MINUTES)
+    scheduler.add_job(cleanup_tombstones, 'interval', hours=6)
     scheduler.start()
     logger.info("Планировщик напоминаний запущен")
+    return scheduler
+
+async def stop_scheduler():
+    if scheduler is not None:
+        scheduler.shutdown()
+    if broker is not None:
+        await broker.stop()
+    remove_task_listener(timer.sync_task)
+    await timer.stop()
+    await election.release()
+    logger.info("Планировщик напоминаний остановлен")
+
+async def run_worker():
+    """Отдельный процесс напоминаний: python reminders.py (для API с REMINDER_MODE=worker, по умолчанию)."""
+    await ensure_schema(engine)
+    start_scheduler()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stop_scheduler()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run_worker())
+    except KeyboardInterrupt:
+        logger.info("Воркер напоминаний остановлен")
@@ -0,0 +1,166 @@
+import base64
+import json
+import logging
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import column, func, literal_column, select, table, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from models import Task
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Конфигурация полнотекстового поиска Postgres: стемминг русских слов,
+# остальные слова индексируются как есть. Входит в выражение
+# сгенерированной колонки, поэтому меняется только новой миграцией
+SEARCH_CONFIG = "russian"
+# Сколько слов запроса учитывается; остальные отбрасываются
+MAX_SEARCH_TERMS = 8
+# Вес совпадения в заголовке относительно описания для bm25 в SQLite
+# (в Postgres то же задают веса A и B в search_vector)
+TITLE_WEIGHT = 4.0
+
+_WORD = re.compile(r"\w+")
+_TASKS_FTS = table("tasks_fts", column("rowid"))
+
+async def create_search_index(conn: AsyncConnection):
+    """
+    Создаёт полнотекстовый индекс по title и description задач.
+
+    Postgres: сгенерированная колонка tasks.search_vector (tsvector,
+    заголовок с весом A, описание — B) и GIN-индекс idx_task_search.
+    Колонку пересчитывает сама база при любом INSERT/UPDATE, поэтому
+    индекс не зависит от того, каким путём crud пишет задачи. ALTER TABLE
+    с STORED-колонкой переписывает таблицу — на большой базе это делается
+    в окно обслуживания.
+
+    SQLite: таблица FTS5 tasks_fts с внешним содержимым (content=tasks)
+    и триггеры, которые повторяют в ней вставки, изменения и удаления
+    задач. user_id тоже индексируется как слово, чтобы MATCH сразу
+    ограничивал поиск задачами пользователя, а не всей таблицей; индексы
+    префиксов из 2–4 символов ускоряют поиск по мере набора. Индекс
+    перестраивается из tasks, поэтому вызов безопасен повторно и после
+    drop_all.
+
+    Колонка и таблица не описаны в models.py: это объекты конкретной СУБД,
+    и select(Task) их не читает.
+    """
+    if conn.dialect.name == "postgresql":
+        await conn.execute(text(
+            "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+            f"setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, coalesce(title, '')), 'A') || "
+            f"setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, coalesce(description, '')), 'B')"
+            ") STORED"
+        ))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS idx_task_search ON tasks USING GIN (search_vector)"))
+    elif conn.dialect.name == "sqlite":
+        # drop_all не знает о tasks_fts: таблица пересоздаётся и заполняется из tasks
+        await conn.execute(text("DROP TABLE IF EXISTS tasks_fts"))
+        await conn.execute(text(
+            "CREATE VIRTUAL TABLE tasks_fts USING fts5("
+            "title, description, user_id, content='tasks', content_rowid='id', tokenize='unicode61', prefix='2 3 4')"
+        ))
+        await conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN "
+            "INSERT INTO tasks_fts(rowid, title, description, user_id) VALUES (new.id, new.title, new.description, new.user_id); END"
+        ))
+        await conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN "
+            "INSERT INTO tasks_fts(tasks_fts, rowid, title, description, user_id) "
+            "VALUES ('delete', old.id, old.title, old.description, old.user_id); END"
+        ))
+        await conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF title, description, user_id ON tasks BEGIN "
+            "INSERT INTO tasks_fts(tasks_fts, rowid, title, description, user_id) "
+            "VALUES ('delete', old.id, old.title, old.description, old.user_id); "
+            "INSERT INTO tasks_fts(rowid, title, description, user_id) VALUES (new.id, new.title, new.description, new.user_id); END"
+        ))
+        await conn.execute(text("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')"))
+    else:
+        logger.warning(f"Полнотекстовый поиск не поддерживается для {conn.dialect.name}")
+
+def search_terms(q: str) -> List[str]:
+    """Слова запроса в нижнем регистре; операторы и кавычки пользователя не передаются в СУБД."""
+    return _WORD.findall(q.lower())[:MAX_SEARCH_TERMS]
+
+def encode_search_cursor(rank: float, task_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([rank, task_id]).encode()).decode().rstrip("=")
+
+def decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        rank, task_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return float(rank), int(task_id)
+    except (ValueError, TypeError) as e:
+        logger.error(f"Неверный курсор поиска: {cursor}, ошибка: {str(e)}")
+        raise ValueError(f"Неверный курсор поиска: {cursor}")
+
+async def search_tasks(db: AsyncSession, user_id: int, q: str, limit: int = 20,
+                       cursor: Optional[str] = None, completed: Optional[bool] = None,
+                       columns: Optional[tuple] = None):
+    """
+    Поиск задач пользователя по словам в заголовке и описании.
+
+    Задача подходит, если содержит все слова запроса; последнее слово
+    может быть началом слова (поиск по мере набора). Postgres приводит
+    слова к основе, FTS5 в SQLite сравнивает их как есть. Результаты
+    отсортированы по релевантности: ts_rank_cd в Postgres, bm25 в SQLite,
+    совпадение в заголовке весит больше. Страница задаётся курсором
+    (релевантность, id) последней выданной задачи. Релевантность bm25
+    зависит от статистики всей таблицы, поэтому при изменении задач
+    между страницами порядок может немного сдвинуться.
+
+    Args:
+        q (str): Строка запроса
+        limit (int): Размер страницы
+        cursor (str): Курсор из предыдущей страницы
+        completed (bool): Только выполненные или только невыполненные задачи
+        columns (tuple): Выбрать только эти колонки Task и вернуть строки вместо ORM-объектов
+
+    Returns:
+        Кортеж (задачи, курсор следующей страницы или None)
+    """
+    terms = search_terms(q)
+    if not terms:
+        return [], None
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        words = [f"{term}:*" if i == len(terms) - 1 else term for i, term in enumerate(terms)]
+        tsquery = func.to_tsquery(literal_column(f"'{SEARCH_CONFIG}'::regconfig"), " & ".join(words))
+        vector = literal_column("tasks.search_vector")
+        rank = func.ts_rank_cd(vector, tsquery).label("rank")
+        query = select(*columns, rank) if columns else select(Task, rank)
+        query = query.where(vector.op("@@")(tsquery))
+    elif dialect == "sqlite":
+        words = [f'"{term}"*' if i == len(terms) - 1 else f'"{term}"' for i, term in enumerate(terms)]
+        fts = literal_column("tasks_fts")
+        # Слова запроса ищутся только в title и description: без фильтра колонок
+        # запрос «42» совпал бы с индексированным user_id всех задач пользователя 42
+        # bm25 тем меньше, чем лучше совпадение; со знаком минус порядок тот же, что в Postgres
+        rank = (-func.bm25(fts, TITLE_WEIGHT, 1.0, 0.0)).label("rank")
+        query = select(*columns, rank) if columns else select(Task, rank)
+        query = query.join_from(Task, _TASKS_FTS, _TASKS_FTS.c.rowid == Task.id) \
+            .where(fts.op("MATCH")(f'user_id : "{int(user_id)}" AND {{title description}} : ({" ".join(words)})'))
+    else:
+        raise ValueError(f"Полнотекстовый поиск не поддерживается для {dialect}")
+    query = query.where(Task.user_id == user_id)
+    if completed is not None:
+        query = query.where(Task.completed == completed)
+    if cursor:
+        last_rank, last_id = decode_search_cursor(cursor)
+        query = query.where(tuple_(rank.element, Task.id) < tuple_(last_rank, last_id))
+    query = query.order_by(rank.element.desc(), Task.id.desc()).limit(limit + 1)
+
+    try:
+        result = (await db.execute(query)).all()
+    except Exception as e:
+        logger.error(f"Ошибка поиска задач для user_id={user_id}, q={q!r}: {str(e)}")
+        raise
+    next_cursor = None
+    if len(result) > limit:
+        result = result[:limit]
+        next_cursor = encode_search_cursor(result[-1].rank, result[-1].id if columns else result[-1][0].id)
+    tasks = [row[:-1] for row in result] if columns else [row[0] for row in result]
+    return tasks, next_cursor
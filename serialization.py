@@ -0,0 +1,35 @@
+import logging
+from datetime import datetime, timezone
+from typing import Iterable, Sequence
+
+import orjson
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def as_utc(value: datetime) -> datetime:
+    # SQLite возвращает naive datetime — считаем, что он уже в UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def isoformat(value: datetime) -> str:
+    # Тот же формат, что у Pydantic: UTC выводится как Z
+    text = value.isoformat()
+    return text[:-6] + "Z" if text.endswith("+00:00") else text
+
+def dumps(value) -> bytes:
+    """Кодирует значение в JSON-байты; datetime в UTC выводится с Z, как у Pydantic."""
+    return orjson.dumps(value, option=orjson.OPT_UTC_Z)
+
+def loads(data):
+    return orjson.loads(data)
+
+def rows_to_dicts(rows: Iterable[Sequence], fields: Sequence[str]) -> list:
+    """
+    Строки результата (без ORM-объектов) в словари по именам полей.
+
+    Значения не проходят валидацию Pydantic: колонки выбираются ровно
+    те, что описаны в схеме ответа, и типы совпадают с ней.
+    """
+    return [dict(zip(fields, row)) for row in rows]
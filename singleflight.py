@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set
+from urllib.parse import parse_qsl, urlencode
+
+import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Объединять одинаковые одновременные GET-запросы списков в один запрос к базе
+SINGLE_FLIGHT_ENABLED = os.environ.get("SINGLE_FLIGHT", "true").lower() == "true"
+
+executed = metrics.registry.counter("single_flight_executed_total",
+                                    "Запросы, выполненные приложением (ведущие)", labels=("path",))
+coalesced = metrics.registry.counter("single_flight_coalesced_total",
+                                     "Запросы, получившие ответ уже выполняющегося одинакового запроса",
+                                     labels=("path",))
+
+class SingleFlight:
+    """
+    Объединение одновременных одинаковых вызовов: пока вызов с ключом
+    выполняется, следующие с тем же ключом ждут его результат, а не
+    запускают свой.
+
+    Вызов выполняется отдельной задачей: если клиент ведущего запроса
+    отключится, остальные всё равно получат результат. forget_user
+    убирает незавершённые вызовы пользователя из таблицы после записи
+    его данных — запросы, пришедшие после записи, не получат ответ,
+    прочитанный до неё.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._user_keys: Dict[int, Set[str]] = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def do(self, key: str, user_id: Optional[int], call: Callable[[], Awaitable], path: str = ""):
+        future = self._calls.get(key)
+        if future is not None:
+            coalesced.inc(path=path)
+            return await asyncio.shield(future)
+        executed.inc(path=path)
+        future = asyncio.ensure_future(call())
+        self._calls[key] = future
+        if user_id is not None:
+            self._user_keys.setdefault(user_id, set()).add(key)
+        future.add_done_callback(lambda done: self._remove(key, user_id, done))
+        return await asyncio.shield(future)
+
+    def forget_user(self, user_id: int):
+        for key in self._user_keys.pop(user_id, ()):
+            self._calls.pop(key, None)
+
+    def _remove(self, key: str, user_id: Optional[int], future: asyncio.Future):
+        if not future.cancelled():
+            # Ведущий мог отключиться, не дождавшись результата: исключение считается полученным
+            future.exception()
+        if self._calls.get(key) is future:
+            del self._calls[key]
+            keys = self._user_keys.get(user_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._user_keys[user_id]
+
+    async def on_task_change(self, event: str, task, previous: Optional[dict] = None):
+        """Подписчик crud на изменения задач."""
+        self.forget_user(task.user_id)
+
+    async def on_settings_change(self, user_id: int, settings=None, previous=None):
+        """Подписчик crud на изменение настроек."""
+        self.forget_user(user_id)
+
+def request_key(scope) -> str:
+    """Путь и параметры запроса в каноническом порядке: ?a=1&b=2 и ?b=2&a=1 — один запрос."""
+    params = sorted(parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True))
+    return f"{scope['path']}?{urlencode(params)}"
+
+class SingleFlightMiddleware:
+    """
+    ASGI-middleware: одинаковые одновременные GET-запросы к путям из
+    paths выполняются приложением один раз, ответ (статус, заголовки,
+    тело) отдаётся всем.
+
+    Ответ ведущего запроса собирается целиком в памяти, поэтому paths —
+    только обычные JSON-ответы, без потоков (/tasks/events, /tasks/export).
+    Одинаковыми считаются запросы с тем же путём и параметрами: ответ
+    этих путей зависит только от них.
+    """
+
+    def __init__(self, app, flights: Optional[SingleFlight], paths: Iterable[str]):
+        self.app = app
+        self.flights = flights
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if self.flights is None or scope["type"] != "http" or scope["method"] != "GET" \
+                or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        key = request_key(scope)
+        user_id = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1"))).get("user_id")
+        messages, route = await self.flights.do(
+            key, int(user_id) if user_id and user_id.isdigit() else None,
+            lambda: self._run(scope, receive), path=scope["path"],
+        )
+        if route is not None:
+            # Для метрик запросов в RequestMetricsMiddleware
+            scope["route"] = route
+        for message in messages:
+            await send(message)
+
+    async def _run(self, scope, receive):
+        messages = []
+
+        async def collect(message):
+            messages.append(message)
+
+        await self.app(scope, receive, collect)
+        return messages, scope.get("route")
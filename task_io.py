@@ -0,0 +1,222 @@
+import csv
+import io
+import logging
+from datetime import datetime
+from typing import AsyncIterator, List, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import serialization
+from crud import TASK_FIELDS, create_tasks_bulk, stream_task_rows
+from models import Task
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Поля выгрузки; при загрузке id и created_at игнорируются, задачи создаются заново
+EXPORT_FIELDS = ("id",) + TASK_FIELDS + ("created_at",)
+EXPORT_COLUMNS = tuple(getattr(Task, name) for name in EXPORT_FIELDS)
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+# Сколько задач вставляется одним INSERT при загрузке
+IMPORT_BATCH_SIZE = 500
+# Защита от строки без переводов строк, которая иначе копилась бы в памяти целиком
+MAX_LINE_BYTES = 1024 * 1024
+# Сколько ошибок по строкам возвращать в ответе (считаются все)
+MAX_REPORTED_ERRORS = 100
+
+PRIORITIES = ("High", "Medium", "Low")
+_TRUE = {"true", "1", "yes", "да"}
+_FALSE = {"false", "0", "no", "нет", ""}
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return serialization.isoformat(value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+def encode_ndjson(rows) -> bytes:
+    """Пачку строк выгрузки — в NDJSON (одна задача на строку)."""
+    return b"".join(serialization.dumps(dict(zip(EXPORT_FIELDS, row))) + b"\n" for row in rows)
+
+def encode_csv(rows, header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    writer.writerows([_csv_value(value) for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+async def export_chunks(db: AsyncSession, user_id: int, format: str = "ndjson",
+                        chunk: int = 1000) -> AsyncIterator[bytes]:
+    """Выгрузка задач пользователя кусками байтов: по одному куску на пачку строк курсора."""
+    if format == "csv":
+        yield encode_csv((), header=True)
+    encode = encode_csv if format == "csv" else encode_ndjson
+    async for rows in stream_task_rows(db, user_id, EXPORT_COLUMNS, chunk=chunk):
+        yield encode(rows)
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Разбивает поток байтов на строки, держа в памяти только незавершённую строку."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+        if len(buffer) > MAX_LINE_BYTES:
+            raise ValueError(f"Строка длиннее {MAX_LINE_BYTES} байт")
+    if buffer:
+        yield buffer
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    """Записи NDJSON: (номер строки, dict или ValueError для неразобранной строки)."""
+    number = 0
+    async for line in iter_lines(chunks):
+        number += 1
+        if not line.strip():
+            continue
+        try:
+            record = serialization.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("ожидается JSON-объект")
+            yield number, record
+        except ValueError as e:
+            yield number, ValueError(f"Неверный JSON: {str(e)}")
+
+async def iter_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    """
+    Записи CSV с заголовком: (номер строки, dict или ValueError).
+
+    Поле в кавычках может содержать перевод строки, поэтому строки
+    склеиваются, пока число кавычек в записи нечётное.
+    """
+    header = None
+    pending, start, number = [], 0, 0
+    async for line in iter_lines(chunks):
+        number += 1
+        if not pending:
+            start = number
+        pending.append(line.decode("utf-8-sig" if number == 1 else "utf-8"))
+        record = "\n".join(pending)
+        if record.count('"') % 2:
+            if len(record) > MAX_LINE_BYTES:
+                raise ValueError(f"Запись CSV длиннее {MAX_LINE_BYTES} байт")
+            continue
+        pending = []
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield start, ValueError(f"Ожидается {len(header)} полей, получено {len(values)}")
+            continue
+        yield start, dict(zip(header, values))
+    if pending:
+        yield start, ValueError("Незакрытые кавычки в конце файла")
+
+def _parse_bool(value, name: str) -> bool:
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError(f"Неверное значение {name}: {value}")
+
+def normalize_record(record: dict) -> dict:
+    """
+    Приводит запись выгрузки к полям create_tasks_bulk. Все поля
+    заполняются, чтобы строки пачки имели одинаковый набор ключей;
+    дедлайн разбирает сам create_tasks_bulk (crud.parse_deadline).
+    """
+    title = str(record.get("title") or "").strip()
+    if not title:
+        raise ValueError("Пустое название задачи")
+    priority = record.get("priority") or "Medium"
+    if priority not in PRIORITIES:
+        raise ValueError(f"Неверный приоритет: {priority}")
+    deadline = record.get("deadline")
+    interval = record.get("recurrence_interval")
+    try:
+        interval = int(interval) if interval not in (None, "") else None
+    except (TypeError, ValueError):
+        raise ValueError(f"Неверный интервал повторения: {interval}")
+    until = record.get("recurrence_until")
+    return {
+        "title": title[:255],
+        "description": record.get("description") or None,
+        "deadline": str(deadline) if deadline else None,
+        "priority": priority,
+        "reminder": _parse_bool(record.get("reminder"), "reminder"),
+        "completed": _parse_bool(record.get("completed"), "completed"),
+        "recurrence": record.get("recurrence") or None,
+        "recurrence_interval": interval,
+        "recurrence_until": str(until) if until else None,
+    }
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.error_count = 0
+        self.errors: List[dict] = []
+
+    def error(self, line: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self) -> dict:
+        return {"created": self.created, "error_count": self.error_count, "errors": self.errors}
+
+async def import_tasks(db: AsyncSession, user_id: int, records: AsyncIterator[Tuple[int, object]],
+                       batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """
+    Загружает задачи из потока записей пачками через crud.create_tasks_bulk.
+
+    В памяти одновременно не больше одной пачки; каждая пачка — один INSERT
+    и один коммит, поэтому при ошибке посередине уже загруженное сохраняется.
+
+    Returns:
+        dict: created, error_count и первые ошибки с номерами строк
+    """
+    report = ImportReport()
+    batch: List[dict] = []
+    lines: List[int] = []
+
+    async def flush():
+        results = await create_tasks_bulk(db, user_id=user_id, items=batch)
+        for line, result in zip(lines, results):
+            if result["status"] == "created":
+                report.created += 1
+            else:
+                report.error(line, result.get("error") or "Не удалось создать задачу")
+        batch.clear()
+        lines.clear()
+
+    async for line, record in records:
+        if isinstance(record, Exception):
+            report.error(line, str(record))
+            continue
+        try:
+            batch.append(normalize_record(record))
+        except ValueError as e:
+            report.error(line, str(e))
+            continue
+        lines.append(line)
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    logger.info(f"Загружено задач: {report.created}, ошибок: {report.error_count} для user_id={user_id}")
+    return report.as_dict()
@@ -0,0 +1,79 @@
+"""
+Общие фикстуры тестов: отдельная база SQLite (aiosqlite) на каждый тест.
+
+Модули приложения читают настройки из окружения при импорте, поэтому
+значения по умолчанию задаются здесь, до импорта crud и main.
+"""
+import os
+import tempfile
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'app.db')}")
+os.environ.setdefault("REMINDER_MODE", "off")
+os.environ.setdefault("TASK_CACHE_BACKEND", "off")
+os.environ.setdefault("RATE_LIMIT_BACKEND", "off")
+os.environ.setdefault("SINGLE_FLIGHT", "false")
+
+import httpx
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import crud
+from migrations import create_schema
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'tasks.db'}")
+    async with engine.begin() as conn:
+        await create_schema(conn)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+
+
+@pytest.fixture
+async def db(session_factory):
+    async with session_factory() as session:
+        yield session
+
+
+@pytest.fixture
+def task_events():
+    """События подписчиков crud на изменения задач: список (event, задача, previous)."""
+    events = []
+
+    def listener(event, task, previous=None):
+        events.append((event, task, previous))
+
+    crud.add_task_listener(listener)
+    yield events
+    crud.remove_task_listener(listener)
+
+
+@pytest.fixture
+async def client(session_factory, monkeypatch):
+    """Клиент API поверх базы теста: сессии main подменяются через dependency_overrides."""
+    import main
+    from cache import LRUTTLBackend
+    from database import get_db, get_read_db
+
+    async def override_db():
+        async with session_factory() as session:
+            yield session
+
+    main.app.dependency_overrides[get_db] = override_db
+    main.app.dependency_overrides[get_read_db] = override_db
+    monkeypatch.setattr(main.settings_cache, "backend", LRUTTLBackend())
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        yield client
+    main.app.dependency_overrides.clear()
@@ -0,0 +1,64 @@
+import pytest
+
+import crud
+
+pytestmark = pytest.mark.anyio
+
+
+def statuses(response):
+    return [(item["index"], item["status"]) for item in response.json()["results"]]
+
+
+async def test_create_batch_skips_invalid_items(client, db):
+    response = await client.post("/tasks/batch", params={"user_id": 1}, json={"tasks": [
+        {"title": "Отчёт", "deadline": "2026-05-01T09:00:00Z"},
+        {"title": "Сломанный дедлайн", "deadline": "завтра"},
+        {"title": "Звонок"},
+    ]})
+
+    assert response.status_code == 200
+    assert statuses(response) == [(0, "created"), (1, "error"), (2, "created")]
+    assert "завтра" in response.json()["results"][1]["error"]
+    tasks, _ = await crud.get_tasks_page(db, user_id=1)
+    assert sorted(task.title for task in tasks) == ["Звонок", "Отчёт"]
+
+
+async def test_update_batch_reports_each_item(client, db):
+    created = await crud.create_tasks_bulk(db, 1, [{"title": "Первая"}, {"title": "Вторая"}])
+    foreign = await crud.create_task(db, user_id=2, title="Чужая")
+    first, second = (result["id"] for result in created)
+
+    response = await client.patch("/tasks/batch", params={"user_id": 1}, json={"tasks": [
+        {"id": first, "completed": True},
+        {"id": second, "completed": True},
+        {"id": foreign.id, "completed": True},
+        {"id": 999, "completed": True},
+        {"id": first, "deadline": "никогда"},
+    ]})
+
+    assert response.status_code == 200
+    assert statuses(response) == [(0, "updated"), (1, "updated"), (2, "error"), (3, "error"), (4, "error")]
+    done, _ = await crud.get_tasks_page(db, user_id=1, completed=True)
+    assert sorted(task.id for task in done) == [first, second]
+    others, _ = await crud.get_tasks_page(db, user_id=2)
+    assert [task.completed for task in others] == [False]
+
+
+async def test_delete_batch_reports_missing_ids(client, db):
+    created = await crud.create_tasks_bulk(db, 1, [{"title": "Первая"}, {"title": "Вторая"}])
+    first, second = (result["id"] for result in created)
+
+    response = await client.request("DELETE", "/tasks/batch", params={"user_id": 1},
+                                    json={"ids": [first, 999, second]})
+
+    assert response.status_code == 200
+    assert statuses(response) == [(0, "deleted"), (1, "error"), (2, "deleted")]
+    tasks, _ = await crud.get_tasks_page(db, user_id=1)
+    assert tasks == []
+
+
+async def test_batch_size_is_limited(client):
+    response = await client.post("/tasks/batch", params={"user_id": 1},
+                                 json={"tasks": [{"title": f"Задача {i}"} for i in range(501)]})
+
+    assert response.status_code == 422
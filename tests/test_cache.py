@@ -0,0 +1,100 @@
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import pytest
+
+from cache import InMemoryStore, LRUTTLBackend, SharedBackend, TaskCache, create_task_cache
+
+pytestmark = pytest.mark.anyio
+
+DAY = date(2026, 5, 1)
+
+
+def make_task(deadline=datetime(2026, 5, 1, 9, 0)):
+    return SimpleNamespace(id=1, user_id=1, deadline=deadline, recurrence=None)
+
+
+class Loader:
+    """Загрузчик списков: считает вызовы и может выполнить действие посреди загрузки."""
+
+    def __init__(self):
+        self.calls = 0
+        self.during = None
+
+    async def __call__(self, db, user_id, day):
+        self.calls += 1
+        if self.during is not None:
+            await self.during()
+        return [{"id": 1, "version": self.calls}]
+
+
+@pytest.fixture(params=["memory", "shared"])
+def backend(request):
+    if request.param == "memory":
+        return LRUTTLBackend()
+    return SharedBackend(InMemoryStore())
+
+
+async def test_hit_after_miss(backend):
+    loader = Loader()
+    cache = TaskCache(backend, loader)
+
+    first = await cache.get_tasks(None, 1, DAY)
+    second = await cache.get_tasks(None, 1, DAY)
+
+    assert first == second
+    assert (cache.misses, cache.hits, loader.calls) == (1, 1, 1)
+
+
+async def test_update_drops_day_and_full_list(backend):
+    loader = Loader()
+    cache = TaskCache(backend, loader)
+    await cache.get_tasks(None, 1, DAY)
+    await cache.get_tasks(None, 1, None)
+    await cache.get_tasks(None, 1, date(2026, 6, 1))
+
+    await cache.invalidate("updated", make_task(), previous={"deadline": None})
+
+    assert await backend.get(TaskCache.key(1, DAY)) is None
+    assert await backend.get(TaskCache.key(1, None)) is None
+    assert await backend.get(TaskCache.key(1, date(2026, 6, 1))) is not None
+
+
+async def test_invalidation_during_load_is_not_cached(backend):
+    loader = Loader()
+    cache = TaskCache(backend, loader)
+    # Запись в задачу приходит, пока список ещё загружается
+    loader.during = lambda: cache.invalidate("created", make_task())
+
+    stale = await cache.get_tasks(None, 1, DAY)
+    loader.during = None
+    fresh = await cache.get_tasks(None, 1, DAY)
+
+    assert stale != fresh
+    assert loader.calls == 2
+
+
+async def test_timezone_change_drops_all_user_keys(backend):
+    cache = TaskCache(backend, Loader())
+    await cache.get_tasks(None, 1, DAY)
+    await cache.get_tasks(None, 2, DAY)
+
+    await cache.invalidate_user(1)
+
+    assert await backend.get(TaskCache.key(1, DAY)) is None
+    assert await backend.get(TaskCache.key(2, DAY)) is not None
+
+
+def test_default_backend_depends_on_workers(monkeypatch):
+    monkeypatch.delenv("TASK_CACHE_BACKEND", raising=False)
+
+    assert isinstance(create_task_cache(Loader(), workers=1).backend, LRUTTLBackend)
+    assert create_task_cache(Loader(), workers=4) is None
+
+
+def test_shared_without_redis_url_refuses_to_start(monkeypatch):
+    monkeypatch.setenv("TASK_CACHE_BACKEND", "shared")
+    monkeypatch.delenv("REDIS_URL", raising=False)
+
+    with pytest.raises(ValueError):
+        create_task_cache(Loader())
@@ -0,0 +1,73 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from events import RESYNC_FRAME, RETRY_FRAME, EventHub
+
+pytestmark = pytest.mark.anyio
+
+
+def make_hub(**kwargs):
+    return EventHub(lambda task: {"id": task.id, "title": task.title}, **kwargs)
+
+
+def make_task(task_id=1, user_id=1, title="Отчёт"):
+    return SimpleNamespace(id=task_id, user_id=user_id, title=title)
+
+
+def decode(frame: bytes) -> dict:
+    assert frame.startswith(b"data: ") and frame.endswith(b"\n\n")
+    return json.loads(frame[len(b"data: "):-2])
+
+
+async def test_change_reaches_only_owner():
+    hub = make_hub()
+    own, other = hub.subscribe(1), hub.subscribe(2)
+
+    await hub.on_task_change("updated", make_task())
+
+    assert decode(own.queue.get_nowait()) == {"type": "updated", "task": {"id": 1, "title": "Отчёт"}}
+    assert other.queue.empty()
+
+
+async def test_change_without_subscribers_is_not_serialized():
+    hub = make_hub()
+
+    await hub.on_task_change("created", make_task())
+
+    assert hub.published == 0
+
+
+async def test_slow_subscriber_gets_resync_and_is_closed():
+    hub = make_hub(queue_size=3)
+    subscriber = hub.subscribe(1)
+
+    for task_id in range(5):
+        await hub.on_task_change("updated", make_task(task_id))
+
+    assert subscriber.closed
+    assert subscriber.queue.get_nowait() == RESYNC_FRAME
+    assert subscriber.queue.get_nowait() is None
+
+
+async def test_remote_message_is_delivered_locally():
+    hub = make_hub()
+    subscriber = hub.subscribe(1)
+
+    hub._on_remote({"user_id": 1, "data": json.dumps({"type": "deleted", "task": {"id": 7}})})
+
+    assert decode(subscriber.queue.get_nowait()) == {"type": "deleted", "task": {"id": 7}}
+
+
+async def test_stream_starts_with_retry_and_unsubscribes():
+    hub = make_hub()
+    stream = hub.stream(1)
+
+    assert await stream.__anext__() == RETRY_FRAME
+    assert len(hub) == 1
+    await hub.on_task_change("created", make_task())
+    assert decode(await stream.__anext__())["type"] == "created"
+
+    await stream.aclose()
+    assert len(hub) == 0
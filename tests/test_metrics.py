@@ -0,0 +1,23 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import metrics
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_failed_statement_leaves_no_start_time(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'metrics.db'}")
+    metrics.instrument_engine(engine)
+    try:
+        async with engine.connect() as conn:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    await conn.execute(text("SELECT * FROM missing_table"))
+            assert "query_start" not in conn.sync_connection.info
+            assert (await conn.execute(text("SELECT 1"))).scalar() == 1
+            assert "query_start" not in conn.sync_connection.info
+    finally:
+        await engine.dispose()
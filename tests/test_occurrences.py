@@ -0,0 +1,117 @@
+"""Повторяющиеся задачи: развёртывание вхождений в выдаче и отметка вхождений."""
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from crud import create_task, get_task_calendar, get_tasks_page, set_occurrence_completed
+from models import Task
+
+pytestmark = pytest.mark.anyio
+
+
+def day_start(days: int = 0) -> datetime:
+    start = datetime.now(timezone.utc).replace(hour=9, minute=0, second=0, microsecond=0)
+    return start + timedelta(days=days)
+
+
+async def test_occurrence_of_missing_task_is_404(client):
+    response = await client.put("/tasks/999/occurrences", params={"user_id": 1},
+                                json={"occurrence": day_start(1).isoformat(), "completed": True})
+
+    assert response.status_code == 404
+
+
+async def test_occurrence_of_foreign_task_is_404(client, db):
+    task = await create_task(db, user_id=1, title="Зарядка", deadline=day_start(1).isoformat(), recurrence="daily")
+
+    response = await client.put(f"/tasks/{task.id}/occurrences", params={"user_id": 2},
+                                json={"occurrence": day_start(1).isoformat(), "completed": True})
+
+    assert response.status_code == 404
+
+
+async def test_occurrence_outside_rule_is_400(client, db):
+    task = await create_task(db, user_id=1, title="Зарядка", deadline=day_start(1).isoformat(), recurrence="daily")
+
+    response = await client.put(f"/tasks/{task.id}/occurrences", params={"user_id": 1},
+                                json={"occurrence": (day_start(2) + timedelta(hours=1)).isoformat(), "completed": True})
+
+    assert response.status_code == 400
+
+
+async def test_occurrence_completed(client, db):
+    task = await create_task(db, user_id=1, title="Зарядка", deadline=day_start(1).isoformat(), recurrence="daily")
+
+    response = await client.put(f"/tasks/{task.id}/occurrences", params={"user_id": 1},
+                                json={"occurrence": day_start(3).isoformat(), "completed": True})
+
+    assert response.status_code == 200
+    assert response.json()["completed"] is True
+
+
+async def test_day_lists_occurrence_of_earlier_rule(db):
+    task = await create_task(db, user_id=1, title="Зарядка", deadline=day_start(-2).isoformat(), recurrence="daily")
+
+    tasks, _ = await get_tasks_page(db, user_id=1, date=day_start(1).date())
+
+    assert [(row.id, row.deadline.replace(tzinfo=timezone.utc)) for row in tasks] == [(task.id, day_start(1))]
+    assert tasks[0].completed is False
+
+
+@pytest.mark.parametrize("columns", [None, (Task.id, Task.deadline)])
+async def test_range_pages_mix_tasks_and_occurrences(db, columns):
+    first = await create_task(db, user_id=1, title="Отчёт", deadline=(day_start(1) + timedelta(hours=1)).isoformat())
+    second = await create_task(db, user_id=1, title="Звонок", deadline=(day_start(2) - timedelta(hours=1)).isoformat())
+    rule = await create_task(db, user_id=1, title="Зарядка", deadline=day_start(1).isoformat(), recurrence="daily")
+    await db.commit()
+    range_from, range_to = day_start(1) - timedelta(hours=9), day_start(3) - timedelta(hours=9)
+
+    pages, cursor = [], None
+    while True:
+        tasks, cursor = await get_tasks_page(db, user_id=1, limit=1, cursor=cursor, deadline_from=range_from,
+                                             deadline_to=range_to, columns=columns)
+        pages.extend(tasks)
+        if cursor is None:
+            break
+
+    assert [row.id for row in pages] == [rule.id, first.id, second.id, rule.id]
+    # Вхождения в том же виде, что и сохранённые задачи: naive UTC в SQLite
+    assert {row.deadline.tzinfo for row in pages} == {None}
+    assert [row.deadline for row in pages] == sorted(row.deadline for row in pages)
+
+
+async def test_completed_occurrence_filtered(db, session_factory):
+    rule = await create_task(db, user_id=1, title="Зарядка", deadline=day_start(1).isoformat(), recurrence="daily")
+    async with session_factory() as session:
+        await set_occurrence_completed(session, user_id=1, task_id=rule.id, occurrence=day_start(2))
+
+    done, _ = await get_tasks_page(db, user_id=1, deadline_from=day_start(1), deadline_to=day_start(4), completed=True)
+    open_, _ = await get_tasks_page(db, user_id=1, deadline_from=day_start(1), deadline_to=day_start(4),
+                                    completed=False)
+
+    assert [row.deadline for row in done] == [day_start(2).replace(tzinfo=None)]
+    assert [row.deadline for row in open_] == [day_start(1).replace(tzinfo=None), day_start(3).replace(tzinfo=None)]
+
+
+async def test_calendar_counts_occurrences(db, session_factory):
+    rule = await create_task(db, user_id=1, title="Зарядка", deadline=day_start(1).isoformat(), recurrence="daily",
+                             recurrence_until=day_start(2).isoformat())
+    await create_task(db, user_id=1, title="Отчёт", deadline=(day_start(2) + timedelta(hours=1)).isoformat())
+    async with session_factory() as session:
+        await set_occurrence_completed(session, user_id=1, task_id=rule.id, occurrence=day_start(1))
+
+    calendar = await get_task_calendar(db, user_id=1, start=day_start().date(), end=day_start(5).date())
+
+    assert calendar == [{"date": day_start(1).date(), "total": 1, "completed": 1},
+                        {"date": day_start(2).date(), "total": 2, "completed": 0}]
+
+
+async def test_occurrences_keep_local_time_across_dst(db):
+    # 09:00 по Берлину: летом это 07:00 UTC, после 27 октября 2030 — 08:00 UTC
+    await create_task(db, user_id=1, title="Зарядка", deadline="2030-10-21T07:00:00+00:00", recurrence="daily")
+
+    before, _ = await get_tasks_page(db, user_id=1, date=date(2030, 10, 26), tz="Europe/Berlin")
+    after, _ = await get_tasks_page(db, user_id=1, date=date(2030, 10, 28), tz="Europe/Berlin")
+
+    assert [row.deadline for row in before] == [datetime(2030, 10, 26, 7, 0)]
+    assert [row.deadline for row in after] == [datetime(2030, 10, 28, 8, 0)]
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import crud
+
+pytestmark = pytest.mark.anyio
+
+START = datetime(2026, 5, 1, 9, 0, tzinfo=timezone.utc)
+
+
+async def seed(db, user_id: int = 1):
+    """12 задач: часть с одинаковым дедлайном, две без дедлайна, три выполнены."""
+    tasks = []
+    for i in range(12):
+        deadline = None if i in (3, 8) else (START + timedelta(hours=i // 2)).isoformat()
+        tasks.append(await crud.create_task(db, user_id=user_id, title=f"Задача {i}", deadline=deadline,
+                                            priority="High" if i % 3 == 0 else "Low", completed=i in (1, 5, 9)))
+    await crud.create_task(db, user_id=user_id + 1, title="Чужая", deadline=START.isoformat())
+    return tasks
+
+
+async def collect(db, **kwargs):
+    pages, cursor = [], None
+    while True:
+        rows, cursor = await crud.get_tasks_page(db, user_id=1, cursor=cursor, **kwargs)
+        pages.append([row.id for row in rows])
+        if cursor is None:
+            return pages
+
+
+def expected_order(tasks, reverse: bool = False):
+    dated = sorted((task for task in tasks if task.deadline is not None),
+                   key=lambda task: (task.deadline, task.id), reverse=reverse)
+    undated = sorted((task for task in tasks if task.deadline is None), key=lambda task: task.id, reverse=reverse)
+    return [task.id for task in dated + undated]
+
+
+@pytest.mark.parametrize("order", ["asc", "desc"])
+async def test_pages_cover_all_tasks_in_order(db, order):
+    tasks = await seed(db)
+
+    pages = await collect(db, limit=5, order=order)
+
+    assert [len(page) for page in pages] == [5, 5, 2]
+    assert sum(pages, []) == expected_order(tasks, reverse=order == "desc")
+
+
+async def test_pages_by_created_at(db):
+    tasks = await seed(db)
+
+    pages = await collect(db, limit=4, sort="created_at")
+
+    assert sum(pages, []) == [task.id for task in sorted(tasks, key=lambda task: (task.created_at, task.id))]
+
+
+async def test_filters(db):
+    tasks = await seed(db)
+
+    rows, cursor = await crud.get_tasks_page(db, user_id=1, completed=False, priority="High")
+    assert cursor is None
+    assert sorted(task.id for task in rows) == sorted(
+        task.id for task in tasks if not task.completed and task.priority == "High")
+
+    rows, _ = await crud.get_tasks_page(db, user_id=1, deadline_from=START + timedelta(hours=1),
+                                        deadline_to=START + timedelta(hours=3))
+    assert sorted(task.id for task in rows) == sorted(
+        task.id for task in tasks
+        if task.deadline is not None and START + timedelta(hours=1) <= task.deadline.replace(tzinfo=timezone.utc)
+        < START + timedelta(hours=3))
+
+
+async def test_page_size_equal_to_total_has_no_cursor(db):
+    tasks = await seed(db)
+
+    rows, cursor = await crud.get_tasks_page(db, user_id=1, limit=len(tasks))
+
+    assert len(rows) == len(tasks) and cursor is None
+
+
+async def test_invalid_arguments(db):
+    with pytest.raises(ValueError):
+        await crud.get_tasks_page(db, user_id=1, cursor="не-курсор")
+    with pytest.raises(ValueError):
+        await crud.get_tasks_page(db, user_id=1, sort="title")
+    with pytest.raises(ValueError):
+        await crud.get_tasks_page(db, user_id=1, order="up")
@@ -0,0 +1,66 @@
+import httpx
+import pytest
+
+from ratelimit import RateLimitMiddleware, SharedTokenBucket, TokenBucket
+
+pytestmark = pytest.mark.anyio
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def make_client(limiter):
+    app = RateLimitMiddleware(ok_app, limiter, exempt_paths=("/health",))
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+async def test_bucket_allows_burst_then_asks_to_wait():
+    bucket = TokenBucket(rate=2, burst=3)
+
+    waits = [await bucket.acquire("user:1") for _ in range(4)]
+
+    assert waits[:3] == [0, 0, 0]
+    assert 0 < waits[3] <= 0.5
+
+
+async def test_bucket_keeps_at_most_max_keys():
+    bucket = TokenBucket(rate=1, burst=1, max_keys=2)
+
+    for user_id in range(3):
+        await bucket.acquire(f"user:{user_id}")
+
+    assert len(bucket) == 2
+    # Вытеснено самое старое ведро — у пользователя 0 снова полный запас
+    assert await bucket.acquire("user:0") == 0
+
+
+async def test_over_limit_gets_429_with_retry_after():
+    async with make_client(TokenBucket(rate=0.5, burst=2)) as client:
+        statuses = [(await client.get("/tasks", params={"user_id": 1})).status_code for _ in range(2)]
+        rejected = await client.get("/tasks", params={"user_id": 1})
+        other_user = await client.get("/tasks", params={"user_id": 2})
+
+    assert statuses == [200, 200]
+    assert rejected.status_code == 429
+    assert rejected.headers["retry-after"] == "2"
+    assert "detail" in rejected.json()
+    assert other_user.status_code == 200
+
+
+async def test_exempt_path_is_not_limited():
+    async with make_client(TokenBucket(rate=0.5, burst=1)) as client:
+        statuses = [(await client.get("/health")).status_code for _ in range(3)]
+
+    assert statuses == [200, 200, 200]
+
+
+async def test_shared_bucket_lets_requests_through_when_store_fails():
+    class BrokenRedis:
+        async def eval(self, *args):
+            raise ConnectionError("Redis недоступен")
+
+    bucket = SharedTokenBucket(BrokenRedis(), rate=1, burst=1)
+
+    assert [await bucket.acquire("user:1") for _ in range(3)] == [0.0, 0.0, 0.0]
@@ -0,0 +1,59 @@
+import pytest
+
+import database
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    """Реплика настроена: фабрика сессий реплики — отдельный объект, которого нет в основной базе."""
+    factory = object()
+    monkeypatch.setattr(database, "replica_session", factory)
+    monkeypatch.setattr(database, "_recent_writers", {})
+    return factory
+
+
+def test_reads_go_to_replica_without_writes(replica):
+    assert database.read_session_factory(1) is replica
+    assert database.read_session_factory() is replica
+
+
+def test_writer_reads_own_writes_from_primary(replica):
+    database.mark_user_write(1)
+
+    assert database.read_session_factory(1) is database.async_session
+    assert database.read_session_factory(2) is replica
+
+
+def test_stickiness_expires(replica, monkeypatch):
+    monkeypatch.setattr(database, "READ_YOUR_WRITES_SECONDS", 0)
+    database.mark_user_write(1)
+
+    assert database.read_session_factory(1) is replica
+    assert database._recent_writers == {}
+
+
+def test_without_replica_everything_reads_primary(monkeypatch):
+    monkeypatch.setattr(database, "replica_session", None)
+    monkeypatch.setattr(database, "_recent_writers", {})
+
+    database.mark_user_write(1)
+
+    assert database.read_session_factory(1) is database.async_session
+    assert database._recent_writers == {}
+
+
+async def test_api_write_makes_user_sticky(client, replica):
+    response = await client.post("/tasks", params={"user_id": 1}, json={"title": "Отчёт"})
+
+    assert response.status_code == 200
+    assert database.read_session_factory(1) is database.async_session
+    assert database.read_session_factory(2) is replica
+
+
+async def test_settings_write_makes_user_sticky(client, replica):
+    response = await client.put("/settings", params={"user_id": 1}, json={"reminder_time": 30})
+
+    assert response.status_code == 200
+    assert database.read_session_factory(1) is database.async_session
@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import crud
+from reminder_timer import ReminderTimer
+
+pytestmark = pytest.mark.anyio
+
+
+async def noop(task_ids):
+    pass
+
+
+async def update(session_factory, task_id, **values):
+    # Как в API: каждая запись в своей сессии
+    async with session_factory() as db:
+        return await crud.update_task(db, 1, task_id, **values)
+
+
+async def test_sync_task_schedules_and_cancels(db, session_factory):
+    timer = ReminderTimer(noop, horizon=timedelta(hours=24))
+    task = await crud.create_task(db, user_id=1, title="Скоро", reminder=True,
+                                  deadline=(datetime.now(timezone.utc) + timedelta(hours=3)).isoformat())
+    timer.sync_task("created", task)
+    assert len(timer) == 1
+
+    task = await update(session_factory, task.id, completed=True)
+    timer.sync_task("updated", task)
+    assert len(timer) == 0
+
+
+async def test_recurring_series_started_in_past_stays_scheduled(db, session_factory):
+    timer = ReminderTimer(noop, horizon=timedelta(hours=24))
+    start = datetime.now(timezone.utc) - timedelta(days=3) + timedelta(hours=3)
+    task = await crud.create_task(db, user_id=1, title="Каждый день", reminder=True, deadline=start.isoformat(),
+                                  recurrence="daily")
+    timer.sync_task("created", task)
+    assert len(timer) == 1
+
+    task = await update(session_factory, task.id, title="Зарядка")
+    timer.sync_task("updated", task)
+    assert len(timer) == 1
+
+    timer.sync_task("deleted", task)
+    assert len(timer) == 0
+
+
+async def fire_once(on_fire, **kwargs):
+    """Срабатывание задачи 7 прямо сейчас; on_fire получает таймер и id задач."""
+    fired = asyncio.Event()
+
+    async def handler(task_ids):
+        on_fire(timer, task_ids)
+        fired.set()
+
+    timer = ReminderTimer(handler, **kwargs)
+    timer.start()
+    timer.schedule(7, datetime.now(timezone.utc))
+    await asyncio.wait_for(fired.wait(), timeout=1)
+    return timer
+
+
+async def test_reschedule_during_send_is_applied_after_it():
+    next_fire = datetime.now(timezone.utc) + timedelta(hours=1)
+
+    # Захват повторяющейся задачи назначает следующее вхождение, пока идёт отправка
+    timer = await fire_once(lambda timer, task_ids: timer.schedule(task_ids[0], next_fire))
+
+    assert timer._entries == {7: next_fire}
+    await timer.stop()
+
+
+async def test_released_reminder_waits_retry_delay():
+    # Неотправленное напоминание возвращается с remind_at = now
+    timer = await fire_once(lambda timer, task_ids: timer.schedule(task_ids[0], datetime.now(timezone.utc)),
+                            retry_delay=timedelta(minutes=5))
+
+    assert timer._entries[7] > datetime.now(timezone.utc) + timedelta(minutes=4)
+    await timer.stop()
+
+
+async def test_cancel_during_send_drops_reschedule():
+    def reschedule_and_delete(timer, task_ids):
+        timer.schedule(task_ids[0], datetime.now(timezone.utc) + timedelta(hours=1))
+        timer.cancel(task_ids[0])
+
+    timer = await fire_once(reschedule_and_delete)
+
+    assert len(timer) == 0
+    await timer.stop()
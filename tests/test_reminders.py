@@ -0,0 +1,141 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+import crud
+from models import Task
+from serialization import as_utc
+
+pytestmark = pytest.mark.anyio
+
+
+def iso(moment: datetime) -> str:
+    return moment.isoformat()
+
+
+async def create_due(db, count: int, user_id: int = 1):
+    """Задачи, напоминание по которым уже наступило (за 60 минут до дедлайна через 30 минут)."""
+    deadline = datetime.now(timezone.utc) + timedelta(minutes=30)
+    return [await crud.create_task(db, user_id=user_id, title=f"Задача {i}", deadline=iso(deadline), reminder=True)
+            for i in range(count)]
+
+
+async def test_claim_returns_due_reminders_once(db):
+    tasks = await create_due(db, 3)
+    later = await crud.create_task(db, user_id=1, title="Позже", reminder=True,
+                                   deadline=iso(datetime.now(timezone.utc) + timedelta(days=1)))
+
+    claimed = await crud.claim_due_reminders(db)
+
+    assert sorted(row.id for row in claimed) == sorted(task.id for task in tasks)
+    assert later.id not in {row.id for row in claimed}
+    assert await crud.claim_due_reminders(db) == []
+    rows = (await db.execute(select(Task.reminder, Task.remind_at).where(Task.id.in_([t.id for t in tasks])))).all()
+    assert all(not reminder and remind_at is None for reminder, remind_at in rows)
+
+
+async def test_concurrent_claims_do_not_overlap(session_factory):
+    async with session_factory() as db:
+        tasks = await create_due(db, 20)
+
+    async def claim():
+        async with session_factory() as db:
+            return [row.id for row in await crud.claim_due_reminders(db, limit=5)]
+
+    claimed = []
+    while True:
+        batches = await asyncio.gather(*(claim() for _ in range(4)))
+        if not any(batches):
+            break
+        for batch in batches:
+            claimed.extend(batch)
+
+    assert sorted(claimed) == sorted(task.id for task in tasks)
+
+
+async def test_release_makes_reminder_due_again(db):
+    task, = await create_due(db, 1)
+    claimed = await crud.claim_due_reminders(db)
+
+    assert await crud.release_reminders(db, [row.id for row in claimed]) == [task.id]
+    assert [row.id for row in await crud.claim_due_reminders(db)] == [task.id]
+
+
+async def test_claim_and_release_notify_listeners(db, task_events):
+    task, = await create_due(db, 1)
+    task_events.clear()
+
+    await crud.claim_due_reminders(db)
+    assert [(event, row.id, row.reminder, row.remind_at) for event, row, _ in task_events] == \
+        [("updated", task.id, False, None)]
+
+    task_events.clear()
+    await crud.release_reminders(db, [task.id])
+    (event, row, _), = task_events
+    assert (event, row.id, row.reminder) == ("updated", task.id, True)
+    assert row.remind_at is not None
+
+
+async def test_past_deadline_is_not_claimed(db):
+    await crud.create_task(db, user_id=1, title="Просрочена", reminder=True,
+                           deadline=iso(datetime.now(timezone.utc) - timedelta(minutes=5)))
+    assert await crud.claim_due_reminders(db) == []
+
+
+async def test_recurring_claim_advances_to_next_occurrence(db, task_events):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    start = now - timedelta(days=3) + timedelta(minutes=30)
+    task = await crud.create_task(db, user_id=1, title="Каждый день", deadline=iso(start), reminder=True,
+                                  recurrence="daily")
+    assert as_utc(task.remind_at) == start + timedelta(days=3) - timedelta(hours=1)
+    task_events.clear()
+
+    claimed = await crud.claim_due_reminders(db)
+
+    assert [(row.id, as_utc(row.deadline)) for row in claimed] == [(task.id, start + timedelta(days=3))]
+    (event, row, _), = task_events
+    assert row.reminder and as_utc(row.remind_at) == start + timedelta(days=4) - timedelta(hours=1)
+    stored = (await db.execute(select(Task.remind_at).where(Task.id == task.id))).scalar_one()
+    assert as_utc(stored) == as_utc(row.remind_at)
+
+
+@pytest.fixture
+async def leader_timer(session_factory, monkeypatch):
+    """Таймер лидера reminders.timer поверх базы теста."""
+    import reminders
+
+    @asynccontextmanager
+    async def db_context():
+        async with session_factory() as session:
+            yield session
+
+    monkeypatch.setattr(reminders, "get_db_context", db_context)
+    monkeypatch.setattr(reminders, "REMINDER_REMOTE_BATCH_SECONDS", 0)
+    reminders.timer.start()
+    yield reminders.timer
+    await reminders.timer.stop()
+
+
+async def receive_remote(task, event="updated"):
+    """Сообщение брокера от другого процесса, как его рассылает events.EventHub."""
+    import reminders
+    reminders.on_remote_task_change({"user_id": task.user_id,
+                                     "data": json.dumps({"type": event, "task": {"id": task.id}})})
+    await reminders._remote_refresh
+
+
+async def test_remote_changes_reach_leader_timer(db, session_factory, leader_timer):
+    task = await crud.create_task(db, user_id=1, title="Из другого воркера", reminder=True,
+                                  deadline=iso(datetime.now(timezone.utc) + timedelta(hours=3)))
+
+    await receive_remote(task, "created")
+    assert len(leader_timer) == 1
+
+    async with session_factory() as session:
+        task = await crud.update_task(session, 1, task.id, completed=True)
+    await receive_remote(task)
+    assert len(leader_timer) == 0
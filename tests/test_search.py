@@ -0,0 +1,74 @@
+import pytest
+
+import crud
+from models import Task
+from search import search_tasks
+
+pytestmark = pytest.mark.anyio
+
+COLUMNS = (Task.id, Task.title)
+
+
+async def seed(db):
+    items = [
+        {"title": "Купить молоко", "description": "и хлеб"},
+        {"title": "Позвонить маме", "description": "про молоко"},
+        {"title": "Отчёт за квартал", "description": "таблица 42"},
+        {"title": "Спортзал", "description": None},
+    ]
+    tasks = {item["title"]: result["task"] for item, result in
+             zip(items, await crud.create_tasks_bulk(db, 42, items))}
+    await crud.create_tasks_bulk(db, 7, [{"title": "Купить молоко", "description": None}])
+    return tasks
+
+
+async def titles(db, q, user_id=42, **kwargs):
+    rows, _ = await search_tasks(db, user_id=user_id, q=q, columns=COLUMNS, **kwargs)
+    return [title for _, title in rows]
+
+
+async def test_title_match_ranks_first(db):
+    await seed(db)
+    assert await titles(db, "молоко") == ["Купить молоко", "Позвонить маме"]
+
+
+async def test_all_words_and_prefix(db):
+    await seed(db)
+    assert await titles(db, "молоко хле") == ["Купить молоко"]
+    assert await titles(db, "спорт") == ["Спортзал"]
+    assert await titles(db, "") == []
+
+
+async def test_query_equal_to_user_id_matches_only_text(db):
+    await seed(db)
+    assert await titles(db, "42") == ["Отчёт за квартал"]
+    assert await titles(db, "7", user_id=7) == []
+
+
+async def test_results_are_scoped_to_user(db):
+    await seed(db)
+    assert await titles(db, "купить", user_id=7) == ["Купить молоко"]
+    assert await titles(db, "квартал", user_id=7) == []
+
+
+async def test_index_follows_updates_and_deletes(db):
+    tasks = await seed(db)
+    await crud.update_task(db, 42, tasks["Спортзал"].id, title="Бассейн")
+    await crud.delete_task(db, 42, tasks["Купить молоко"].id)
+
+    assert await titles(db, "спортзал") == []
+    assert await titles(db, "бассейн") == ["Бассейн"]
+    assert await titles(db, "молоко") == ["Позвонить маме"]
+
+
+async def test_pagination(db):
+    await crud.create_tasks_bulk(db, 42, [{"title": f"Задача номер {i}"} for i in range(7)])
+    seen, cursor = [], None
+    while True:
+        rows, cursor = await search_tasks(db, user_id=42, q="задача", limit=3, cursor=cursor, columns=COLUMNS)
+        seen.extend(task_id for task_id, _ in rows)
+        if cursor is None:
+            break
+    assert len(seen) == len(set(seen)) == 7
+    with pytest.raises(ValueError):
+        await search_tasks(db, user_id=42, q="задача", cursor="плохой")
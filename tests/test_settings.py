@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+import crud
+from models import Task
+from serialization import as_utc
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_zero_reminder_time_is_rejected(db):
+    with pytest.raises(ValueError):
+        await crud.update_user_settings(db, user_id=1, reminder_time=0)
+
+
+async def test_minimal_reminder_time_is_claimed(db):
+    await crud.update_user_settings(db, user_id=1, reminder_time=crud.MIN_REMINDER_TIME)
+    task = await crud.create_task(db, user_id=1, title="Скоро", reminder=True,
+                                  deadline=(datetime.now(timezone.utc) + timedelta(seconds=30)).isoformat())
+
+    assert [row.id for row in await crud.claim_due_reminders(db)] == [task.id]
+
+
+async def test_settings_change_recomputes_remind_at(db):
+    deadline = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(days=1)
+    task = await crud.create_task(db, user_id=1, title="Завтра", reminder=True, deadline=deadline.isoformat())
+
+    await crud.update_user_settings(db, user_id=1, reminder_time=15)
+
+    stored = (await db.execute(select(Task.remind_at).where(Task.id == task.id))).scalar_one()
+    assert as_utc(stored) == deadline - timedelta(minutes=15)
+
+
+async def test_settings_change_notifies_recomputed_tasks(db, task_events):
+    deadline = datetime.now(timezone.utc) + timedelta(days=1)
+    task = await crud.create_task(db, user_id=1, title="Завтра", reminder=True, deadline=deadline.isoformat())
+    await crud.create_task(db, user_id=1, title="Без напоминания", deadline=deadline.isoformat())
+    task_events.clear()
+
+    await crud.update_user_settings(db, user_id=1, reminder_time=15)
+    await crud.update_user_settings(db, user_id=1, reminder_enabled=True)
+
+    (event, row, _), = task_events
+    assert (event, row.id) == ("updated", task.id)
+    assert as_utc(row.remind_at) == as_utc(task.deadline) - timedelta(minutes=15)
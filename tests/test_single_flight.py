@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from singleflight import SingleFlight, SingleFlightMiddleware, request_key
+
+pytestmark = pytest.mark.anyio
+
+
+class SlowApp:
+    """ASGI-приложение, которое отвечает только после release и считает выполненные запросы."""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        await self.release.wait()
+        body = json.dumps({"call": self.calls}).encode()
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+
+
+async def gather_requests(app, paths):
+    middleware = SingleFlightMiddleware(app, SingleFlight(), paths=("/tasks",))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=middleware), base_url="http://test") as client:
+        requests = [asyncio.ensure_future(client.get(path)) for path in paths]
+        await asyncio.sleep(0.05)
+        app.release.set()
+        return await asyncio.gather(*requests)
+
+
+async def test_identical_requests_run_once():
+    app = SlowApp()
+
+    responses = await gather_requests(app, ["/tasks?user_id=1&limit=5", "/tasks?limit=5&user_id=1",
+                                            "/tasks?user_id=1&limit=5"])
+
+    assert app.calls == 1
+    assert [response.json() for response in responses] == [{"call": 1}] * 3
+
+
+async def test_different_requests_and_paths_run_separately():
+    app = SlowApp()
+
+    await gather_requests(app, ["/tasks?user_id=1", "/tasks?user_id=2", "/tasks/search?user_id=1",
+                                "/tasks/search?user_id=1"])
+
+    assert app.calls == 4
+
+
+async def test_write_forgets_users_calls():
+    flights = SingleFlight()
+    release = asyncio.Event()
+    calls = []
+
+    async def read():
+        calls.append(len(calls))
+        await release.wait()
+        return len(calls)
+
+    before = asyncio.ensure_future(flights.do("/tasks?user_id=1", 1, read))
+    await asyncio.sleep(0)
+    # Запись пользователя: запрос после неё не должен получить ответ, прочитанный до неё
+    await flights.on_task_change("updated", type("Task", (), {"user_id": 1})())
+    after = asyncio.ensure_future(flights.do("/tasks?user_id=1", 1, read))
+    await asyncio.sleep(0)
+    release.set()
+
+    assert (await before, await after) == (2, 2)
+    assert len(calls) == 2
+    assert len(flights) == 0
+
+
+async def test_error_reaches_every_waiter():
+    flights = SingleFlight()
+    release = asyncio.Event()
+
+    async def fail():
+        await release.wait()
+        raise RuntimeError("база недоступна")
+
+    waiters = [asyncio.ensure_future(flights.do("k", None, fail)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(flights) == 0
+
+
+def test_request_key_ignores_parameter_order():
+    first = {"path": "/tasks", "query_string": b"user_id=1&date=2026-05-01"}
+    second = {"path": "/tasks", "query_string": b"date=2026-05-01&user_id=1"}
+
+    assert request_key(first) == request_key(second)
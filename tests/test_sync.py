@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import crud
+
+pytestmark = pytest.mark.anyio
+
+
+def later(**kwargs) -> datetime:
+    # Время сервера после записей теста и за окном SYNC_CLOCK_SKEW
+    return datetime.now(timezone.utc) + timedelta(minutes=1, **kwargs)
+
+
+async def seed(db, user_id: int = 1):
+    """Пять задач и курсор после них; затем две задачи удалены. У другого пользователя — своя задача."""
+    results = await crud.create_tasks_bulk(db, user_id, [{"title": f"Задача {i}"} for i in range(5)])
+    ids = [result["task"].id for result in results]
+    cursor = (await crud.get_task_changes(db, user_id=user_id))["cursor"]
+    await crud.delete_tasks_bulk(db, user_id, ids[1:3])
+    await crud.create_tasks_bulk(db, user_id + 1, [{"title": "Чужая"}])
+    return ids, cursor
+
+
+async def test_full_sync_skips_tombstones(db):
+    ids, _ = await seed(db)
+
+    changes = await crud.get_task_changes(db, user_id=1, now=later())
+
+    assert changes["reset"] is True
+    assert [task.id for task in changes["tasks"]] == [ids[0], ids[3], ids[4]]
+    assert changes["deleted"] == []
+
+
+async def test_pages_cover_tasks_and_tombstones(db):
+    ids, since = await seed(db)
+    now = later()
+
+    pages = []
+    while True:
+        changes = await crud.get_task_changes(db, user_id=1, since=since, limit=2, now=now)
+        pages.append(changes)
+        since = changes["cursor"]
+        if not changes["has_more"]:
+            break
+
+    # Задачи моложе SYNC_CLOCK_SKEW отдаются повторно вместе с удалениями
+    assert [len(page["tasks"]) + len(page["deleted"]) for page in pages] == [2, 2, 1]
+    assert not any(page["reset"] for page in pages)
+    assert sorted(task.id for page in pages for task in page["tasks"]) == [ids[0], ids[3], ids[4]]
+    assert sorted(item["id"] for page in pages for item in page["deleted"]) == ids[1:3]
+
+    again = await crud.get_task_changes(db, user_id=1, since=since, now=now)
+    assert (again["tasks"], again["deleted"], again["reset"]) == ([], [], False)
+
+
+async def test_incremental_sync_returns_new_deletions(db):
+    ids, _ = await seed(db)
+    first = await crud.get_task_changes(db, user_id=1)
+
+    await crud.delete_task(db, user_id=1, task_id=ids[0])
+    changes = await crud.get_task_changes(db, user_id=1, since=first["cursor"], now=later())
+
+    assert ids[0] in [item["id"] for item in changes["deleted"]]
+    assert ids[0] not in [task.id for task in changes["tasks"]]
+    assert changes["reset"] is False
+
+
+async def test_cursor_without_deletions_stays_fresh(db):
+    await crud.create_tasks_bulk(db, 1, [{"title": "Задача"}])
+    cursor = (await crud.get_task_changes(db, user_id=1, now=later()))["cursor"]
+
+    # Клиент синхронизируется каждые 20 дней, а задачи всё это время не удалялись
+    for days in (20, 40, 60):
+        changes = await crud.get_task_changes(db, user_id=1, since=cursor, now=later(days=days))
+        assert changes["reset"] is False
+        cursor = changes["cursor"]
+
+
+async def test_stale_cursor_resets(db):
+    await seed(db)
+    old = datetime.now(timezone.utc) - crud.TOMBSTONE_RETENTION - timedelta(days=1)
+
+    changes = await crud.get_task_changes(db, user_id=1, since=crud.encode_sync_cursor((old, 1), (old, 1)),
+                                          now=later())
+
+    assert changes["reset"] is True
+    assert len(changes["tasks"]) == 3
+    assert changes["deleted"] == []
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+import crud
+from task_io import export_chunks, import_tasks, iter_csv, iter_ndjson
+
+pytestmark = pytest.mark.anyio
+
+SAMPLE = [
+    {"title": 'Отчёт, квартал "Q2"', "description": "строка 1\nстрока 2", "deadline": "2026-05-01T09:00:00Z",
+     "priority": "High", "reminder": True},
+    {"title": "Зарядка", "deadline": "2026-05-02T07:00:00Z", "recurrence": "weekly", "recurrence_interval": 2,
+     "recurrence_until": "2026-08-01T00:00:00Z"},
+    {"title": "Без дедлайна", "priority": "Low", "completed": True},
+]
+
+
+async def export(db, user_id: int, format: str = "ndjson") -> bytes:
+    return b"".join([chunk async for chunk in export_chunks(db, user_id, format)])
+
+
+async def pieces(data: bytes, size: int = 7):
+    # Границы кусков тела не совпадают с границами строк и символов UTF-8
+    for offset in range(0, len(data), size):
+        yield data[offset:offset + size]
+
+
+def without_ids(ndjson: bytes) -> list:
+    records = [json.loads(line) for line in ndjson.splitlines()]
+    for record in records:
+        del record["id"], record["created_at"]
+    return sorted(records, key=lambda record: record["title"])
+
+
+@pytest.mark.parametrize("format, parse", [("ndjson", iter_ndjson), ("csv", iter_csv)])
+async def test_export_import_round_trip(db, format, parse):
+    await crud.create_tasks_bulk(db, 1, SAMPLE)
+
+    report = await import_tasks(db, user_id=2, records=parse(pieces(await export(db, 1, format))), batch_size=2)
+
+    assert report == {"created": 3, "error_count": 0, "errors": []}
+    assert without_ids(await export(db, 2)) == without_ids(await export(db, 1))
+
+
+async def test_import_reports_bad_lines(client, db):
+    body = "\n".join([
+        json.dumps({"title": "Отчёт"}),
+        "{не json",
+        json.dumps({"title": "Звонок", "priority": "Срочно"}),
+        json.dumps({"title": "Встреча", "deadline": "вчера"}),
+        json.dumps({"title": "Зарядка"}),
+    ]).encode()
+
+    response = await client.post("/tasks/import", params={"user_id": 1}, content=body,
+                                 headers={"Content-Type": "application/x-ndjson"})
+
+    assert response.status_code == 200
+    assert response.json()["created"] == 2
+    assert [error["line"] for error in response.json()["errors"]] == [2, 3, 4]
+    tasks, _ = await crud.get_tasks_page(db, user_id=1)
+    assert sorted(task.title for task in tasks) == ["Зарядка", "Отчёт"]
+
+
+async def test_csv_import_with_header_only_creates_nothing(client):
+    response = await client.post("/tasks/import", params={"user_id": 1}, content="title,deadline\r\n".encode(),
+                                 headers={"Content-Type": "text/csv"})
+
+    assert response.status_code == 200
+    assert response.json() == {"created": 0, "error_count": 0, "errors": []}
@@ -0,0 +1,58 @@
+import pytest
+
+import crud
+from write_behind import WriteBehindQueue
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def durable(session_factory, monkeypatch):
+    """PATCH /tasks/{id} через очередь WRITE_BEHIND_MODE=durable поверх базы теста."""
+    import main
+
+    async def flush(user_id, items):
+        async with session_factory() as db:
+            return await crud.update_tasks_bulk(db, user_id=user_id, items=items)
+
+    queue = WriteBehindQueue(flush, interval=0.01)
+    monkeypatch.setattr(main, "write_behind", queue)
+    monkeypatch.setattr(main, "WRITE_BEHIND_MODE", "durable")
+    queue.start()
+    yield queue
+    await queue.stop()
+
+
+async def test_patch_missing_task_is_404(client):
+    response = await client.patch("/tasks/999", params={"user_id": 1}, json={"title": "Нет такой"})
+
+    assert response.status_code == 404
+
+
+async def test_patch_foreign_task_is_404(client, db):
+    task = await crud.create_task(db, user_id=1, title="Чужая")
+
+    response = await client.patch(f"/tasks/{task.id}", params={"user_id": 2}, json={"title": "Моя"})
+
+    assert response.status_code == 404
+
+
+async def test_durable_patch_missing_task_is_404(client, durable):
+    response = await client.patch("/tasks/999", params={"user_id": 1}, json={"title": "Нет такой"})
+
+    assert response.status_code == 404
+
+
+async def test_durable_patch_returns_written_task(client, db, durable):
+    task = await crud.create_task(db, user_id=1, title="Черновик")
+
+    response = await client.patch(f"/tasks/{task.id}", params={"user_id": 1}, json={"title": "Отчёт"})
+
+    assert response.status_code == 200
+    assert response.json()["title"] == "Отчёт"
+
+
+async def test_delete_missing_task_is_404(client):
+    response = await client.delete("/tasks/999", params={"user_id": 1})
+
+    assert response.status_code == 404
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# off — каждый PATCH /tasks/{id} коммитится сразу;
+# durable — PATCH ставится в очередь, ответ отправляется после коммита пачки;
+# buffered — ответ 202 сразу после постановки в очередь, до коммита
+WRITE_BEHIND_MODE = os.environ.get("WRITE_BEHIND_MODE", "off").lower()
+if WRITE_BEHIND_MODE not in ("off", "durable", "buffered"):
+    raise ValueError(f"Неизвестный WRITE_BEHIND_MODE: {WRITE_BEHIND_MODE}")
+# Как часто сбрасывается очередь и при каком числе задач в ней сброс начинается раньше
+WRITE_BEHIND_INTERVAL = float(os.environ.get("WRITE_BEHIND_INTERVAL_MS", "200")) / 1000
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get("WRITE_BEHIND_MAX_PENDING", "500"))
+# Сколько пользователей записывается одновременно (каждому нужно своё соединение)
+WRITE_BEHIND_CONCURRENCY = int(os.environ.get("WRITE_BEHIND_CONCURRENCY", "4"))
+
+submitted = metrics.registry.counter("write_behind_submitted_total", "Изменения задач, поставленные в очередь")
+coalesced = metrics.registry.counter("write_behind_coalesced_total",
+                                     "Изменения, слитые с уже ожидающим изменением той же задачи")
+flushed = metrics.registry.counter("write_behind_flushed_tasks_total", "Задачи, записанные сбросом очереди")
+flush_errors = metrics.registry.counter("write_behind_flush_errors_total", "Ошибки сброса очереди по пользователю")
+
+class _Pending:
+    __slots__ = ("values", "waiters")
+
+    def __init__(self):
+        self.values: dict = {}
+        self.waiters: List[asyncio.Future] = []
+
+class WriteBehindQueue:
+    """
+    Очередь изменений задач с объединением по id и пакетной записью.
+
+    Изменения одной задачи, пришедшие до сброса, сливаются в одно (более
+    позднее значение поля побеждает). Раз в interval секунд или при
+    max_pending задачах в очереди изменения каждого пользователя
+    записываются одним вызовом flush_user — в приложении это
+    crud.update_tasks_bulk: UPDATE по группам одинаковых значений и один
+    коммит на пользователя вместо коммита на каждый PATCH.
+
+    Подтверждение: Future из submit завершается после коммита пачки
+    (задачей или None, если её нет) либо исключением записи. Пока
+    изменение в очереди, оно существует только в памяти процесса: при
+    аварийном завершении оно теряется, чтение из базы его ещё не видит,
+    а запись того же поля другим путём (пакетный PATCH, другой воркер)
+    может быть перезаписана при сбросе. stop() сбрасывает очередь при
+    штатной остановке.
+
+    Args:
+        flush_user: async (user_id, items) -> результаты crud.update_tasks_bulk
+        interval (float): Период сброса в секундах
+        max_pending (int): Число задач в очереди, при котором сброс начинается сразу
+        concurrency (int): Сколько пользователей записывается параллельно
+    """
+
+    def __init__(self, flush_user: Callable[[int, List[dict]], Awaitable[List[dict]]],
+                 interval: float = WRITE_BEHIND_INTERVAL, max_pending: int = WRITE_BEHIND_MAX_PENDING,
+                 concurrency: int = WRITE_BEHIND_CONCURRENCY):
+        self.flush_user = flush_user
+        self.interval = interval
+        self.max_pending = max_pending
+        self.concurrency = concurrency
+        self._pending: Dict[Tuple[int, int], _Pending] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    @property
+    def running(self) -> bool:
+        return self._runner is not None
+
+    def start(self):
+        if self._runner is None:
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._runner = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновый сброс и записывает всё, что осталось в очереди."""
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        await self.flush()
+
+    def submit(self, user_id: int, task_id: int, values: dict, wait: bool = True) -> Optional[asyncio.Future]:
+        """
+        Ставит изменение задачи в очередь.
+
+        Args:
+            wait (bool): Нужно ли подтверждение записи (для режима buffered — нет)
+
+        Returns:
+            asyncio.Future: Завершается после записи (задача или None); None при wait=False
+        """
+        key = (user_id, task_id)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _Pending()
+        else:
+            coalesced.inc()
+        pending.values.update(values)
+        future = None
+        if wait:
+            future = asyncio.get_running_loop().create_future()
+            pending.waiters.append(future)
+        submitted.inc()
+        if len(self._pending) >= self.max_pending and self._wakeup is not None:
+            self._wakeup.set()
+        return future
+
+    async def flush(self) -> int:
+        """Записывает все ожидающие изменения; возвращает число записанных задач."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            by_user: Dict[int, List[Tuple[int, _Pending]]] = {}
+            for (user_id, task_id), pending in batch.items():
+                by_user.setdefault(user_id, []).append((task_id, pending))
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def flush_one(user_id, entries):
+                async with semaphore:
+                    return await self._flush_user(user_id, entries)
+
+            written = sum(await asyncio.gather(*(flush_one(user_id, entries) for user_id, entries in by_user.items())))
+            flushed.inc(written)
+            return written
+
+    async def _flush_user(self, user_id: int, entries: List[Tuple[int, _Pending]]) -> int:
+        items = [{**pending.values, "id": task_id} for task_id, pending in entries]
+        try:
+            results = await self.flush_user(user_id, items)
+        except Exception as e:
+            flush_errors.inc()
+            logger.error(f"Ошибка сброса очереди изменений для user_id={user_id}: {str(e)}")
+            for _, pending in entries:
+                for future in pending.waiters:
+                    if not future.done():
+                        future.set_exception(e)
+            return 0
+        written = 0
+        for (task_id, pending), result in zip(entries, results):
+            task = result.get("task") if result["status"] == "updated" else None
+            if task is None:
+                logger.warning(f"Изменение задачи {task_id} из очереди не записано: {result.get('error')}")
+            else:
+                written += 1
+            for future in pending.waiters:
+                if not future.done():
+                    future.set_result(task)
+        return written
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка фонового сброса очереди изменений: {str(e)}")